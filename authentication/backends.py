@@ -18,9 +18,33 @@ except ImportError as e:
     # إذا فشل تهيئة Firebase، فهذا خطأ فادح ويجب إيقاف الخادم.
     raise RuntimeError("Firebase Admin SDK initialization failed. Cannot start application.")
 
+from .token_cache import token_cache
+
 # الحصول على نموذج المستخدم المخصص الذي تم تحديده في settings.AUTH_USER_MODEL
 User = get_user_model()
 
+DEFAULT_ROLE_NAME = 'customer'
+_default_role_id = None
+
+
+def default_role_id():
+    """
+    Id of the role given to users created from a Firebase sign-in.
+    Resolved (and created if missing) on first use, then kept for the life of the process.
+    """
+    global _default_role_id
+    if _default_role_id is None:
+        from users.models import Role # استيراد نموذج Role
+        role, created = Role.objects.get_or_create(
+            role_name=DEFAULT_ROLE_NAME,
+            defaults={'description': f'Default role for new {DEFAULT_ROLE_NAME}s'}
+        )
+        if created:
+            logger.info(f"Default role '{DEFAULT_ROLE_NAME}' created in database.")
+        _default_role_id = role.pk
+    return _default_role_id
+
+
 class FirebaseAuthentication(BaseAuthentication):
     """
     فئة مصادقة مخصصة لـ Django REST Framework للتحقق من Firebase ID Tokens.
@@ -50,39 +74,32 @@ class FirebaseAuthentication(BaseAuthentication):
         except ValueError:
             raise AuthenticationFailed('Token format is invalid. Should be "Bearer <token>".')
 
-        # التحقق من صلاحية Firebase ID Token باستخدام Firebase Admin SDK
-        try:
-            decoded_token = auth.verify_id_token(id_token)
-        except firebase_exceptions.AuthError as e:
-            # خطأ في التحقق من التوكن (مثال: منتهي الصلاحية، غير صالح)
-            logger.warning(f"Firebase token verification failed for token starting with '{id_token[:10]}...': {e}")
-            raise AuthenticationFailed(f'Invalid Firebase ID token: {e.args[0]}')
-        except Exception as e:
-            # أي خطأ غير متوقع آخر أثناء التحقق
-            logger.error(f"An unexpected error occurred during Firebase token verification: {e}", exc_info=True)
-            raise AuthenticationFailed('An unexpected error occurred during authentication.')
+        # توكن تم التحقق منه سابقاً ولم تنتهِ صلاحيته: لا حاجة لإعادة التحقق من التوقيع
+        entry = token_cache.get(id_token)
+        if entry is None:
+            # التحقق من صلاحية Firebase ID Token باستخدام Firebase Admin SDK
+            try:
+                decoded_token = auth.verify_id_token(id_token)
+            except firebase_exceptions.AuthError as e:
+                # خطأ في التحقق من التوكن (مثال: منتهي الصلاحية، غير صالح)
+                logger.warning(f"Firebase token verification failed for token starting with '{id_token[:10]}...': {e}")
+                raise AuthenticationFailed(f'Invalid Firebase ID token: {e.args[0]}')
+            except Exception as e:
+                # أي خطأ غير متوقع آخر أثناء التحقق
+                logger.error(f"An unexpected error occurred during Firebase token verification: {e}", exc_info=True)
+                raise AuthenticationFailed('An unexpected error occurred during authentication.')
+            entry = token_cache.put(id_token, decoded_token)
+        else:
+            decoded_token = entry.claims
+
+        user = token_cache.cached_user(entry)
+        if user is not None:
+            return (user, id_token)
 
         firebase_uid = decoded_token['uid']
         email = decoded_token.get('email')
         username = decoded_token.get('name', decoded_token.get('email', firebase_uid)) # يفضل الاسم المعروض من Firebase
         
-        # يجب أن يكون حقل الدور موجودًا في نموذج Role لدينا
-        # نفترض أن الدور الافتراضي للمستخدمين الجدد من Firebase هو 'customer'
-        # يجب عليك التأكد من وجود هذا الدور في قاعدة بياناتك.
-        from users.models import Role # استيراد نموذج Role
-        default_role_name = 'customer'
-        try:
-            # استخدم get_or_create لضمان وجود الدور
-            default_role, created = Role.objects.get_or_create(
-                role_name=default_role_name,
-                defaults={'description': f'Default role for new {default_role_name}s'}
-            )
-            if created:
-                logger.info(f"Default role '{default_role_name}' created in database.")
-        except Exception as e:
-            logger.error(f"Failed to get or create default role '{default_role_name}': {e}", exc_info=True)
-            raise AuthenticationFailed(f"Server configuration error: Could not find/create default role '{default_role_name}'.")
-
         # البحث عن المستخدم أو إنشاؤه في قاعدة بيانات Django
         try:
             # استخدام المعاملات لضمان Atomicité في عملية البحث/الإنشاء
@@ -106,12 +123,18 @@ class FirebaseAuthentication(BaseAuthentication):
                             logger.debug(f"Django user with email {email} not found. Creating new user.")
                             # 3. إذا لم يتم العثور عليه بالبريد الإلكتروني، قم بإنشاء مستخدم جديد
                             # هنا نقوم بإنشاء UserAccount فقط، وسيتولى منطق Register/Profile إنشاء Customer/Employee
+                            # نفترض أن الدور الافتراضي للمستخدمين الجدد من Firebase هو 'customer'
+                            try:
+                                role_id = default_role_id()
+                            except Exception as e:
+                                logger.error(f"Failed to get or create default role '{DEFAULT_ROLE_NAME}': {e}", exc_info=True)
+                                raise AuthenticationFailed(f"Server configuration error: Could not find/create default role '{DEFAULT_ROLE_NAME}'.")
                             user = User.objects.create_user(
                                 email=email,
                                 username=username,
                                 firebase_uid=firebase_uid,
                                 password=User.objects.make_random_password(), # لا حاجة لكلمة مرور فعلية
-                                role=default_role, # تعيين الدور الافتراضي
+                                role_id=role_id, # تعيين الدور الافتراضي
                                 is_active=True,
                             )
                             logger.info(f"Created new Django user account {email} for Firebase UID {firebase_uid}.")
@@ -122,6 +145,7 @@ class FirebaseAuthentication(BaseAuthentication):
                 # user.last_login_date = timezone.now()
                 # user.save(update_fields=['last_login_date'])
 
+                token_cache.set_user(id_token, entry, user)
                 return (user, id_token) # إرجاع كائن المستخدم والتوكن
         
         except AuthenticationFailed:
@@ -0,0 +1,57 @@
+# authentication/management/commands/benchmark_permissions.py
+import time
+import uuid
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.principal import Principal
+from mysite.permissions import ACCESS_POLICY, ANONYMOUS, CustomPermission
+from users.constants import UserType
+
+METHODS = ('GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+
+def _request(role, method, is_superuser=False):
+    """A request carrying an already resolved principal, so no database is touched."""
+    if role == ANONYMOUS:
+        return SimpleNamespace(user=SimpleNamespace(is_authenticated=False), method=method)
+    user = SimpleNamespace(is_authenticated=True, is_superuser=is_superuser, pk=uuid.uuid4())
+    principal = Principal(user.pk, role, is_superuser=is_superuser)
+    return SimpleNamespace(user=user, method=method, _principal=principal)
+
+
+class Command(BaseCommand):
+    help = (
+        "Times CustomPermission.has_permission over every role, basename and HTTP method of "
+        "ACCESS_POLICY. Runs in memory, no database needed; the decisions themselves are "
+        "checked by authentication.tests.AccessPolicyTests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=200, help="Passes over all combinations for the timing.")
+
+    def handle(self, *args, **options):
+        if options['rounds'] < 1:
+            raise CommandError("--rounds must be a positive integer.")
+        basenames = sorted({
+            basename for grants in ACCESS_POLICY.values() for names in grants.values() for basename in names
+        } | {'unknown'})
+        # (role, is_superuser): كل الأدوار، مستخدم بلا دور، المستخدم غير المصادق، والـ superuser
+        subjects = [(role, False) for role in UserType] + [(None, False), (ANONYMOUS, False), (None, True)]
+
+        permission = CustomPermission()
+        cases = [
+            (_request(role, method, is_superuser), SimpleNamespace(basename=basename))
+            for role, is_superuser in subjects for basename in basenames for method in METHODS
+        ]
+
+        started = time.perf_counter()
+        for _ in range(options['rounds']):
+            for request, view in cases:
+                permission.has_permission(request, view)
+        elapsed = time.perf_counter() - started
+
+        checks = len(cases) * options['rounds']
+        self.stdout.write(f"{len(subjects)} subjects x {len(basenames)} basenames x {len(METHODS)} methods = {len(cases)} combinations")
+        self.stdout.write(f"has_permission:    {elapsed / checks * 1e9:.0f} ns per check ({checks} checks)")
@@ -0,0 +1,195 @@
+# authentication/principal.py
+"""
+The authenticated principal: role and tenant scope of request.user, resolved once.
+
+Role checks and scope lookups otherwise read request.user.role and
+request.user.employee_profile.branch..., each a lazy query depending on how the
+user was loaded. get_principal(request) loads the account once with its role and
+employee and customer profiles, derives the store/branch/department ids the user may act on,
+keeps the result in the shared cache for PRINCIPAL_CACHE_SECONDS and memoizes it
+on the request. UserAccount, Employee, Role, Store and Branch changes invalidate it.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from users.constants import UserType
+
+VERSION_KEY = 'authentication:principal:version'
+
+# كامل الصلاحيات على كل المتاجر
+UNRESTRICTED_ROLES = frozenset({UserType.APP_OWNER, UserType.PROJECT_MANAGER})
+# فريق التطبيق: يرى كل المتاجر والفروع
+PLATFORM_ROLES = UNRESTRICTED_ROLES | {UserType.APP_STAFF}
+STORE_ROLES = frozenset({UserType.STORE_ACCOUNT, UserType.STORE_MANAGER})
+BRANCH_ROLES = frozenset({
+    UserType.BRANCH_MANAGER, UserType.GENERAL_STAFF, UserType.CASHIER,
+    UserType.SHELF_ORGANIZER, UserType.CUSTOMER_SERVICE,
+})
+_ROLES_BY_NAME = {role.value: role for role in UserType}
+
+
+class Principal:
+    """
+    Plain data about one user: no model instances, so it can be cached and shared.
+    """
+    __slots__ = (
+        'user_id', 'role', 'is_superuser', 'is_staff_role', 'customer_id', 'store_ids', 'branch_ids', 'department_ids',
+    )
+
+    def __init__(self, user_id, role, is_superuser=False, is_staff_role=False, customer_id=None,
+                 store_ids=(), branch_ids=(), department_ids=()):
+        self.user_id = user_id
+        self.customer_id = customer_id
+        self.role = role
+        self.is_superuser = is_superuser
+        self.is_staff_role = is_staff_role
+        self.store_ids = frozenset(store_ids)
+        self.branch_ids = frozenset(branch_ids)
+        self.department_ids = frozenset(department_ids)
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return f"<Principal {self.user_id} {self.role_name}>"
+
+    @property
+    def role_name(self):
+        return self.role.value if self.role else None
+
+    def has_role(self, *roles):
+        return self.role in roles
+
+    @property
+    def is_unrestricted(self):
+        """Superuser, app owner or project manager: every action on every tenant."""
+        return self.is_superuser or self.role in UNRESTRICTED_ROLES
+
+    @property
+    def is_platform_user(self):
+        """Unrestricted users and app staff: every store and branch is in scope."""
+        return self.is_superuser or self.role in PLATFORM_ROLES
+
+    @property
+    def store_id(self):
+        """The user's store when there is exactly one (employees, store accounts)."""
+        return next(iter(self.store_ids)) if len(self.store_ids) == 1 else None
+
+    @property
+    def branch_id(self):
+        """The user's branch for branch-level roles."""
+        return next(iter(self.branch_ids)) if self.role in BRANCH_ROLES and len(self.branch_ids) == 1 else None
+
+    def can_access_store(self, store_id):
+        return self.is_platform_user or store_id in self.store_ids
+
+    def can_access_branch(self, branch_id):
+        return self.is_platform_user or branch_id in self.branch_ids
+
+
+def build_principal(user_id):
+    """
+    Loads the account with its role, employee/customer profile and store account in one query
+    (plus one for the branches of a store-level user).
+    """
+    from stores.models import Branch
+    from users.models import UserAccount
+
+    user = UserAccount.objects.select_related(
+        'role', 'employee_profile__branch__store', 'employee_profile__department', 'store_account', 'customer_profile',
+    ).get(pk=user_id)
+    role = _ROLES_BY_NAME.get(user.role.role_name) if user.role else None
+    store_ids, branch_ids, department_ids = set(), set(), set()
+
+    # العلاقات العكسية غير الموجودة ترفع RelatedObjectDoesNotExist (وهي AttributeError)
+    employee = getattr(user, 'employee_profile', None)
+    if employee is not None:
+        store_ids.add(employee.store_id)
+        if employee.branch is not None:
+            store_ids.add(employee.branch.store_id)
+            branch_ids.add(employee.branch_id)
+        department_ids.add(employee.department_id)
+    store_account = getattr(user, 'store_account', None)
+    if store_account is not None:
+        store_ids.add(store_account.pk)
+    customer = getattr(user, 'customer_profile', None)
+    store_ids.discard(None)
+    department_ids.discard(None)
+
+    if role in STORE_ROLES and store_ids:
+        # مدير المتجر وحساب المتجر يعملان على كل فروع المتجر
+        branch_ids.update(Branch.objects.filter(store_id__in=store_ids).values_list('pk', flat=True))
+
+    return Principal(
+        user_id=user.pk,
+        role=role,
+        is_superuser=user.is_superuser,
+        is_staff_role=bool(user.role and user.role.is_staff_role),
+        customer_id=customer.pk if customer is not None else None,
+        store_ids=store_ids,
+        branch_ids=branch_ids,
+        department_ids=department_ids,
+    )
+
+
+def _fresh_version():
+    # If the shared key was evicted, restart from a value no process can still hold
+    return int(time.time() * 1000)
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _fresh_version(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _cache_key(user_id, version):
+    return f"authentication:principal:{version}:{user_id}"
+
+
+def principal_for_user(user):
+    key = _cache_key(user.pk, _version())
+    principal = cache.get(key)
+    if principal is None:
+        principal = build_principal(user.pk)
+        cache.set(key, principal, timeout=getattr(settings, 'PRINCIPAL_CACHE_SECONDS', 60))
+    return principal
+
+
+def get_principal(request):
+    """
+    Principal of request.user, built at most once per request; None for anonymous users.
+    """
+    user = request.user
+    if not user or not user.is_authenticated:
+        return None
+    principal = getattr(request, '_principal', None)
+    if principal is None or principal.user_id != user.pk:
+        principal = principal_for_user(user)
+        request._principal = principal
+    return principal
+
+
+def invalidate_principal(user_id):
+    """Drops one user's cached principal once the current transaction commits."""
+    transaction.on_commit(lambda: cache.delete(_cache_key(user_id, _version())))
+
+
+def invalidate_all_principals():
+    """Role, store or branch changes can affect any user: every cached principal is dropped."""
+    def bump():
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, _fresh_version(), timeout=None)
+
+    transaction.on_commit(bump)
@@ -0,0 +1,75 @@
+import uuid
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from mysite.permissions import ACCESS_POLICY, ANONYMOUS, READ_ONLY, READ_WRITE, CustomPermission
+from users.constants import UserType
+
+from .principal import Principal, UNRESTRICTED_ROLES
+
+METHODS = ('GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE')
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _request(role, method, is_superuser=False):
+    """A request carrying an already resolved principal, so no database is touched."""
+    if role == ANONYMOUS:
+        return SimpleNamespace(user=SimpleNamespace(is_authenticated=False), method=method)
+    user = SimpleNamespace(is_authenticated=True, is_superuser=is_superuser, pk=uuid.uuid4())
+    return SimpleNamespace(user=user, method=method, _principal=Principal(user.pk, role, is_superuser=is_superuser))
+
+
+def _expected(role, basename, method, is_superuser=False):
+    """The decision read directly from ACCESS_POLICY, independently of the compiled set."""
+    if is_superuser or role in UNRESTRICTED_ROLES:
+        return True
+    grants = ACCESS_POLICY.get(role.value if isinstance(role, UserType) else role, {})
+    if basename in grants.get(READ_WRITE, ()):
+        return True
+    return basename in grants.get(READ_ONLY, ()) and method in SAFE_METHODS
+
+
+class AccessPolicyTests(SimpleTestCase):
+    permission = CustomPermission()
+
+    def has_permission(self, role, basename, method, is_superuser=False):
+        return self.permission.has_permission(_request(role, method, is_superuser), SimpleNamespace(basename=basename))
+
+    def test_every_role_basename_and_method_follows_the_policy(self):
+        basenames = sorted({
+            basename for grants in ACCESS_POLICY.values() for names in grants.values() for basename in names
+        } | {'unknown'})
+        # كل الأدوار، مستخدم بلا دور، المستخدم غير المصادق، والـ superuser
+        subjects = [(role, False) for role in UserType] + [(None, False), (ANONYMOUS, False), (None, True)]
+        for role, is_superuser in subjects:
+            for basename in basenames:
+                for method in METHODS:
+                    with self.subTest(role=role, superuser=is_superuser, basename=basename, method=method):
+                        self.assertEqual(
+                            self.has_permission(role, basename, method, is_superuser),
+                            _expected(role, basename, method, is_superuser),
+                        )
+
+    def test_known_decisions(self):
+        cases = [
+            (ANONYMOUS, 'product', 'GET', True),
+            (ANONYMOUS, 'product', 'POST', False),
+            (ANONYMOUS, 'order', 'GET', False),
+            (UserType.PLATFORM_CUSTOMER, 'customercart', 'POST', True),
+            (UserType.PLATFORM_CUSTOMER, 'product', 'PATCH', False),
+            (UserType.PLATFORM_CUSTOMER, 'temporder', 'GET', False),
+            (UserType.CASHIER, 'order', 'POST', True),
+            (UserType.CASHIER, 'branchproductinventory', 'HEAD', True),
+            (UserType.CASHIER, 'branchproductinventory', 'PUT', False),
+            (UserType.SHELF_ORGANIZER, 'branchproductinventory', 'PATCH', True),
+            (UserType.BRANCH_MANAGER, 'store', 'DELETE', False),
+            (UserType.STORE_MANAGER, 'productcategory', 'POST', False),
+            (UserType.APP_OWNER, 'unknown', 'DELETE', True),
+            (UserType.PROJECT_MANAGER, 'store', 'PUT', True),
+            (None, 'product', 'GET', False),
+        ]
+        for role, basename, method, allowed in cases:
+            with self.subTest(role=role, basename=basename, method=method):
+                self.assertIs(self.has_permission(role, basename, method), allowed)
+        self.assertTrue(self.has_permission(None, 'unknown', 'DELETE', is_superuser=True))
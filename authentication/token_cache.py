@@ -0,0 +1,135 @@
+# authentication/token_cache.py
+"""
+Process-local cache of verified Firebase ID tokens (FirebaseAuthentication).
+
+A token is verified once (signature, audience, expiry) and its claims are reused
+until the token's own `exp`, so repeated requests skip the RSA check. Entries are
+keyed by the SHA-256 of the token, never the token itself. The Django user resolved
+for a token is kept for FIREBASE_USER_CACHE_SECONDS and dropped as soon as that
+UserAccount is saved or deleted in this process.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+class _Entry:
+    __slots__ = ('claims', 'expires_at', 'user', 'user_expires_at')
+
+    def __init__(self, claims, expires_at):
+        self.claims = claims
+        self.expires_at = expires_at
+        self.user = None
+        self.user_expires_at = 0
+
+
+class VerifiedTokenCache:
+    """
+    LRU of token hash -> verified claims, each entry expiring at the token's `exp`.
+    """
+
+    def __init__(self, max_size, user_ttl):
+        self.max_size = max_size
+        self.user_ttl = user_ttl
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token):
+        """The entry of a previously verified, not yet expired token, or None."""
+        key = self.key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def put(self, token, claims):
+        entry = _Entry(claims, claims.get('exp', 0))
+        key = self.key(token)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+        return entry
+
+    def cached_user(self, entry):
+        user = entry.user
+        if user is not None and entry.user_expires_at > time.time():
+            return user
+        return None
+
+    def set_user(self, token, entry, user):
+        key = self.key(token)
+        with self._lock:
+            if self._entries.get(key) is not entry:
+                return  # evicted meanwhile
+            entry.user = user
+            entry.user_expires_at = time.time() + self.user_ttl
+            self._keys_by_user.setdefault(user.pk, set()).add(key)
+
+    def forget_user(self, user_pk):
+        with self._lock:
+            for key in self._keys_by_user.pop(user_pk, ()):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.user = None
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry.user is not None:
+            keys = self._keys_by_user.get(entry.user.pk)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_user[entry.user.pk]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+token_cache = VerifiedTokenCache(
+    getattr(settings, 'FIREBASE_TOKEN_CACHE_MAX_ENTRIES', 10000),
+    getattr(settings, 'FIREBASE_USER_CACHE_SECONDS', 60),
+)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def forget_cached_user(sender, instance, **kwargs):
+    """
+    A changed account (role, is_active...) is loaded again on its next request.
+    """
+    token_cache.forget_user(instance.pk)
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.22 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['submitted_at', 'id'], name='rating_submitted_id_idx'),
+        ),
+    ]
@@ -13,6 +13,22 @@ from products.models import Product
 from stores.models import Branch
 from users.models import Customer  # Using the Customer model from users.models
 from sales.models import Order
+from mysite.scoping import PrincipalQuerySet
+
+
+class CustomerCartQuerySet(PrincipalQuerySet):
+    branch_field = 'branch_id'
+    customer_field = 'customer_id'
+
+
+class CustomerCartItemQuerySet(PrincipalQuerySet):
+    branch_field = 'cart__branch_id'
+    customer_field = 'cart__customer_id'
+
+
+class RatingQuerySet(PrincipalQuerySet):
+    branch_field = 'order__branch_id'
+    customer_field = 'customer_id'
 
 
 class CustomerCart(models.Model):
@@ -35,6 +51,8 @@ class CustomerCart(models.Model):
         verbose_name=_("Associated Branch")
     )
 
+    objects = CustomerCartQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Customer Cart")
         verbose_name_plural = _("Customer Carts")
@@ -82,6 +100,8 @@ class CustomerCartItem(models.Model):
     )
     added_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Added At"))
 
+    objects = CustomerCartItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Customer Cart Item")
         verbose_name_plural = _("Customer Cart Items")
@@ -117,10 +137,15 @@ class Rating(models.Model):
     comments = models.TextField(blank=True, null=True, verbose_name=_("Additional Comments"))
     submitted_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Submitted At"))
 
+    objects = RatingQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Rating")
         verbose_name_plural = _("Ratings")
         ordering = ['-submitted_at']
+        indexes = [
+            models.Index(fields=['submitted_at', 'id'], name='rating_submitted_id_idx'),
+        ]
 
     def __str__(self):
         order_info = ""
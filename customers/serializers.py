@@ -1,7 +1,7 @@
 from rest_framework import serializers
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
 from django.utils.translation import gettext_lazy as _
-from django.db.models import F # For using F() expressions
 import secrets # For generating session keys if needed
 from django.utils import timezone # For timezone.now()
 
@@ -10,13 +10,15 @@ from .models import Customer, CustomerCart, CustomerCartItem, Rating
 
 # Import models from other apps
 from products.models import Product, BranchProductInventory
+from products.inventory import CART_HOLDER, available_quantity, reservation_holder, reserve_stock
 # التأكد من استيراد Order (كان Invoice)
 from sales.models import Order
 # تحديث الاستيراد لاستخدام UserAccount والوصول إلى Role
 from users.models import UserAccount, Role, Employee # Customer is imported from .models
+from mysite.fieldsets import SparseFieldsetSerializerMixin
 
 
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     # Customer model is now linked to UserAccount via user_account OneToOneField
     user_account_username = serializers.CharField(source='user_account.username', read_only=True)
     user_account_email = serializers.EmailField(source='user_account.email', read_only=True)
@@ -89,7 +91,18 @@ class CustomerSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class CustomerCartItemSerializer(serializers.ModelSerializer):
+def _reserve_cart_stock(cart, product, quantity):
+    """
+    Sets the cart's hold on a product to `quantity` (0 releases it). Carts only reserve
+    stock with an expiry; on-hand stock is decremented when an order is completed.
+    """
+    try:
+        reserve_stock(cart.branch_id, product.pk, reservation_holder(CART_HOLDER, cart.pk), quantity=quantity)
+    except DjangoValidationError as exc:
+        raise serializers.ValidationError({'quantity': exc.messages})
+
+
+class CustomerCartItemSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     product_price = serializers.DecimalField(source='product.price_after_discount', max_digits=10, decimal_places=2, read_only=True)
 
@@ -97,6 +110,10 @@ class CustomerCartItemSerializer(serializers.ModelSerializer):
         model = CustomerCartItem
         fields = ['id', 'cart', 'product', 'product_name', 'product_price', 'quantity', 'added_at']
         read_only_fields = ['product_name', 'product_price', 'added_at']
+        # أعمدة المنتج التي يعتمد عليها السعر المحسوب (لـ ?fields= / ?omit=)
+        sparse_field_sources = {
+            'product_price': tuple(f'product.{name}' for name in Product.PRICE_SOURCE_FIELDS + Product.EFFECTIVE_PRICE_FIELDS),
+        }
         extra_kwargs = {
             'cart': {'write_only': True},
             'product': {'write_only': True}
@@ -139,19 +156,13 @@ class CustomerCartItemSerializer(serializers.ModelSerializer):
         if not cart.branch:
             raise serializers.ValidationError({'branch': _('Cart must be associated with a branch to add products.')})
 
-        product_inventory = BranchProductInventory.objects.filter(product=product, branch=cart.branch).first()
-        if not product_inventory:
+        if not BranchProductInventory.objects.filter(product=product, branch=cart.branch).exists():
             raise serializers.ValidationError({'product': _('Product is not available in the specified cart branch.')})
 
-        # For updates, get the old quantity to calculate the difference
-        instance = self.instance # The existing cart item instance if this is an update
-        old_quantity = instance.quantity if instance else 0
-        
-        needed_quantity_change = quantity - old_quantity # Quantity difference (positive for add, negative for remove)
-        
-        if needed_quantity_change > 0: # Only check stock if quantity is increasing
-            if product_inventory.quantity < needed_quantity_change:
-                raise serializers.ValidationError({'quantity': _(f'Requested quantity ({quantity}) is not available in stock. Available: {product_inventory.quantity + old_quantity}')})
+        # Available stock excludes live holds of other baskets; this cart's own hold is counted as available
+        available = available_quantity(cart.branch_id, product.pk, exclude_holder=reservation_holder(CART_HOLDER, cart.pk))
+        if quantity > available:
+            raise serializers.ValidationError({'quantity': _(f'Requested quantity ({quantity}) is not available in stock. Available: {available}')})
         
         return data
 
@@ -162,72 +173,41 @@ class CustomerCartItemSerializer(serializers.ModelSerializer):
         quantity = validated_data['quantity']
 
         existing_item = CustomerCartItem.objects.filter(cart=cart, product=product).first()
-        # Use select_for_update to lock the inventory row for the duration of the transaction
-        product_inventory = BranchProductInventory.objects.select_for_update().get(product=product, branch=cart.branch)
+        new_item_quantity = quantity + (existing_item.quantity if existing_item else 0)
+        _reserve_cart_stock(cart, product, new_item_quantity)
 
         if existing_item:
-            # If item exists, update its quantity and adjust stock
-            old_item_quantity = existing_item.quantity
-            new_item_quantity = old_item_quantity + quantity
-            
-            # Stock check for the *total new quantity* compared to *current available + old item quantity*
-            # This logic should mostly be covered by validate() if it calculates needed_quantity_change correctly
-            # and checks against available inventory before the update.
-            
+            # If item exists, update its quantity
             existing_item.quantity = new_item_quantity
             existing_item.save(update_fields=['quantity'])
-
-            product_inventory.quantity = F('quantity') - quantity # Deduct the *added* quantity
-            product_inventory.save(update_fields=['quantity'])
-            
             return existing_item
-        else:
-            # Create new item and deduct stock
-            product_inventory.quantity = F('quantity') - quantity
-            product_inventory.save(update_fields=['quantity'])
-            return super().create(validated_data)
+        return super().create(validated_data)
 
     @transaction.atomic
     def update(self, instance, validated_data):
         old_quantity = instance.quantity
         new_quantity = validated_data.get('quantity', old_quantity) # Get new quantity or keep old
-        product = instance.product
-        cart = instance.cart 
-
-        # Use select_for_update to lock the inventory row
-        product_inventory = BranchProductInventory.objects.select_for_update().get(product=product, branch=cart.branch)
 
         if new_quantity <= 0: # If new quantity is 0 or less, this means removal
-            # Return stock and delete the item
-            product_inventory.quantity = F('quantity') + old_quantity # Return the full old quantity
-            product_inventory.save(update_fields=['quantity'])
+            # Release the hold and delete the item
+            _reserve_cart_stock(instance.cart, instance.product, 0)
             instance.delete()
             return instance # Return the deleted instance (DRF will return 204 No Content for DELETE)
 
         if new_quantity != old_quantity:
-            diff_quantity = new_quantity - old_quantity # Positive if increasing, negative if decreasing
-            
-            # If increasing, check stock. Validation should have already done this, but a redundant check in atomic transaction is safe.
-            if diff_quantity > 0:
-                if product_inventory.quantity < diff_quantity: # If current stock is less than what we need to add
-                    raise serializers.ValidationError({'quantity': _(f'Not enough stock to increase quantity by {diff_quantity}. Available: {product_inventory.quantity}.')})
-            
-            # Adjust inventory
-            product_inventory.quantity = F('quantity') - diff_quantity
-            product_inventory.save(update_fields=['quantity'])
-            
+            # The hold is re-checked against available stock under the inventory lock
+            _reserve_cart_stock(instance.cart, instance.product, new_quantity)
+
         return super().update(instance, validated_data)
 
     @transaction.atomic
     def destroy(self, instance): # Renamed to 'destroy' for consistency with DRF ViewSet actions
-        # When deleting a cart item, return the quantity to stock
-        product_inventory = BranchProductInventory.objects.select_for_update().get(product=instance.product, branch=instance.cart.branch)
-        product_inventory.quantity = F('quantity') + instance.quantity # Return the quantity of the item being deleted
-        product_inventory.save(update_fields=['quantity'])
+        # When deleting a cart item, release its hold on the stock
+        _reserve_cart_stock(instance.cart, instance.product, 0)
         instance.delete()
 
 
-class CustomerCartSerializer(serializers.ModelSerializer):
+class CustomerCartSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     # This should be the main Cart Serializer, so it needs to properly handle items and total price.
     items = CustomerCartItemSerializer(many=True, read_only=True) # Nested serializer for cart items
     
@@ -350,7 +330,7 @@ class CustomerCartSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class RatingSerializer(serializers.ModelSerializer):
+class RatingSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     # Access customer's username from the linked UserAccount
     customer_username = serializers.CharField(source='customer.user_account.username', read_only=True)
     # Access order details
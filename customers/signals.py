@@ -1,9 +1,10 @@
 # customers/signals.py
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from products.inventory import CART_HOLDER, release_reservations, reservation_holder
 from sales.models import Order
-from .models import Rating
+from .models import CustomerCart, Rating
 
 @receiver(post_save, sender=Order)
 def create_rating_on_order_created(sender, instance, created, **kwargs):
@@ -13,3 +14,11 @@ def create_rating_on_order_created(sender, instance, created, **kwargs):
     if created and instance.customer:
         if not Rating.objects.filter(order=instance).exists():
             Rating.objects.create(order=instance, customer=instance.customer)
+
+
+@receiver(post_delete, sender=CustomerCart)
+def release_cart_reservations(sender, instance, **kwargs):
+    """
+    Release the stock held by a deleted cart.
+    """
+    release_reservations(reservation_holder(CART_HOLDER, instance.pk))
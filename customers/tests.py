@@ -1,3 +1,35 @@
+from decimal import Decimal
+
 from django.test import TestCase
 
-# Create your tests here.
+from products.inventory import CART_HOLDER, available_quantity, reservation_holder, reserve_stock
+from products.models import BranchProductInventory, Product, StockReservation
+from stores.models import Branch, Store
+from users.constants import UserType
+from users.models import Customer, Role, UserAccount
+
+from .models import CustomerCart
+
+
+class CartReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        store = Store.objects.create(name="Store", address="Riyadh")
+        cls.branch = Branch.objects.create(store=store, name="Branch", address="Riyadh")
+        role = Role.objects.create(role_name=UserType.PLATFORM_CUSTOMER.value)
+        cls.customers = [
+            Customer.objects.create(user_account=UserAccount.objects.create(email=f"customer{i}@example.com", role=role))
+            for i in range(2)
+        ]
+        cls.product = Product.objects.create(name="Product", price=Decimal('10.00'))
+        BranchProductInventory.objects.create(product=cls.product, branch=cls.branch, quantity=5)
+
+    def test_deleting_a_cart_releases_its_holds(self):
+        carts = [CustomerCart.objects.create(customer=customer, branch=self.branch) for customer in self.customers]
+        for cart, quantity in zip(carts, (3, 1)):
+            reserve_stock(self.branch.pk, self.product.pk, reservation_holder(CART_HOLDER, cart.pk), quantity=quantity)
+        self.assertEqual(available_quantity(self.branch.pk, self.product.pk), 1)
+
+        carts[0].delete()
+        self.assertEqual(list(StockReservation.objects.values_list('holder', flat=True)), [reservation_holder(CART_HOLDER, carts[1].pk)])
+        self.assertEqual(available_quantity(self.branch.pk, self.product.pk), 4)
@@ -28,37 +28,21 @@ from .serializers import (
 
 # Import CustomPermission (ensure it's updated to handle UserAccount roles)
 from mysite.permissions import CustomPermission
+from authentication.principal import get_principal
+from mysite.pagination import TimestampCursorPagination
+from mysite.fieldsets import SparseFieldsetViewMixin
 
 
 # --- API ViewSets for Customer ---
-class CustomerViewSet(viewsets.ModelViewSet):
+class CustomerViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated, CustomPermission]
 
     def get_queryset(self):
-        # request.user will be an instance of UserAccount
-        user_account = self.request.user
-
-        # Superusers, App Owners, Project Managers, App Staff see all customers
-        if user_account.is_superuser or (user_account.role and user_account.role.role_name in ['app_owner', 'project_manager', 'app_staff']):
-            return Customer.objects.all()
-        
-        # Customers see their own profile
-        # Assuming Customer has a OneToOneField to UserAccount called 'user_account'
-        if user_account.role and user_account.role.role_name == 'customer':
-            return Customer.objects.filter(user_account=user_account)
-        
-        # Store Manager sees customers who have placed orders in their store's branches
-        if user_account.role and user_account.role.role_name == 'store_manager' and hasattr(user_account, 'employee_profile') and user_account.employee_profile.store:
-            return Customer.objects.filter(customer_orders__branch__store=user_account.employee_profile.store).distinct()
-        
-        # Branch Manager or General Staff/Cashier sees customers who have placed orders in their branch
-        if user_account.role and user_account.role.role_name in ['branch_manager', 'general_staff', 'cashier', 'shelf_organizer', 'customer_service'] and hasattr(user_account, 'employee_profile') and user_account.employee_profile.branch:
-            return Customer.objects.filter(customer_orders__branch=user_account.employee_profile.branch).distinct()
-            
-        return Customer.objects.none()
+        # Scoped by role (mysite.scoping): staff see customers with orders in their branches
+        return Customer.objects.for_principal(get_principal(self.request))
 
     def perform_create(self, serializer):
         user_account = self.request.user
@@ -78,34 +62,14 @@ class CustomerViewSet(viewsets.ModelViewSet):
 
 
 # --- API ViewSets for Customer Carts ---
-class CustomerCartViewSet(viewsets.ModelViewSet):
+class CustomerCartViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = CustomerCart.objects.all()
     serializer_class = CustomerCartSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated, CustomPermission] # Using CustomPermission
 
     def get_queryset(self):
-        user_account = self.request.user
-        # App Owner / Superuser / Project Manager / App Staff sees all carts
-        if user_account.is_superuser or (user_account.role and user_account.role.role_name in ['app_owner', 'project_manager', 'app_staff']):
-            return CustomerCart.objects.all()
-        
-        # Customers see their own carts
-        # Assuming CustomerCart is linked to UserAccount or Customer profile
-        if user_account.role and user_account.role.role_name == 'customer':
-            return CustomerCart.objects.filter(customer__user_account=user_account) # Assuming CustomerCart has a ForeignKey to Customer
-        
-        # Store Manager sees carts in their store's branches
-        if user_account.role and user_account.role.role_name == 'store_manager' and hasattr(user_account, 'employee_profile') and user_account.employee_profile.store:
-            # Assumes CustomerCart has a ForeignKey 'branch' to a Branch model
-            return CustomerCart.objects.filter(branch__store=user_account.employee_profile.store).distinct()
-            
-        # Branch Manager or Staff sees carts in their branch
-        if user_account.role and user_account.role.role_name in ['branch_manager', 'general_staff', 'cashier', 'shelf_organizer', 'customer_service'] and hasattr(user_account, 'employee_profile') and user_account.employee_profile.branch:
-            # Assumes CustomerCart has a ForeignKey 'branch' to a Branch model
-            return CustomerCart.objects.filter(branch=user_account.employee_profile.branch).distinct()
-            
-        return CustomerCart.objects.none()
+        return CustomerCart.objects.for_principal(get_principal(self.request))
 
     def perform_create(self, serializer):
         user_account = self.request.user
@@ -132,30 +96,15 @@ class CustomerCartViewSet(viewsets.ModelViewSet):
 
 
 # --- API ViewSets for Customer Cart Items ---
-class CustomerCartItemViewSet(viewsets.ModelViewSet):
+class CustomerCartItemViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = CustomerCartItem.objects.all()
     serializer_class = CustomerCartItemSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated, CustomPermission] # Using CustomPermission
 
     def get_queryset(self):
-        user_account = self.request.user
-        if user_account.is_superuser or (user_account.role and user_account.role.role_name in ['app_owner', 'project_manager', 'app_staff']):
-            return CustomerCartItem.objects.all()
-        
-        # Customers see items in their carts only
-        if user_account.role and user_account.role.role_name == 'customer':
-            return CustomerCartItem.objects.filter(cart__customer__user_account=user_account)
-        
-        # Store Manager sees cart items in their store's branches
-        if user_account.role and user_account.role.role_name == 'store_manager' and hasattr(user_account, 'employee_profile') and user_account.employee_profile.store:
-            return CustomerCartItem.objects.filter(cart__branch__store=user_account.employee_profile.store).distinct()
-            
-        # Branch Manager or Staff sees cart items in their branch
-        if user_account.role and user_account.role.role_name in ['branch_manager', 'general_staff', 'cashier', 'shelf_organizer', 'customer_service'] and hasattr(user_account, 'employee_profile') and user_account.employee_profile.branch:
-            return CustomerCartItem.objects.filter(cart__branch=user_account.employee_profile.branch).distinct()
-            
-        return CustomerCartItem.objects.none()
+        # The cart is read by the object permission check
+        return CustomerCartItem.objects.for_principal(get_principal(self.request)).select_related('cart')
 
     def perform_create(self, serializer):
         # Logic for permission and inventory is handled in CustomerCartItemSerializer.validate() and .create()
@@ -176,31 +125,16 @@ class CustomerCartItemViewSet(viewsets.ModelViewSet):
 
 
 # --- API ViewSets for Ratings ---
-class RatingViewSet(viewsets.ModelViewSet):
+class RatingViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = Rating.objects.all() # Queryset will be filtered by get_queryset
     serializer_class = RatingSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated, CustomPermission] # Using CustomPermission
+    pagination_class = TimestampCursorPagination
+    cursor_ordering = ('-submitted_at', '-id')
 
     def get_queryset(self):
-        user_account = self.request.user
-        if user_account.is_superuser or (user_account.role and user_account.role.role_name in ['app_owner', 'project_manager', 'app_staff']):
-            return Rating.objects.all()
-        
-        # Customers see their own ratings
-        # Assuming Rating has a ForeignKey to Customer, and Customer has OneToOne to UserAccount
-        if user_account.role and user_account.role.role_name == 'customer':
-            return Rating.objects.filter(customer__user_account=user_account)
-        
-        # Store Manager sees ratings for orders in their store's branches
-        if user_account.role and user_account.role.role_name == 'store_manager' and hasattr(user_account, 'employee_profile') and user_account.employee_profile.store:
-            return Rating.objects.filter(order__branch__store=user_account.employee_profile.store).distinct()
-            
-        # Branch Manager or Staff sees ratings for orders in their branch
-        if user_account.role and user_account.role.role_name in ['branch_manager', 'general_staff', 'cashier', 'shelf_organizer', 'customer_service'] and hasattr(user_account, 'employee_profile') and user_account.employee_profile.branch:
-            return Rating.objects.filter(order__branch=user_account.employee_profile.branch).distinct()
-
-        return Rating.objects.none()
+        return Rating.objects.for_principal(get_principal(self.request))
 
     def perform_create(self, serializer):
         # As per RatingSerializer.validate(), direct creation of ratings via API is generally not allowed.
@@ -0,0 +1,138 @@
+# mysite/fieldsets.py
+"""
+Sparse fieldsets for read endpoints: `?fields=id,name,price` keeps only the listed
+serializer fields, `?omit=branch_inventories` drops some. The selection is pushed
+down to the queryset: unselected columns are deferred with .only(), and joins and
+prefetches that only fed unselected fields are skipped.
+"""
+from django.core.exceptions import FieldDoesNotExist
+
+SPARSE_FIELDSET_ACTIONS = ('list', 'retrieve')
+
+
+def _split(value):
+    return {name.strip() for name in value.split(',') if name.strip()} if value else set()
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    Drops the fields excluded by the view's sparse fieldset.
+    The view passes it as context['sparse_fieldset'] = (fields or None, omit).
+    Serializers declare in Meta.sparse_field_sources the model columns behind
+    computed fields, e.g. {'price_after_discount': ('price', 'discount_percentage')}.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        sparse = self.context.get('sparse_fieldset')
+        if sparse:
+            fields, omit = sparse
+            for name in list(self.fields):
+                if (fields is not None and name not in fields) or name in omit:
+                    self.fields.pop(name)
+
+
+class SparseFieldsetViewMixin:
+    """
+    Reads ?fields= / ?omit= on list and retrieve, trims the serializer and projects the queryset.
+    """
+
+    def get_sparse_fieldset(self):
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in ('GET', 'HEAD') or self.action not in SPARSE_FIELDSET_ACTIONS:
+            return None
+        fields = _split(request.query_params.get('fields'))
+        omit = _split(request.query_params.get('omit'))
+        if not fields and not omit:
+            return None
+        return (fields or None, omit)
+
+    def sparse_field_selected(self, name):
+        sparse = self.get_sparse_fieldset()
+        if not sparse:
+            return True
+        fields, omit = sparse
+        return (fields is None or name in fields) and name not in omit
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        sparse = self.get_sparse_fieldset()
+        if sparse:
+            context['sparse_fieldset'] = sparse
+        return context
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.get_sparse_fieldset():
+            # the cursor paginator reads its ordering columns from the page's edge rows
+            ordering = getattr(self, 'cursor_ordering', None) or getattr(self.paginator, 'ordering', None) or ()
+            if isinstance(ordering, str):
+                ordering = (ordering,)
+            queryset = project_queryset(
+                queryset, self.get_serializer(), extra_fields=[name.lstrip('-') for name in ordering]
+            )
+        return queryset
+
+
+def _resolve_source(model, attrs, only, related, prefetch_roots):
+    """
+    Records what one dotted serializer source needs. Returns False when the source is
+    not a plain model path (method, property, unknown name), in which case nothing is deferred.
+    """
+    path = []
+    for index, attr in enumerate(attrs):
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            return False
+        if not field.concrete:
+            # reverse FK / M2M: only from the root model, loaded by its own prefetch
+            if index == 0 and field.is_relation:
+                prefetch_roots.add(attr)
+                return True
+            return False
+        path.append(attr)
+        only.add('__'.join(path))
+        if not field.is_relation or index == len(attrs) - 1:
+            return True
+        if not (field.many_to_one or field.one_to_one):
+            return False
+        related.add('__'.join(path))
+        model = field.related_model
+    return True
+
+
+def project_queryset(queryset, serializer, extra_fields=()):
+    """
+    Restricts the queryset to what the (already trimmed) serializer reads, plus extra_fields.
+    Leaves the queryset untouched when a selected field cannot be traced to columns.
+    """
+    model = queryset.model
+    only = {model._meta.pk.name, *(name for name in extra_fields if name not in ('pk', 'id'))}
+    related = set()
+    prefetch_roots = set()
+    declared = getattr(getattr(serializer, 'Meta', None), 'sparse_field_sources', {})
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in declared:
+            sources = declared[name]
+        elif field.source == '*':
+            return queryset
+        else:
+            sources = ['.'.join(field.source_attrs)]
+        for source in sources:
+            if not _resolve_source(model, source.split('.'), only, related, prefetch_roots):
+                return queryset
+
+    lookups = [
+        lookup for lookup in queryset._prefetch_related_lookups
+        if getattr(lookup, 'prefetch_to', lookup).split('__')[0] in prefetch_roots
+    ]
+    queryset = queryset.select_related(None).prefetch_related(None).only(*only)
+    if related:
+        queryset = queryset.select_related(*related)
+    if lookups:
+        queryset = queryset.prefetch_related(*lookups)
+    return queryset
@@ -0,0 +1,22 @@
+# mysite/pagination.py
+
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class TimestampCursorPagination(CursorPagination):
+    """
+    Keyset (cursor) pagination on an indexed (timestamp, id) pair, newest first.
+    Each page is an index range scan, so deep pages cost the same as the first one.
+
+    Views pick the timestamp column with `cursor_ordering`, e.g. ('-payment_date', '-id');
+    the default is ('-created_at', '-id'). Clients may ask for `?page_size=`, capped at
+    API_MAX_PAGE_SIZE.
+    """
+    page_size = getattr(settings, 'API_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 500)
+    ordering = ('-created_at', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', None) or self.ordering
@@ -1,18 +1,143 @@
 # C:\Users\DELL\SER SQL MY APP\mysite\permissions.py
 
 from rest_framework import permissions
+from django.core.exceptions import ImproperlyConfigured
 from django.db.models import Q
 # تحديث الاستيراد لاستخدام UserAccount، Role، Customer، Employee
 from users.models import UserAccount, Role, Customer, Employee
+from authentication.principal import get_principal
+from mysite.scoping import SCOPE_ANNOTATION
 
 # استيراد النماذج من أماكنها الصحيحة
-from stores.models import Store, Branch
+from stores.models import Store, Branch, StorePermissionProfile, BranchPermissionProfile
 from products.models import Product, Department, ProductCategory, BranchProductInventory, InventoryMovement
 from sales.models import Order, OrderItem, TempOrder, TempOrderItem
-# CustomerCart, CustomerCartItem, Rating are assumed to be imported from customer app models
-# For simplicity, assuming they are available or will be imported from their respective apps.
-# If they are in the 'customers' app, you might need:
-# from customers.models import CustomerCart, CustomerCartItem, Rating
+from customers.models import CustomerCart, CustomerCartItem
+
+
+# مفتاح المستخدم غير المصادق في جدول الصلاحيات
+ANONYMOUS = 'anonymous'
+READ_ONLY = 'read_only'    # GET / HEAD / OPTIONS
+READ_WRITE = 'read_write'  # كل الطرق
+
+# الدور -> مستوى الوصول -> basenames الخاصة بالـ ViewSets.
+# مالك التطبيق ومدير المشروع والـ superuser غير مذكورين: لديهم صلاحية كاملة.
+ACCESS_POLICY = {
+    ANONYMOUS: {
+        READ_ONLY: ('product', 'department', 'branch', 'store', 'productcategory'),
+    },
+    'platform_customer': {
+        # سلاته وعناصرها وتقييماته وطلباته وملفه
+        READ_WRITE: ('customercart', 'customercartitem', 'rating', 'order', 'orderitem', 'customer'),
+        READ_ONLY: ('product', 'department', 'store', 'branch', 'productcategory'),
+    },
+    'store_manager': {
+        # كل ما في نطاق متجره، وموظفيه، ومتجره وفروعه، والتقارير ورفع ملفات Excel
+        READ_WRITE: (
+            'product', 'branchproductinventory', 'department', 'order', 'orderitem', 'temporder', 'temporderitem',
+            'customercart', 'customercartitem', 'rating', 'customer', 'useraccount', 'store', 'branch',
+            'report', 'productexcelupload',
+        ),
+        # إدارة فئات المنتجات لموظفي التطبيق
+        READ_ONLY: ('productcategory',),
+    },
+    'branch_manager': {
+        READ_WRITE: (
+            'product', 'branchproductinventory', 'department', 'order', 'orderitem', 'temporder', 'temporderitem',
+            'customercart', 'customercartitem', 'rating', 'customer', 'useraccount', 'branch',
+            'report', 'productexcelupload',
+        ),
+        READ_ONLY: ('store', 'productcategory'),
+    },
+    'cashier': {
+        # السلات والطلبات لإنشاء عمليات البيع
+        READ_WRITE: ('customercart', 'customercartitem', 'order', 'orderitem', 'temporder', 'temporderitem', 'customer'),
+        READ_ONLY: ('product', 'department', 'productcategory', 'branchproductinventory', 'rating', 'useraccount'),
+    },
+    'shelf_organizer': {
+        # تعديل مخزون فرعه
+        READ_WRITE: ('branchproductinventory',),
+        READ_ONLY: ('product', 'department', 'productcategory', 'useraccount'),
+    },
+    'customer_service': {
+        READ_WRITE: ('customer',),
+        READ_ONLY: (
+            'product', 'department', 'productcategory', 'store', 'branch',
+            'customercart', 'customercartitem', 'order', 'orderitem', 'rating', 'useraccount',
+        ),
+    },
+    'general_staff': {
+        # كل شيء في فرعه ما عدا المستخدمين الحساسين
+        READ_WRITE: (
+            'product', 'branchproductinventory', 'department', 'productcategory', 'customercart', 'customercartitem',
+            'order', 'orderitem', 'temporder', 'temporderitem', 'rating', 'customer', 'useraccount',
+        ),
+        READ_ONLY: ('branch', 'store'),
+    },
+    'app_staff': {
+        # المستخدمون، المتاجر والفروع والتقارير، سجلات المزامنة، الكتالوج
+        READ_WRITE: (
+            'useraccount', 'store', 'branch', 'report', 'accountingsystemconfig', 'productsynclog',
+            'saleinvoicesynclog', 'productcategory', 'department', 'product', 'branchproductinventory',
+        ),
+    },
+}
+
+_SAFE_METHODS = frozenset(permissions.SAFE_METHODS)
+_WRITE_METHODS = frozenset({'POST', 'PUT', 'PATCH', 'DELETE'})
+_UPDATE_METHODS = frozenset({'PUT', 'PATCH'})
+
+# أدوار موظفي الفروع، ومدير المتجر الذي يشمل نطاقه كل فروع متجره
+_BRANCH_SCOPED_ROLES = frozenset({'store_manager', 'branch_manager', 'general_staff', 'cashier', 'customer_service', 'shelf_organizer'})
+_SALES_ROLES = frozenset({'store_manager', 'branch_manager', 'general_staff', 'cashier'})
+_PROTECTED_FROM_STORE_MANAGER = frozenset({'app_owner', 'store_account', 'project_manager', 'app_staff', 'store_manager', 'superuser'})
+_MANAGED_BY_BRANCH_MANAGER = frozenset({'general_staff', 'cashier', 'shelf_organizer', 'customer_service'})
+
+
+def compile_access_policy(policy):
+    """
+    Flattens the policy into a frozenset of (role, basename, is_safe_method) entries,
+    so each check in has_permission is a single set lookup.
+    """
+    allowed = set()
+    for role, grants in policy.items():
+        unknown = set(grants) - {READ_ONLY, READ_WRITE}
+        if unknown:
+            raise ImproperlyConfigured(f"Unknown access level(s) {sorted(unknown)} for role '{role}'.")
+        both = set(grants.get(READ_ONLY, ())) & set(grants.get(READ_WRITE, ()))
+        if both:
+            raise ImproperlyConfigured(f"Basename(s) {sorted(both)} are both read-only and read-write for role '{role}'.")
+        for basename in grants.get(READ_WRITE, ()):
+            allowed.add((role, basename, True))
+            allowed.add((role, basename, False))
+        for basename in grants.get(READ_ONLY, ()):
+            allowed.add((role, basename, True))
+    return frozenset(allowed)
+
+
+ALLOWED_ACCESS = compile_access_policy(ACCESS_POLICY)
+
+def in_scope(obj, principal):
+    """
+    Whether a Product or Customer is tied to one of the principal's branches (stocked
+    there, ordered there). Rows loaded through for_principal() carry SCOPE_ANNOTATION;
+    any other object costs one EXISTS query.
+    """
+    if not principal.branch_ids:
+        return False
+    value = getattr(obj, SCOPE_ANNOTATION, None)
+    if value is None:
+        value = type(obj).objects.filter(pk=obj.pk).for_principal(principal).exists()
+    return bool(value)
+
+
+def _is_own(principal, customer_id):
+    return principal.role_name == 'platform_customer' and customer_id is not None and customer_id == principal.customer_id
+
+
+def _is_branch_staff(principal, branch_id):
+    """Staff of the object's branch, or the manager of its store."""
+    return principal.is_staff_role and principal.role_name in _BRANCH_SCOPED_ROLES and branch_id in principal.branch_ids
 
 
 class CustomPermission(permissions.BasePermission):
@@ -22,529 +147,194 @@ class CustomPermission(permissions.BasePermission):
     """
 
     def has_permission(self, request, view):
-        user_account = request.user # هذا هو كائن UserAccount
-
-        # 1. المستخدم غير المصادق (AnonymousUser):
-        if not user_account.is_authenticated:
-            # السماح بقراءة بعض الموارد العامة
-            safe_read_basenames = ['product', 'department', 'branch', 'store', 'productcategory']
-            if view.basename in safe_read_basenames and request.method in permissions.SAFE_METHODS:
-                return True
-            return False # رفض الوصول بشكل افتراضي للمستخدمين غير المصادقين لغير القراءة
+        safe = request.method in _SAFE_METHODS
+        # 1. المستخدم غير المصادق (AnonymousUser): قراءة بعض الموارد العامة فقط
+        if not request.user.is_authenticated:
+            return (ANONYMOUS, view.basename, safe) in ALLOWED_ACCESS
 
+        # الدور ونطاق المستخدم يُحمّلان مرة واحدة لكل طلب (authentication.principal)
+        principal = get_principal(request)
         # 2. مالك التطبيق / Superuser / مدير المشروع: لديهم صلاحية كاملة على كل شيء
-        if user_account.is_superuser or \
-           (hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'app_owner') or \
-           (hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'project_manager'):
+        if principal.is_unrestricted:
             return True
-
-        # 3. صلاحيات العملاء (platform_customer)
-        if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'platform_customer':
-            # العميل يمكنه الوصول إلى ViewSets الخاصة بسلاته وعناصرها وتقييماته وطلباته
-            if view.basename in ['customercart', 'customercartitem', 'rating', 'order', 'orderitem', 'customer']:
-                return True
-            # يمكنه أيضاً عرض المنتجات والأقسام والفئات والمتاجر والفروع (للقراءة فقط)
-            if view.basename in ['product', 'department', 'store', 'branch', 'productcategory']:
-                return request.method in permissions.SAFE_METHODS
-            return False # يمنع العميل من الوصول لأي شيء آخر
-
-        # 4. صلاحيات مدير المتجر (store_manager)
-        if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'store_manager':
-            # يمكنه إدارة المنتجات (بما في ذلك المخزون), الأقسام، الطلبات، العملاء، التقييمات في نطاق متجره
-            if view.basename in ['product', 'branchproductinventory', 'department', 'order', 'orderitem', 'temporder', 'temporderitem', 'customercart', 'customercartitem', 'rating', 'customer']:
-                return True
-            # يمكنه إدارة المستخدمين التابعين لمتجره (موظفون)
-            if view.basename == 'useraccount': return True
-            # إدارة متجره وفروعه
-            if view.basename in ['store', 'branch']: return True
-            # فئات المنتجات (للقراءة فقط، الإدارة الشاملة تكون لموظفي التطبيق)
-            if view.basename == 'productcategory': return request.method in permissions.SAFE_METHODS
-            # صلاحيات التقارير (افتراض وجود ViewSet للتقارير)
-            if view.basename == 'report': return True
-            # صلاحيات لرفع ملفات المنتجات Excel
-            if view.basename == 'productexcelupload': return True # تأكد من basename الصحيح
-            return False
-
-        # 5. صلاحيات مدير الفرع (branch_manager)
-        if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'branch_manager':
-            # يمكنه إدارة المنتجات (بما في ذلك المخزون), الأقسام، الطلبات، العملاء، التقييمات في نطاق فرعه
-            if view.basename in ['product', 'branchproductinventory', 'department', 'order', 'orderitem', 'temporder', 'temporderitem', 'customercart', 'customercartitem', 'rating', 'customer']:
-                return True
-            # يمكنه إدارة المستخدمين التابعين لفرعه
-            if view.basename == 'useraccount': return True
-            # إدارة فرعه (للتعديل) ورؤية المتاجر (للقراءة)
-            if view.basename == 'branch': return True
-            if view.basename == 'store': return request.method in permissions.SAFE_METHODS
-            # فئات المنتجات (للقراءة فقط)
-            if view.basename == 'productcategory': return request.method in permissions.SAFE_METHODS
-            # صلاحيات التقارير
-            if view.basename == 'report': return True
-            # صلاحيات لرفع ملفات المنتجات Excel
-            if view.basename == 'productexcelupload': return True # تأكد من basename الصحيح
-            return False
-
-        # 6. صلاحيات موظف الكاشير (cashier)
-        if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'cashier':
-            # يمكنه إدارة سلات الشراء وعناصرها لإنشاء الطلبات
-            if view.basename in ['customercart', 'customercartitem']: return True
-            # يمكنه إنشاء وتعديل الطلبات المؤقتة والنهائية وعناصرها
-            if view.basename in ['order', 'orderitem', 'temporder', 'temporderitem']: return True
-            # يمكنه رؤية المنتجات والأقسام وفئات المنتجات والمخزون في فرعه (للقراءة فقط)
-            if view.basename in ['product', 'department', 'productcategory', 'branchproductinventory'] and request.method in permissions.SAFE_METHODS: return True
-            # يمكنه رؤية التقييمات
-            if view.basename == 'rating' and request.method in permissions.SAFE_METHODS: return True
-            # يمكنه رؤية ملفه الشخصي (user)
-            if view.basename == 'useraccount': return request.method in permissions.SAFE_METHODS
-            # يمكنه رؤية العملاء
-            if view.basename == 'customer': return True
-            return False
-            
-        # 7. صلاحيات منظم الرفوف (shelf_organizer)
-        if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'shelf_organizer':
-            # يمكنه رؤية المنتجات والأقسام وفئات المنتجات في نطاق فرعه
-            if view.basename in ['product', 'department', 'productcategory'] and request.method in permissions.SAFE_METHODS: return True
-            # يمكنه تعديل مخزون المنتجات في فرعه (BranchProductInventory)
-            if view.basename == 'branchproductinventory': return True
-            # يمكنه رؤية ملفه الشخصي (user)
-            if view.basename == 'useraccount': return request.method in permissions.SAFE_METHODS
-            return False
-
-        # 8. صلاحيات موظف خدمة العملاء (customer_service)
-        if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'customer_service':
-            # يمكنه رؤية المنتجات، الأقسام، فئات المنتجات، المتاجر، الفروع
-            if view.basename in ['product', 'department', 'productcategory', 'store', 'branch'] and request.method in permissions.SAFE_METHODS: return True
-            # يمكنه رؤية سلات الشراء وعناصرها، الطلبات وعناصرها، والتقييمات
-            if view.basename in ['customercart', 'customercartitem', 'order', 'orderitem', 'rating'] and request.method in permissions.SAFE_METHODS: return True
-            # يمكنه رؤية المستخدمين (لغرض الدعم)
-            if view.basename == 'useraccount': return request.method in permissions.SAFE_METHODS
-            # يمكنه رؤية العملاء
-            if view.basename == 'customer': return True
-            return False
-
-        # 9. صلاحيات موظف عام (general_staff)
-        if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'general_staff':
-            # يمكنه رؤية كل شيء في فرعه (ما عدا المستخدمين الحساسين)
-            if view.basename in ['product', 'branchproductinventory', 'department', 'productcategory', 'customercart', 'customercartitem', 'order', 'orderitem', 'temporder', 'temporderitem', 'rating', 'customer'] : return True
-            # يمكنه رؤية المستخدمين التابعين لفرعه
-            if view.basename == 'useraccount': return True
-            # يمكنه رؤية فرعه و متجره
-            if view.basename in ['branch', 'store'] and request.method in permissions.SAFE_METHODS : return True
-            return False
-
-        # 10. صلاحيات فريق عمل التطبيق (app_staff)
-        if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'app_staff':
-            # يمكنهم إدارة المستخدمين على مستوى التطبيق (ولكن ليس مالكي التطبيق أو المشرفين)
-            if view.basename == 'useraccount': return True
-            # يمكنهم رؤية المتاجر والفروع والتقارير العامة
-            if view.basename in ['store', 'branch', 'report']: return True
-            # يمكنهم الوصول إلى سجلات المزامنة (integrations) وإدارة فئات المنتجات والأقسام والمنتجات
-            if view.basename in ['accountingsystemconfig', 'productsynclog', 'saleinvoicesynclog', 'productcategory', 'department', 'product', 'branchproductinventory']: return True
-            return False
-
-        # الافتراضي: رفض الوصول لأي ViewSet لم يتم تحديده صراحةً
-        return False
+        # 3. باقي الأدوار حسب جدول ACCESS_POLICY، وأي ViewSet غير مذكور مرفوض
+        return (principal.role_name, view.basename, safe) in ALLOWED_ACCESS
 
     def has_object_permission(self, request, view, obj):
-        user_account = request.user # هذا هو كائن UserAccount
+        """
+        Decided from the principal's store/branch/department ids and the object's own
+        foreign keys, without queries. Membership that needs other rows (a product stocked
+        in the user's branches, a customer who ordered there) is read from
+        SCOPE_ANNOTATION, which for_principal() sets (see in_scope).
+        """
+        principal = get_principal(request)
+        if principal is None:
+            return False
 
         # 1. مالك التطبيق / Superuser / مدير المشروع: لديهم صلاحية كاملة على أي كائن
-        if user_account.is_superuser or \
-           (hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'app_owner') or \
-           (hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'project_manager'):
+        if principal.is_unrestricted:
             return True
 
         # 2. الأذونات على الكائنات بناءً على نوع الكائن ودور المستخدم
-        
+        role_name = principal.role_name
+        safe = request.method in _SAFE_METHODS
+        write = request.method in _WRITE_METHODS
+        update = request.method in _UPDATE_METHODS
+        # مدير المتجر ومدير الفرع وباقي موظفي الفروع
+        scoped_staff = role_name in ('store_manager', 'branch_manager') or principal.is_staff_role
+
         # صلاحيات المستخدمين (UserAccount)
         if isinstance(obj, UserAccount):
             # المستخدم يرى حسابه الخاص
-            if obj == user_account:
+            if obj.pk == principal.user_id:
                 return True
-            
-            # مدراء المتجر يرى المستخدمين في متجره (مدراء الفروع، الموظفين العامين)
-            if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'store_manager' and \
-               hasattr(user_account, 'store') and user_account.store: # Store manager has direct 'store' field on UserAccount
-                if hasattr(obj, 'employee_profile') and obj.employee_profile and obj.employee_profile.store == user_account.store:
-                    return True
-            
-            # مدير الفرع يرى المستخدمين في فرعه (الموظفين العامين)
-            if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'branch_manager' and \
-               hasattr(user_account, 'branch') and user_account.branch: # Branch manager has direct 'branch' field on UserAccount
-                if hasattr(obj, 'employee_profile') and obj.employee_profile and obj.employee_profile.branch == user_account.branch:
-                    return True
-            
-            # فريق عمل التطبيق يرى جميع المستخدمين (للقراءة فقط، والتعديل إذا كان لديه صلاحية عامة على ViewSet)
-            if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'app_staff':
-                return True # App staff can view all users, and their write access is determined by has_permission (which allows True for 'useraccount' basename)
-            
-            # صلاحيات التعديل (PUT, PATCH)
-            if request.method in ['PUT', 'PATCH']:
-                # مدير المتجر يمكنه تعديل موظفيه ضمن متجره (وليس مالكي المتاجر الآخرين، مدراء المتاجر، مدراء المشاريع، فريق عمل التطبيق)
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'store_manager' and \
-                   hasattr(user_account, 'store') and user_account.store:
-                    if hasattr(obj, 'employee_profile') and obj.employee_profile and obj.employee_profile.store == user_account.store:
-                        # لا يمكنه تعديل الأدوار العليا
-                        if obj.role and obj.role.role_name not in ['app_owner', 'store_account', 'project_manager', 'app_staff', 'store_manager', 'superuser']:
-                            return True
-                
-                # مدير الفرع يمكنه تعديل موظفيه ضمن فرعه (فقط الموظفين العامين والكاشير ومنظم الرفوف وموظفي خدمة العملاء)
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'branch_manager' and \
-                   hasattr(user_account, 'branch') and user_account.branch:
-                    if hasattr(obj, 'employee_profile') and obj.employee_profile and obj.employee_profile.branch == user_account.branch:
-                        if obj.role and obj.role.role_name in ['general_staff', 'cashier', 'shelf_organizer', 'customer_service']:
-                            return True
-                
-                # فريق عمل التطبيق يمكنه تعديل المستخدمين (وليس مالكي التطبيق أو المشرفين)
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'app_staff':
-                    if obj.role and obj.role.role_name not in ['app_owner', 'superuser', 'project_manager']:
-                        return True
-                return False
-
-            # صلاحيات الحذف (DELETE) (أكثر تقييدًا)
-            if request.method == 'DELETE':
-                # فريق عمل التطبيق يمكنه حذف المستخدمين (وليس مالكي التطبيق أو المشرفين)
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'app_staff':
-                    if obj.role and obj.role.role_name not in ['app_owner', 'superuser', 'project_manager']:
-                        return True
-                return False
-            return False # افتراضيًا، لا أحد آخر يمكنه التعديل/الحذف
+            # فريق عمل التطبيق يرى جميع المستخدمين (والكتابة تحددها has_permission)
+            if role_name == 'app_staff':
+                return True
+            employee = getattr(obj, 'employee_profile', None)
+            if employee is None:
+                return False
+            if safe:
+                # مدير المتجر يرى موظفي متجره، ومدير الفرع يرى موظفي فرعه
+                return (role_name == 'store_manager' and employee.store_id in principal.store_ids) or \
+                       (role_name == 'branch_manager' and employee.branch_id in principal.branch_ids)
+            if update and obj.role_id is not None:
+                # مدير المتجر يعدّل موظفي متجره ما عدا الأدوار العليا
+                if role_name == 'store_manager' and employee.store_id in principal.store_ids:
+                    return obj.role.role_name not in _PROTECTED_FROM_STORE_MANAGER
+                # مدير الفرع يعدّل موظفي فرعه (الموظفين العامين والكاشير ومنظم الرفوف وخدمة العملاء)
+                if role_name == 'branch_manager' and employee.branch_id in principal.branch_ids:
+                    return obj.role.role_name in _MANAGED_BY_BRANCH_MANAGER
+            return False # الحذف لفريق عمل التطبيق فقط
 
         # صلاحيات العملاء (Customer) - ملف التعريف
         if isinstance(obj, Customer):
-            if request.method in permissions.SAFE_METHODS: # Read
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'platform_customer' and obj.user_account == user_account:
-                    return True # Customer can view own profile
-                # Staff can view customers within their scope (handled by ViewSet queryset, but also here for obj-level)
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.is_staff_role and hasattr(user_account, 'employee_profile') and user_account.employee_profile:
-                    if user_account.role.role_name == 'store_manager' and user_account.employee_profile.store and \
-                       obj.customer_orders.filter(branch__store=user_account.employee_profile.store).exists(): # Assuming Customer has customer_orders relation
-                        return True
-                    if user_account.role.role_name in ['branch_manager', 'general_staff', 'cashier', 'customer_service', 'shelf_organizer'] and \
-                       user_account.employee_profile.branch and obj.customer_orders.filter(branch=user_account.employee_profile.branch).exists():
-                        return True
-                return False
-            if request.method in ['PUT', 'PATCH']: # Update
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'platform_customer' and obj.user_account == user_account:
-                    return True # Customer can update own profile (e.g., phone number)
-                return False # No other direct update by staff (managed via UserAccount admin or specific views)
-            if request.method == 'DELETE':
-                # Only app_owner/superuser/project_manager can delete customer profiles
-                return False # Deletion should be highly restricted
-            return False
+            # العميل يرى ويعدّل ملفه الخاص
+            if role_name == 'platform_customer' and obj.user_account_id == principal.user_id:
+                return safe or update
+            # الموظفون يرون العملاء الذين لهم طلبات في فروعهم
+            if safe and principal.is_staff_role and role_name in _BRANCH_SCOPED_ROLES:
+                return in_scope(obj, principal)
+            return False # حذف ملفات العملاء لمالك التطبيق ومدير المشروع فقط
 
         # صلاحيات المتاجر (Store)
         if isinstance(obj, Store):
-            if request.method in permissions.SAFE_METHODS:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'store_manager' and \
-                   hasattr(user_account, 'store') and user_account.store == obj:
-                    return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'app_staff': return True # فريق عمل التطبيق يمكنه رؤية جميع المتاجر
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'branch_manager' and \
-                   hasattr(user_account, 'branch') and user_account.branch and user_account.branch.store == obj:
-                    return True # مدير الفرع يمكنه رؤية متجره
-                # Other staff roles can see their store if they have a branch
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.is_staff_role and \
-                   user_account.role.role_name not in ['store_manager', 'branch_manager'] and \
-                   hasattr(user_account, 'branch') and user_account.branch and user_account.branch.store == obj:
+            if safe:
+                # فريق عمل التطبيق والعملاء يرون جميع المتاجر، والموظفون يرون متجرهم
+                if role_name in ('app_staff', 'platform_customer'):
                     return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'platform_customer': return True # Platform customer can see all stores
-                return False
-            if request.method in ['PUT', 'PATCH']:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'store_manager' and \
-                   hasattr(user_account, 'store') and user_account.store == obj:
-                    return True # مدير المتجر يمكنه تعديل متجره الخاص
-                return False
-            # لا أحد آخر يمكنه إنشاء/حذف المتاجر عبر API ViewSet (يتم ذلك عبر تسجيل مالك المتجر أو لوحة الإدارة)
-            return False
+                return scoped_staff and obj.pk in principal.store_ids
+            # مدير المتجر يعدّل متجره؛ إنشاء/حذف المتاجر لا يتم عبر الـ API
+            return update and role_name == 'store_manager' and obj.pk in principal.store_ids
 
         # صلاحيات الفروع (Branch)
         if isinstance(obj, Branch):
-            if request.method in permissions.SAFE_METHODS:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'store_manager' and \
-                   hasattr(user_account, 'store') and user_account.store == obj.store:
-                    return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'branch_manager' and \
-                   hasattr(user_account, 'branch') and user_account.branch == obj:
+            if safe:
+                if role_name in ('app_staff', 'platform_customer'):
                     return True
-                # Other staff roles can see their branch
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.is_staff_role and \
-                   user_account.role.role_name not in ['store_manager', 'branch_manager'] and \
-                   hasattr(user_account, 'branch') and user_account.branch == obj:
-                    return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'app_staff': return True # فريق عمل التطبيق يمكنه رؤية جميع الفروع
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'platform_customer': return True # Platform customer can see all branches
-                return False
-            if request.method in ['PUT', 'PATCH']:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'store_manager' and \
-                   hasattr(user_account, 'store') and user_account.store == obj.store:
-                    return True # مدير المتجر يمكنه تعديل فروع متجره
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'branch_manager' and \
-                   hasattr(user_account, 'branch') and user_account.branch == obj:
-                    return True # مدير الفرع يمكنه تعديل فرعه
-                return False
-            # لا أحد آخر يمكنه إنشاء/حذف الفروع عبر API ViewSet
+                if role_name == 'store_manager':
+                    return obj.store_id in principal.store_ids
+                return scoped_staff and obj.pk in principal.branch_ids
+            if update:
+                # مدير المتجر يعدّل فروع متجره، ومدير الفرع يعدّل فرعه
+                if role_name == 'store_manager':
+                    return obj.store_id in principal.store_ids
+                return role_name == 'branch_manager' and obj.pk in principal.branch_ids
             return False
 
         # صلاحيات الأقسام (Department)
         if isinstance(obj, Department):
-            if request.method in permissions.SAFE_METHODS:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'store_manager' and obj.branch and \
-                   hasattr(user_account, 'store') and user_account.store == obj.branch.store:
-                    return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'branch_manager' and obj.branch and \
-                   hasattr(user_account, 'branch') and user_account.branch == obj.branch:
-                    return True
-                # Other staff roles in the same branch
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.is_staff_role and \
-                   user_account.role.role_name not in ['store_manager', 'branch_manager'] and obj.branch and \
-                   hasattr(user_account, 'branch') and user_account.branch == obj.branch:
+            in_branch = obj.branch_id in principal.branch_ids
+            if safe:
+                if role_name in ('customer_service', 'platform_customer'):
                     return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'shelf_organizer' and hasattr(user_account, 'employee_profile') and user_account.employee_profile and user_account.employee_profile.department == obj:
-                    return True # منظم الرفوف يرى قسمه فقط
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'customer_service': return True # Customer service can see all departments
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'platform_customer': return True # العملاء يمكنهم رؤية جميع الأقسام
-                return False
-            if request.method in ['POST', 'PUT', 'PATCH', 'DELETE']: # Creation, Update, Delete
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'store_manager' and obj.branch and \
-                   hasattr(user_account, 'store') and user_account.store == obj.branch.store:
+                if scoped_staff and in_branch:
                     return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'branch_manager' and obj.branch and \
-                   hasattr(user_account, 'branch') and user_account.branch == obj.branch:
+                # منظم الرفوف يرى قسمه فقط
+                return role_name == 'shelf_organizer' and obj.pk in principal.department_ids
+            if write:
+                if role_name in ('store_manager', 'branch_manager') and in_branch:
                     return True
-                # منظم الرفوف يمكنه تعديل قسمه فقط في حالة وجود إذن محدد لذلك في الـ ViewSet
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'shelf_organizer' and hasattr(user_account, 'employee_profile') and user_account.employee_profile and obj == user_account.employee_profile.department:
-                    return request.method in ['PUT', 'PATCH'] # Assuming they can only update their own department
-                return False
+                # منظم الرفوف يمكنه تعديل قسمه فقط
+                return update and role_name == 'shelf_organizer' and obj.pk in principal.department_ids
+            return False
 
         # صلاحيات المنتجات (Product)
         if isinstance(obj, Product):
-            # صلاحيات القراءة:
-            if request.method in permissions.SAFE_METHODS:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'store_manager' and \
-                   hasattr(user_account, 'store') and user_account.store and \
-                   obj.branch_inventories.filter(branch__store=user_account.store).exists(): return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'branch_manager' and \
-                   hasattr(user_account, 'branch') and user_account.branch and \
-                   obj.branch_inventories.filter(branch=user_account.branch).exists(): return True
-                # Other staff roles in the same branch
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.is_staff_role and \
-                   user_account.role.role_name not in ['store_manager', 'branch_manager'] and \
-                   hasattr(user_account, 'branch') and user_account.branch and \
-                   obj.branch_inventories.filter(branch=user_account.branch).exists():
+            if safe:
+                if role_name in ('customer_service', 'platform_customer'):
                     return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'shelf_organizer' and \
-                   hasattr(user_account, 'employee_profile') and user_account.employee_profile and user_account.employee_profile.department and \
-                   obj.department == user_account.employee_profile.department and obj.branch_inventories.filter(branch=user_account.employee_profile.department.branch).exists(): return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'customer_service': return True # Customer service can see all products
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'platform_customer': return True # العملاء يمكنهم رؤية جميع المنتجات
-                return False
-            # صلاحيات التعديل/الحذف:
-            if request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'store_manager' and \
-                   hasattr(user_account, 'store') and user_account.store and \
-                   obj.branch_inventories.filter(branch__store=user_account.store).exists(): return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'branch_manager' and \
-                   hasattr(user_account, 'branch') and user_account.branch and \
-                   obj.branch_inventories.filter(branch=user_account.branch).exists(): return True
-                # GENERAL_STAFF (and specific sub-roles like Cashier, Shelf Organizer) should manage inventory via BranchProductInventory,
-                # not directly modify the Product object, unless it's very specific fields.
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.is_staff_role and \
-                   user_account.role.role_name not in ['store_manager', 'branch_manager'] and \
-                   hasattr(user_account, 'branch') and user_account.branch and \
-                   obj.branch_inventories.filter(branch=user_account.branch).exists():
-                    return request.method in ['PUT', 'PATCH'] # Allow update, but not create/delete
-                return False
+                if scoped_staff:
+                    return in_scope(obj, principal)
+                return role_name == 'shelf_organizer' and obj.department_id in principal.department_ids and \
+                    in_scope(obj, principal)
+            if write:
+                if role_name in ('store_manager', 'branch_manager'):
+                    return in_scope(obj, principal)
+                # باقي الموظفين يديرون المخزون عبر BranchProductInventory: تعديل المنتج فقط دون إنشاء/حذف
+                return update and principal.is_staff_role and in_scope(obj, principal)
+            return False
 
         # صلاحيات مخزون المنتج لكل فرع (BranchProductInventory)
         if isinstance(obj, BranchProductInventory):
-            # صلاحيات القراءة:
-            if request.method in permissions.SAFE_METHODS:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'store_manager' and obj.branch and \
-                   hasattr(user_account, 'store') and user_account.store == obj.branch.store: return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'branch_manager' and obj.branch and \
-                   hasattr(user_account, 'branch') and user_account.branch == obj.branch: return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.is_staff_role and \
-                   user_account.role.role_name not in ['store_manager', 'branch_manager'] and obj.branch and \
-                   hasattr(user_account, 'branch') and user_account.branch == obj.branch: return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'shelf_organizer' and obj.branch and \
-                   hasattr(user_account, 'employee_profile') and user_account.employee_profile and user_account.employee_profile.department and \
-                   obj.product.department == user_account.employee_profile.department and obj.branch == user_account.employee_profile.department.branch: return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'customer_service': return True # Customer service can see all inventory records
-                return False
-            # صلاحيات التعديل/الحذف:
-            if request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'store_manager' and obj.branch and \
-                   hasattr(user_account, 'store') and user_account.store == obj.branch.store: return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'branch_manager' and obj.branch and \
-                   hasattr(user_account, 'branch') and user_account.branch == obj.branch: return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.is_staff_role and \
-                   user_account.role.role_name not in ['store_manager', 'branch_manager'] and obj.branch and \
-                   hasattr(user_account, 'branch') and user_account.branch == obj.branch: return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'shelf_organizer' and obj.branch and \
-                   hasattr(user_account, 'employee_profile') and user_account.employee_profile and user_account.employee_profile.department and \
-                   obj.product.department == user_account.employee_profile.department and obj.branch == user_account.employee_profile.department.branch:
-                    return request.method in ['PUT', 'PATCH']
-                return False
-
-        # صلاحيات سلة الشراء (CustomerCart)
-        if isinstance(obj, CustomerCart):
-            if request.method in permissions.SAFE_METHODS:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'platform_customer' and obj.customer and obj.customer.user_account == user_account: return True
-                # Staff access via branch
-                if hasattr(obj, 'branch') and obj.branch and hasattr(user_account, 'role') and user_account.role and user_account.role.is_staff_role and hasattr(user_account, 'branch') and user_account.branch:
-                    if user_account.role.role_name == 'store_manager' and obj.branch.store == user_account.store: return True
-                    if user_account.role.role_name in ['general_staff', 'cashier', 'branch_manager', 'customer_service', 'shelf_organizer'] and obj.branch == user_account.branch: return True
-                return False
-            if request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'platform_customer' and obj.customer and obj.customer.user_account == user_account: return True
-                # Staff access via branch
-                if hasattr(obj, 'branch') and obj.branch and hasattr(user_account, 'role') and user_account.role and user_account.role.is_staff_role and hasattr(user_account, 'branch') and user_account.branch:
-                    if user_account.role.role_name == 'store_manager' and obj.branch.store == user_account.store: return True
-                    if user_account.role.role_name in ['general_staff', 'cashier', 'branch_manager', 'customer_service', 'shelf_organizer'] and obj.branch == user_account.branch: return True
-                return False
-
-        # صلاحيات عناصر سلة الشراء (CustomerCartItem)
-        if isinstance(obj, CustomerCartItem):
-            if request.method in permissions.SAFE_METHODS:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'platform_customer' and obj.cart and obj.cart.customer and obj.cart.customer.user_account == user_account: return True
-                # Staff access via cart's branch
-                if hasattr(obj.cart, 'branch') and obj.cart.branch and hasattr(user_account, 'role') and user_account.role and user_account.role.is_staff_role and hasattr(user_account, 'branch') and user_account.branch:
-                    if user_account.role.role_name == 'store_manager' and obj.cart.branch.store == user_account.store: return True
-                    if user_account.role.role_name in ['general_staff', 'cashier', 'branch_manager', 'customer_service', 'shelf_organizer'] and obj.cart.branch == user_account.branch: return True
-                return False
-            if request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'platform_customer' and obj.cart and obj.cart.customer and obj.cart.customer.user_account == user_account: return True
-                # Staff access via cart's branch
-                if hasattr(obj.cart, 'branch') and obj.cart.branch and hasattr(user_account, 'role') and user_account.role and user_account.role.is_staff_role and hasattr(user_account, 'branch') and user_account.branch:
-                    if user_account.role.role_name == 'store_manager' and obj.cart.branch.store == user_account.store: return True
-                    if user_account.role.role_name in ['general_staff', 'cashier', 'branch_manager', 'customer_service', 'shelf_organizer'] and obj.cart.branch == user_account.branch: return True
-                return False
-            return False
-
-        # صلاحيات الطلبات (Order)
-        if isinstance(obj, Order):
-            if request.method in permissions.SAFE_METHODS:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'platform_customer' and obj.customer and obj.customer.user_account == user_account: return True
-                # Staff access via branch
-                if hasattr(obj, 'branch') and obj.branch and hasattr(user_account, 'role') and user_account.role and user_account.role.is_staff_role and hasattr(user_account, 'branch') and user_account.branch:
-                    if user_account.role.role_name == 'store_manager' and obj.branch.store == user_account.store: return True
-                    if user_account.role.role_name in ['general_staff', 'cashier', 'branch_manager', 'customer_service', 'shelf_organizer'] and obj.branch == user_account.branch: return True
-                return False
-            if request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-                # Orders are typically created by cashiers, or finalized from temp orders.
-                # Deletion is highly restricted.
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name in ['cashier', 'general_staff', 'branch_manager', 'store_manager'] and \
-                   hasattr(obj, 'branch') and obj.branch and hasattr(user_account, 'branch') and user_account.branch: # Staff making/updating orders for their branch
-                    if user_account.role.role_name == 'store_manager' and obj.branch.store == user_account.store: return True
-                    if user_account.role.role_name in ['general_staff', 'cashier', 'branch_manager'] and obj.branch == user_account.branch: return True
-                return False
-            return False
-
-        # صلاحيات عناصر الطلب (OrderItem)
-        if isinstance(obj, OrderItem):
-            if request.method in permissions.SAFE_METHODS:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'platform_customer' and obj.order and obj.order.customer and obj.order.customer.user_account == user_account: return True
-                # Staff access via order's branch
-                if hasattr(obj.order, 'branch') and obj.order.branch and hasattr(user_account, 'role') and user_account.role and user_account.role.is_staff_role and hasattr(user_account, 'branch') and user_account.branch:
-                    if user_account.role.role_name == 'store_manager' and obj.order.branch.store == user_account.store: return True
-                    if user_account.role.role_name in ['general_staff', 'cashier', 'branch_manager', 'customer_service', 'shelf_organizer'] and obj.order.branch == user_account.branch: return True
-                return False
-            if request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name in ['cashier', 'general_staff', 'branch_manager', 'store_manager'] and \
-                   hasattr(obj.order, 'branch') and obj.order.branch and hasattr(user_account, 'branch') and user_account.branch:
-                    if user_account.role.role_name == 'store_manager' and obj.order.branch.store == user_account.store: return True
-                    if user_account.role.role_name in ['general_staff', 'cashier', 'branch_manager'] and obj.order.branch == user_account.branch: return True
-                return False
-            return False
-
-        # صلاحيات الطلبات المؤقتة (TempOrder)
-        if isinstance(obj, TempOrder):
-            if request.method in permissions.SAFE_METHODS:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'platform_customer' and obj.customer and obj.customer.user_account == user_account: return True
-                # Staff access via branch
-                if hasattr(obj, 'branch') and obj.branch and hasattr(user_account, 'role') and user_account.role and user_account.role.is_staff_role and hasattr(user_account, 'branch') and user_account.branch:
-                    if user_account.role.role_name == 'store_manager' and obj.branch.store == user_account.store: return True
-                    if user_account.role.role_name in ['general_staff', 'cashier', 'branch_manager', 'customer_service', 'shelf_organizer'] and obj.branch == user_account.branch: return True
-                return False
-            if request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name in ['cashier', 'general_staff', 'branch_manager', 'store_manager'] and \
-                   hasattr(obj, 'branch') and obj.branch and hasattr(user_account, 'branch') and user_account.branch:
-                    if user_account.role.role_name == 'store_manager' and obj.branch.store == user_account.store: return True
-                    if user_account.role.role_name in ['general_staff', 'cashier', 'branch_manager'] and obj.branch == user_account.branch: return True
-                return False
+            in_branch = obj.branch_id in principal.branch_ids
+            if scoped_staff and in_branch:
+                return safe or write
+            if safe and role_name == 'customer_service':
+                return True
+            # منظم الرفوف: مخزون منتجات قسمه في فرعه (التعديل فقط)
+            if role_name == 'shelf_organizer' and in_branch and obj.product.department_id in principal.department_ids:
+                return safe or update
             return False
 
-        # صلاحيات عناصر الطلب المؤقتة (TempOrderItem)
-        if isinstance(obj, TempOrderItem):
-            if request.method in permissions.SAFE_METHODS:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'platform_customer' and obj.temp_order and obj.temp_order.customer and obj.temp_order.customer.user_account == user_account: return True
-                # Staff access via temp_order's branch
-                if hasattr(obj.temp_order, 'branch') and obj.temp_order.branch and hasattr(user_account, 'role') and user_account.role and user_account.role.is_staff_role and hasattr(user_account, 'branch') and user_account.branch:
-                    if user_account.role.role_name == 'store_manager' and obj.temp_order.branch.store == user_account.store: return True
-                    if user_account.role.role_name in ['general_staff', 'cashier', 'branch_manager', 'customer_service', 'shelf_organizer'] and obj.temp_order.branch == user_account.branch: return True
-                return False
-            if request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name in ['cashier', 'general_staff', 'branch_manager', 'store_manager'] and \
-                   hasattr(obj.temp_order, 'branch') and obj.temp_order.branch and hasattr(user_account, 'branch') and user_account.branch:
-                    if user_account.role.role_name == 'store_manager' and obj.temp_order.branch.store == user_account.store: return True
-                    if user_account.role.role_name in ['general_staff', 'cashier', 'branch_manager'] and obj.temp_order.branch == user_account.branch: return True
-                return False
-            return False
+        # صلاحيات سلة الشراء (CustomerCart) وعناصرها (CustomerCartItem)
+        if isinstance(obj, (CustomerCart, CustomerCartItem)):
+            cart = obj if isinstance(obj, CustomerCart) else obj.cart
+            if not (safe or write):
+                return False
+            return _is_own(principal, cart.customer_id) or _is_branch_staff(principal, cart.branch_id)
+
+        # صلاحيات الطلبات (Order / TempOrder) وعناصرها (OrderItem / TempOrderItem)
+        if isinstance(obj, (Order, TempOrder, OrderItem, TempOrderItem)):
+            if isinstance(obj, OrderItem):
+                order = obj.order
+            elif isinstance(obj, TempOrderItem):
+                order = obj.temp_order
+            else:
+                order = obj
+            # الطلب المؤقت غير مرتبط بفرع: لا يصل إليه إلا صاحبه
+            if isinstance(order, TempOrder):
+                return order.created_by_id == principal.user_id or (safe and _is_own(principal, order.customer_id))
+            branch_id = order.branch_id
+            if safe:
+                return _is_own(principal, order.customer_id) or _is_branch_staff(principal, branch_id)
+            # الطلبات ينشئها ويعدّلها موظفو المبيعات في فروعهم
+            return write and role_name in _SALES_ROLES and branch_id in principal.branch_ids
 
         # صلاحيات فئات المنتجات (ProductCategory)
         if isinstance(obj, ProductCategory):
-            if request.method in permissions.SAFE_METHODS:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name in ['store_manager', 'branch_manager', 'general_staff', 'cashier', 'shelf_organizer', 'customer_service', 'platform_customer', 'app_staff']:
-                    return True # All relevant roles can view product categories
-                return False
-            if request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'app_staff':
-                    return True # Only app staff can manage product categories
-                return False
-            return False
+            if safe:
+                return role_name in ['store_manager', 'branch_manager', 'general_staff', 'cashier', 'shelf_organizer', 'customer_service', 'platform_customer', 'app_staff']
+            # فقط فريق عمل التطبيق يدير فئات المنتجات
+            return write and role_name == 'app_staff'
 
         # صلاحيات سجلات حركة المخزون (InventoryMovement)
         if isinstance(obj, InventoryMovement):
-            if request.method in permissions.SAFE_METHODS:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'store_manager' and \
-                   hasattr(user_account, 'store') and user_account.store and obj.branch and obj.branch.store == user_account.store: return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'branch_manager' and \
-                   hasattr(user_account, 'branch') and user_account.branch == obj.branch: return True
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name == 'shelf_organizer' and \
-                   hasattr(user_account, 'employee_profile') and user_account.employee_profile and user_account.employee_profile.branch == obj.branch: return True
-                return False
-            if request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-                # Inventory movements are usually created by staff (shelf_organizer, general_staff, branch_manager, store_manager)
-                # but direct API modification might be restricted to specific views/actions.
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name in ['store_manager', 'branch_manager', 'shelf_organizer', 'general_staff'] and \
-                   hasattr(user_account, 'branch') and user_account.branch == obj.branch:
-                    return True # Allow staff to create/update movements within their branch
-                return False
-            return False
+            in_branch = obj.branch_id in principal.branch_ids
+            if safe:
+                return in_branch and role_name in ['store_manager', 'branch_manager', 'shelf_organizer']
+            # يسجّلها الموظفون ضمن فرعهم
+            return write and in_branch and role_name in ['store_manager', 'branch_manager', 'shelf_organizer', 'general_staff']
 
         # صلاحيات ملفات تعريف صلاحيات المتجر (StorePermissionProfile)
         if isinstance(obj, StorePermissionProfile):
-            if request.method in permissions.SAFE_METHODS:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name in ['app_owner', 'project_manager', 'app_staff']:
-                    return True # These roles can view permission profiles
-                return False
-            if request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name in ['app_owner', 'project_manager']:
-                    return True # Only app owner/project manager can create/update/delete these
-                return False
-            return False
+            # الإدارة لمالك التطبيق ومدير المشروع فقط
+            return safe and role_name == 'app_staff'
 
         # صلاحيات ملفات تعريف صلاحيات الفرع (BranchPermissionProfile)
         if isinstance(obj, BranchPermissionProfile):
-            if request.method in permissions.SAFE_METHODS:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name in ['app_owner', 'project_manager', 'app_staff', 'store_manager']:
-                    return True # These roles can view permission profiles
-                return False
-            if request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-                if hasattr(user_account, 'role') and user_account.role and user_account.role.role_name in ['app_owner', 'project_manager', 'store_manager']:
-                    return True # Only app owner/project manager/store manager can create/update/delete these
-                return False
-            return False
-
+            if safe:
+                return role_name in ['app_staff', 'store_manager']
+            return write and role_name == 'store_manager'
 
-        return False # رفض الوصول لأي كائن لم يتم تحديده صراحةً
\ No newline at end of file
+        return False # رفض الوصول لأي كائن لم يتم تحديده صراحةً
@@ -210,6 +210,10 @@ REST_FRAMEWORK = {
     )
 }
 
+# Cursor pagination (mysite.pagination.TimestampCursorPagination) for high-volume list endpoints
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+
 # IMPORTANT: Specify your custom user model
 AUTH_USER_MODEL = 'users.UserAccount' # <--- تم تعديل هذا السطر: يشير إلى UserAccount الآن
 
@@ -300,8 +304,65 @@ Maps_API_KEY = os.environ.get('Maps_API_KEY')
 # === QR Code Settings ===
 RETURN_QR_CODE_VALIDITY_DAYS = 30
 
+# >>> Shared Cache <<<
+# مطلوب في الإنتاج: ذاكرة التخزين يجب أن تكون مشتركة بين كل العمليات (gunicorn workers و django_q)،
+# فهي تحمل أرقام إصدار products.scan_cache و stores.geo ونسخ authentication.principal وعدادات
+# المنتجات الساخنة (products.inventory). LocMemCache الافتراضي خاص بكل عملية فلا تصل الإلغاءات إلى غيرها.
+# REDIS_URL يختار Redis، وإلا فجدول في قاعدة البيانات (تنشئه products/migrations/0015_create_cache_table.py،
+# أو python manage.py createcachetable).
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }
+    }
+
 # >>> Barcode Scan Settings <<<
 MAX_BARCODE_SCAN_DISTANCE_KM = Decimal('0.01')
+# Entries kept in each process's barcode/QR lookup cache (products.scan_cache)
+SCAN_CACHE_MAX_ENTRIES = 5000
+# How often each process re-reads the shared scan cache version; changes made by other
+# processes reach a cashier's scans within this many seconds (same-process changes at once)
+SCAN_CACHE_VERSION_CHECK_SECONDS = 5
+# Branch geofence lookups use a per-process grid (stores.geo); False queries a bounding box instead
+BRANCH_GEOFENCE_IN_MEMORY = True
+
+# >>> Product Import Jobs (products.tasks.run_import_job) <<<
+# A RUNNING job with no checkpoint for this long is re-queued and resumes from its last committed chunk
+IMPORT_JOB_STALL_MINUTES = 10
+
+# >>> Product Search Settings (products.search) <<<
+PRODUCT_SEARCH_DEFAULT_RESULTS = 20
+PRODUCT_SEARCH_MAX_RESULTS = 100
+
+# >>> Offline POS Catalogue (products.catalogue) <<<
+# ?since= deltas re-send rows written this many seconds before the version, to cover late commits
+CATALOGUE_SYNC_OVERLAP_SECONDS = 120
+
+# >>> Product Image Renditions (products.renditions) <<<
+# Size name -> longest side in pixels; each size is rendered as WebP and JPEG
+PRODUCT_IMAGE_RENDITION_SIZES = {'thumb': 160, 'small': 320, 'medium': 640, 'large': 1280}
+PRODUCT_IMAGE_RENDITION_QUALITY = 80
+
+# >>> Inventory Locking Settings <<<
+# Lock waits at or above this many milliseconds are logged as warnings (products.inventory)
+INVENTORY_LOCK_WAIT_WARNING_MS = 200
+# Scanned/cart items hold stock for this long without activity before the reaper releases them
+STOCK_RESERVATION_TTL_MINUTES = 30
+# Hot SKU mode: a row whose lock wait reaches HOT_SKU_LOCK_WAIT_MS this many times within the window
+# is split into HOT_SKU_BUCKET_COUNT independently-decremented buckets
+HOT_SKU_LOCK_WAIT_MS = 100
+HOT_SKU_PROMOTION_HITS = 5
+HOT_SKU_PROMOTION_WINDOW_SECONDS = 60
+HOT_SKU_BUCKET_COUNT = 8
 
 # --- Django-Q Settings ---
 Q_CLUSTER = {
@@ -313,6 +374,8 @@ Q_CLUSTER = {
     'bulk': 10,
     'orm': 'default',
 }
+# django_q لا يقرأ هذا الإعداد: المهام الدورية صفوف Schedule (django_q) تُنشئها ترحيلات البيانات،
+# مثل products/migrations/0011_schedule_expire_stock_reservations.py
 Q_SCHEDULE = [
     {
         'func': 'integrations.tasks.sync_products_with_accounting_software', # Full path to the function
@@ -346,6 +409,13 @@ FIREBASE_ADMIN_SDK_CONFIG = BASE_DIR / 'firebase_keys' / 'mys-f-s111p-firebase-a
 # Your Firebase project ID (found in Firebase Console -> Project settings)
 FIREBASE_PROJECT_ID = os.environ.get('FIREBASE_PROJECT_ID', 'mys-f-s111p')
 
+# Verified ID tokens are reused until their own expiry (authentication.token_cache)
+FIREBASE_TOKEN_CACHE_MAX_ENTRIES = 10000
+# The Django user resolved for a cached token is reused this long before it is loaded again
+FIREBASE_USER_CACHE_SECONDS = 60
+# Role and store/branch/department scope of a user (authentication.principal) is cached this long
+PRINCIPAL_CACHE_SECONDS = 60
+
 
 # --- Firebase Admin SDK Initialization ---
 # This ensures Firebase Admin SDK is initialized only once when Django starts
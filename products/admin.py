@@ -10,6 +10,7 @@ from django.db.models import Sum # لاستخدام Sum في display_current_sto
 
 # استيراد النماذج التي تنتمي لتطبيق products
 from .models import Department, Product, ProductCategory, BranchProductInventory, InventoryMovement
+from .renditions import has_current_digest, rendition_urls
 
 # استيراد نموذج Branch من تطبيق stores
 from stores.models import Store, Branch # استيراد Store و Branch
@@ -424,7 +425,9 @@ class ProductAdmin(admin.ModelAdmin):
 
     def display_image(self, obj):
         if obj.image:
-            return format_html('<img src="{}" width="50" height="50" style="border-radius: 5px;" />', obj.image.url)
+            # المقاس المصغر بدلاً من الصورة الأصلية (إن تم إنشاؤه)
+            url = rendition_urls(obj)['thumb']['jpeg'] if has_current_digest(obj) else obj.image.url
+            return format_html('<img src="{}" width="50" height="50" style="border-radius: 5px;" />', url)
         return _("No Image")
     display_image.short_description = _('Image')
 
@@ -4,4 +4,7 @@ from django.apps import AppConfig
 
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'products' # تأكد أن هذا يطابق اسم مجلد التطبيق
\ No newline at end of file
+    name = 'products' # تأكد أن هذا يطابق اسم مجلد التطبيق
+
+    def ready(self):
+        import products.signals
@@ -0,0 +1,98 @@
+# products/catalogue.py
+"""
+Branch catalogue snapshots for offline POS terminals.
+
+A snapshot lists every product stocked in the branch as compact rows (amounts in
+halalas, VAT rate in 1/10000) and carries a version: the server time, in
+microseconds, at which it was read. A terminal sends it back as ?since= and gets
+only the products whose row, branch inventory or offer window changed since then.
+Deletions are not tracked: a terminal whose product count differs from
+`product_count` asks for a full snapshot again.
+"""
+import gzip
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .inventory import annotate_on_hand
+from .models import BranchProductInventory, Product
+from .pricing import PRICE_UNIT_COLUMNS, annotate_price_units, compute_prices_for_rows
+
+CATALOGUE_FORMAT = 1
+CATALOGUE_COLUMNS = ('id', 'barcode', 'name', 'price', 'vat_rate', 'total_price', 'quantity')
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def version_for(moment):
+    return (moment - _EPOCH) // timedelta(microseconds=1)
+
+
+def moment_for(version):
+    return _EPOCH + timedelta(microseconds=version)
+
+
+def _changed_since(stocked, since, today):
+    """
+    Products changed after `since`: the product row, its inventory row in the branch,
+    or an offer that started/ended since then (the price changes without a write).
+    Hot SKUs are always included, their bucket decrements do not touch the inventory row.
+    """
+    # تداخل زمني لتغطية المعاملات التي بدأت قبل `since` ولم تُثبَّت إلا بعده
+    cutoff = moment_for(since) - timedelta(seconds=getattr(settings, 'CATALOGUE_SYNC_OVERLAP_SECONDS', 120))
+    changed = Q(updated_at__gt=cutoff) | Exists(stocked.filter(Q(updated_at__gt=cutoff) | Q(is_hot=True)))
+    since_date = timezone.localdate(moment_for(since))
+    if since_date < today:
+        changed |= Q(offer_start_date__gt=since_date, offer_start_date__lte=today)
+        changed |= Q(offer_end_date__gte=since_date, offer_end_date__lt=today)
+    return changed
+
+
+def build_snapshot(branch_id, since=None):
+    """
+    Full catalogue of the branch, or only the products changed since version `since`.
+    One query for the rows (prices and stock computed by the database), plus a count for deltas.
+    """
+    now = timezone.now()
+    today = timezone.localdate(now)
+    stocked = BranchProductInventory.objects.filter(branch_id=branch_id, product_id=OuterRef('pk'))
+    products = Product.objects.filter(Exists(stocked))
+    product_count = None
+    if since is not None:
+        product_count = products.count()
+        products = products.filter(_changed_since(stocked, since, today))
+
+    on_hand = annotate_on_hand(stocked).values('on_hand_quantity')[:1]
+    rows = list(
+        annotate_price_units(products)
+        .annotate(_quantity=Subquery(on_hand))
+        .order_by('pk')
+        .values_list('pk', 'barcode', 'name', '_quantity', *PRICE_UNIT_COLUMNS)
+    )
+    batch = compute_prices_for_rows([row[4:] for row in rows], today=today)
+    net = batch.net_halalas()
+    gross = batch.gross_halalas()
+    vat_rate_index = 4 + PRICE_UNIT_COLUMNS.index('_vat_units')
+
+    return {
+        'format': CATALOGUE_FORMAT,
+        'branch': str(branch_id),
+        'version': version_for(now),
+        'since': since,
+        'full': since is None,
+        'valid_on': today.isoformat(),
+        'columns': CATALOGUE_COLUMNS,
+        'product_count': len(rows) if product_count is None else product_count,
+        'products': [
+            [row[0], row[1], row[2], int(net[index]), row[vat_rate_index], int(gross[index]), row[3] or 0]
+            for index, row in enumerate(rows)
+        ],
+    }
+
+
+def encode_snapshot(snapshot, compress=True):
+    """Compact JSON, gzip-compressed unless the client does not accept it."""
+    payload = json.dumps(snapshot, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return gzip.compress(payload, compresslevel=6) if compress else payload
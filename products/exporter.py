@@ -0,0 +1,82 @@
+# products/exporter.py
+"""
+Streaming catalogue/inventory export for a branch or a whole store.
+
+Rows come from a server-side cursor (.iterator(chunk_size=...)) and are written as
+they are read, so memory does not grow with the export. The columns use the same
+titles as products.importer.COLUMNS, so an exported branch file imports back as is.
+"""
+import csv
+import tempfile
+
+import openpyxl
+from django.utils.translation import gettext_lazy as _
+
+from .importer import COLUMNS
+from .inventory import annotate_on_hand
+from .models import BranchProductInventory
+
+EXPORT_CHUNK_SIZE = 2000
+
+# (importer column key, value path on the annotated BranchProductInventory queryset)
+EXPORT_FIELDS = (
+    ('barcode', 'product__barcode'),
+    ('item_number', 'product__item_number'),
+    ('name', 'product__name'),
+    ('price', 'product__price'),
+    ('department', 'product__department__name'),
+    ('category', 'product__category__name'),
+    ('vat_rate', 'product__vat_rate'),
+    ('quantity', 'on_hand_quantity'),
+)
+BRANCH_COLUMN = _("Branch Name")
+
+
+def export_rows(branch=None, store=None):
+    """
+    Yields the header, then one tuple per inventory row of the branch (or of every branch of the store).
+    Store exports add a branch column, which the importer ignores.
+    """
+    queryset = BranchProductInventory.objects.all()
+    if branch is not None:
+        queryset = queryset.filter(branch=branch)
+    elif store is not None:
+        queryset = queryset.filter(branch__store=store)
+    paths = [path for _key, path in EXPORT_FIELDS]
+    header = [str(COLUMNS[key]) for key, _path in EXPORT_FIELDS]
+    if branch is None:
+        paths.append('branch__name')
+        header.append(str(BRANCH_COLUMN))
+
+    yield header
+    rows = annotate_on_hand(queryset).order_by('branch_id', 'product_id').values_list(*paths)
+    yield from rows.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+class _Echo:
+    """File-like object whose write() returns the value, so csv.writer can feed a generator."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Echo())
+    yield '\ufeff'  # BOM حتى يعرض Excel النصوص العربية بشكل صحيح
+    for row in rows:
+        yield writer.writerow(['' if value is None else value for value in row])
+
+
+def build_xlsx(rows):
+    """
+    Writes the rows with an openpyxl write_only workbook into an anonymous temporary file
+    (rows go to disk as they are appended) and returns the file, rewound.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=str(_("Products")))
+    for row in rows:
+        sheet.append(row)
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
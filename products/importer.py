@@ -0,0 +1,351 @@
+# products/importer.py
+"""
+Streaming product/inventory import from Excel sheets (ProductUploadExcelView).
+
+Rows are read with openpyxl in read-only mode and written in chunks with
+bulk_create/bulk_update: a chunk costs a handful of queries whatever its size,
+and memory stays bounded by the chunk, not the sheet.
+"""
+import logging
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+import openpyxl
+from django.db import transaction
+from django.utils import timezone
+from django.utils import translation
+from django.utils.translation import gettext, gettext_lazy as _
+
+from .inventory import demote_from_hot
+from .models import BranchProductInventory, Department, Product, ProductCategory
+from .scan_cache import invalidate_scan_cache
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = 1000
+DEFAULT_VAT_RATE = Decimal('0.1500')
+
+# مفتاح داخلي -> عنوان العمود في ملف Excel (نفس العناوين المستخدمة في التصدير)
+COLUMNS = {
+    'barcode': _("Barcode"),
+    'item_number': _("Item Number"),
+    'name': _("Product Name"),
+    'price': _("Base Price"),
+    'department': _("Department Name"),
+    'category': _("Category Name"),
+    'vat_rate': _("VAT Rate (as decimal)"),
+    'quantity': _("Quantity in Stock"),
+}
+
+PRODUCT_IMPORT_FIELDS = ['name', 'price', 'department', 'category', 'last_updated_by', 'vat_rate', 'barcode', 'item_number']
+
+
+def iter_sheet_rows(file):
+    """
+    Yields the header row, then each data row as a tuple of values, from the active sheet.
+    """
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def column_positions(header):
+    """
+    Maps the internal column keys to their index in the header row.
+    Headers match either the translated or the English column title.
+    """
+    titles = {str(label): key for key, label in COLUMNS.items()}
+    with translation.override('en'):
+        for key, label in COLUMNS.items():
+            titles.setdefault(str(label), key)
+    return {
+        titles[str(value).strip()]: index
+        for index, value in enumerate(header or ())
+        if value is not None and str(value).strip() in titles
+    }
+
+
+def _text(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # barcodes typed as numbers come back as floats
+    return str(value).strip() or None
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.inventory_records = 0
+        self.rows = 0
+        self.errors = []  # (row number, message)
+
+    def add_error(self, row_idx, message):
+        self.errors.append((row_idx, message))
+
+    def error_messages(self):
+        return [message for _row, message in self.errors]
+
+
+class ProductImporter:
+    """
+    Imports product rows into one branch. Product lookups use barcode/item_number maps
+    loaded once; departments and categories are cached by name.
+    """
+
+    def __init__(self, branch, user, chunk_size=IMPORT_CHUNK_SIZE):
+        self.branch = branch
+        self.user = user
+        self.chunk_size = chunk_size
+        self.today = timezone.localdate()
+        self._departments = None
+        self._categories = None
+        self._by_barcode = None
+        self._by_item_number = None
+
+    # --- lookups ---
+    def _load_lookups(self):
+        self._departments = {}
+        for department in Department.objects.filter(branch=self.branch).order_by('pk'):
+            self._departments.setdefault(department.name, department)
+        self._categories = {category.name: category for category in ProductCategory.objects.all()}
+        self._by_barcode = {}
+        self._by_item_number = {}
+        for pk, barcode, item_number in Product.objects.values_list('pk', 'barcode', 'item_number').iterator(chunk_size=10000):
+            if barcode:
+                self._by_barcode[barcode] = pk
+            if item_number:
+                self._by_item_number[item_number] = pk
+
+    def _department(self, name):
+        if not name:
+            return None
+        if name not in self._departments:
+            self._departments[name], _created = Department.objects.get_or_create(branch=self.branch, name=name)
+        return self._departments[name]
+
+    def _category(self, name):
+        if not name:
+            return None
+        if name not in self._categories:
+            self._categories[name], _created = ProductCategory.objects.get_or_create(name=name)
+        return self._categories[name]
+
+    # --- parsing ---
+    def parse_row(self, row_idx, values, positions, result):
+        """
+        Returns the cleaned row dict, or None (with an error recorded) if the row is skipped.
+        """
+        def value(key):
+            index = positions.get(key)
+            return values[index] if index is not None and index < len(values) else None
+
+        barcode = _text(value('barcode'))
+        item_number = _text(value('item_number'))
+        name = _text(value('name'))
+        price = value('price')
+
+        if not name or price is None:  # Price can be 0, so check for None
+            result.add_error(row_idx, gettext("Row %(row)s: Product Name or Price missing. Skipping.") % {'row': row_idx})
+            return None
+        if not (barcode or item_number):
+            result.add_error(row_idx, gettext("Row %(row)s: Barcode or Item Number is required for product identification. Skipping.") % {'row': row_idx})
+            return None
+        try:
+            price = Decimal(str(price)).quantize(Decimal('0.01'))
+            if price < 0:
+                raise ValueError("Price cannot be negative.")
+        except (TypeError, ValueError, InvalidOperation):
+            result.add_error(row_idx, gettext("Row %(row)s: Invalid price format. Skipping.") % {'row': row_idx})
+            return None
+
+        vat_rate = value('vat_rate')
+        try:
+            vat_rate = Decimal(str(vat_rate)).quantize(Decimal('0.0001')) if vat_rate is not None else DEFAULT_VAT_RATE
+            if not (Decimal('0.0000') <= vat_rate <= Decimal('1.0000')):
+                raise ValueError("VAT rate out of range.")
+        except (TypeError, ValueError, InvalidOperation):
+            result.add_error(row_idx, gettext("Row %(row)s: Invalid VAT rate format. Using default 0.15.") % {'row': row_idx})
+            vat_rate = DEFAULT_VAT_RATE
+
+        quantity = value('quantity')
+        if quantity is not None:
+            try:
+                quantity = int(quantity)
+                if quantity < 0:
+                    raise ValueError("Quantity cannot be negative.")
+            except (TypeError, ValueError):
+                result.add_error(row_idx, gettext("Row %(row)s: Invalid quantity format for product '%(name)s'. Using 0.") % {'row': row_idx, 'name': name})
+                quantity = 0
+
+        return {
+            'row': row_idx,
+            'barcode': barcode,
+            'item_number': item_number,
+            'name': name,
+            'price': price,
+            'vat_rate': vat_rate,
+            'department': _text(value('department')),
+            'category': _text(value('category')),
+            'quantity': quantity,
+        }
+
+    # --- writing ---
+    def _match(self, row, result):
+        """
+        Existing product id for the row (barcode first, then item number), None for a new product,
+        or False if barcode and item number belong to two different products.
+        """
+        by_barcode = self._by_barcode.get(row['barcode']) if row['barcode'] else None
+        by_item_number = self._by_item_number.get(row['item_number']) if row['item_number'] else None
+        if by_barcode and by_item_number and by_barcode != by_item_number:
+            result.add_error(row['row'], gettext("Row %(row)s: Barcode and Item Number belong to different products. Skipping.") % {'row': row['row']})
+            return False
+        return by_barcode or by_item_number
+
+    def _apply(self, product, row):
+        product.name = row['name']
+        product.price = row['price']
+        product.vat_rate = row['vat_rate']
+        product.department = self._department(row['department'])
+        product.category = self._category(row['category'])
+        product.last_updated_by = self.user
+        if row['barcode']:
+            product.barcode = row['barcode']
+        if row['item_number']:
+            product.item_number = row['item_number']
+        product.refresh_effective_price(today=self.today, save=False)
+
+    def write_chunk(self, rows, result):
+        """
+        Upserts one chunk of parsed rows (products, then this branch's inventory) in one transaction.
+        """
+        matched = [(row, self._match(row, result)) for row in rows]
+        matched = [(row, pk) for row, pk in matched if pk is not False]
+        existing = Product.objects.in_bulk([pk for _row, pk in matched if pk])
+
+        to_update = {}
+        to_create = []
+        # new products of this chunk by barcode / item number, so repeated rows create them once
+        pending = {'barcode': {}, 'item_number': {}}
+        row_products = []
+        for row, pk in matched:
+            if pk:
+                product = existing[pk]
+                to_update[pk] = product
+            else:
+                product = (
+                    pending['barcode'].get(row['barcode']) if row['barcode'] else None
+                ) or (
+                    pending['item_number'].get(row['item_number']) if row['item_number'] else None
+                )
+                if product is None:
+                    product = Product()
+                    to_create.append(product)
+            self._apply(product, row)
+            if not pk:
+                for key in ('barcode', 'item_number'):
+                    if row[key]:
+                        pending[key][row[key]] = product
+            row_products.append((row, product))
+
+        with transaction.atomic():
+            if to_update:
+                now = timezone.now()
+                for product in to_update.values():
+                    product.updated_at = now
+                Product.objects.bulk_update(
+                    list(to_update.values()),
+                    PRODUCT_IMPORT_FIELDS + list(Product.EFFECTIVE_PRICE_FIELDS) + ['updated_at'],
+                )
+            if to_create:
+                Product.objects.bulk_create(to_create)
+            self._write_inventory(row_products, result)
+
+        for product in to_create + list(to_update.values()):
+            if product.barcode:
+                self._by_barcode[product.barcode] = product.pk
+            if product.item_number:
+                self._by_item_number[product.item_number] = product.pk
+        result.updated += len(to_update)
+        result.created += len(to_create)
+
+    def _write_inventory(self, row_products, result):
+        quantities = {}
+        for row, product in row_products:
+            if row['quantity'] is not None:
+                quantities[product.pk] = row['quantity']
+        if not quantities:
+            return
+
+        inventories = {
+            inventory.product_id: inventory
+            for inventory in BranchProductInventory.objects.filter(branch=self.branch, product_id__in=quantities)
+        }
+        for inventory in inventories.values():
+            if inventory.is_hot:
+                # الكمية المستوردة تحل محل الكمية الكلية، فتُدمج الـ buckets في الصف أولاً
+                inventories[inventory.product_id] = demote_from_hot(inventory.pk)
+
+        now = timezone.now()
+        to_update = []
+        to_create = []
+        for product_id, quantity in quantities.items():
+            inventory = inventories.get(product_id)
+            if inventory is None:
+                to_create.append(BranchProductInventory(
+                    product_id=product_id, branch=self.branch, quantity=quantity, last_updated_by=self.user
+                ))
+            else:
+                inventory.quantity = quantity
+                inventory.last_updated_by = self.user
+                inventory.updated_at = now
+                to_update.append(inventory)
+        if to_update:
+            BranchProductInventory.objects.bulk_update(to_update, ['quantity', 'last_updated_by', 'updated_at'])
+        if to_create:
+            BranchProductInventory.objects.bulk_create(to_create)
+        result.inventory_records += len(quantities)
+
+    def run(self, rows, positions, start_row=2, result=None, on_chunk=None):
+        """
+        Imports data rows (header already consumed); row numbers start at `start_row`.
+        `positions` comes from column_positions(header).
+        `on_chunk(result, next_row)` is called after each committed chunk.
+        """
+        result = result or ImportResult()
+        if self._by_barcode is None:
+            self._load_lookups()
+        row_idx = start_row
+        rows = iter(rows)
+        try:
+            while True:
+                raw_chunk = list(islice(rows, self.chunk_size))
+                if not raw_chunk:
+                    break
+                parsed = []
+                for values in raw_chunk:
+                    if values and any(v is not None for v in values):
+                        row = self.parse_row(row_idx, values, positions, result)
+                        if row:
+                            parsed.append(row)
+                    row_idx += 1
+                result.rows += len(raw_chunk)
+                if parsed:
+                    self.write_chunk(parsed, result)
+                if on_chunk:
+                    on_chunk(result, row_idx)
+        finally:
+            if result.created or result.updated:
+                invalidate_scan_cache()
+        return result
+
+    def import_file(self, file):
+        """
+        Reads the active sheet of an uploaded workbook and imports it. Returns an ImportResult.
+        """
+        rows = iter_sheet_rows(file)
+        return self.run(rows, column_positions(next(rows, None)))
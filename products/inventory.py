@@ -0,0 +1,495 @@
+# products/inventory.py
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from django_q.tasks import async_task
+
+from .models import BranchProductInventory, InventoryBucket, InventoryMovement, Product, StockReservation
+
+logger = logging.getLogger(__name__)
+
+
+def _pairs_condition(pairs):
+    by_branch = defaultdict(set)
+    for branch_id, product_id in pairs:
+        by_branch[branch_id].add(product_id)
+    condition = Q()
+    for branch_id, product_ids in by_branch.items():
+        condition |= Q(branch_id=branch_id, product_id__in=product_ids)
+    return condition if by_branch else None
+
+
+# === Locking ===
+# كل مسارات تعديل المخزون تقفل الصفوف بنفس الترتيب (branch_id, product_id)
+# حتى لا يحدث deadlock بين عمليتي دفع تشتركان في نفس المنتجات.
+def lock_inventories(pairs):
+    """
+    Locks the BranchProductInventory rows for the given (branch_id, product_id) pairs
+    in one SELECT ... FOR UPDATE ordered by (branch_id, product_id), and returns them
+    keyed by that pair. Hot SKUs are not locked here (see the hot SKU section).
+    Must be called inside transaction.atomic().
+    """
+    condition = _pairs_condition(pairs)
+    if condition is None:
+        return {}
+
+    queryset = (
+        BranchProductInventory.objects.select_for_update()
+        .filter(condition, is_hot=False)
+        .only('id', 'product_id', 'branch_id', 'quantity', 'is_hot')
+        .order_by('branch_id', 'product_id')
+    )
+    started = time.perf_counter()
+    rows = list(queryset)
+    _record_lock_wait((time.perf_counter() - started) * 1000, rows)
+    return {(row.branch_id, row.product_id): row for row in rows}
+
+
+def _record_lock_wait(wait_ms, rows):
+    threshold = getattr(settings, 'INVENTORY_LOCK_WAIT_WARNING_MS', 200)
+    if wait_ms >= threshold:
+        logger.warning(f"Inventory lock wait {wait_ms:.1f}ms for {len(rows)} rows")
+    else:
+        logger.debug(f"Inventory lock wait {wait_ms:.1f}ms for {len(rows)} rows")
+
+    if wait_ms >= getattr(settings, 'HOT_SKU_LOCK_WAIT_MS', 100):
+        for row in rows:
+            _note_contention(row.pk)
+
+
+def _note_contention(inventory_id):
+    """
+    Counts slow lock acquisitions per row; once a row crosses HOT_SKU_PROMOTION_HITS
+    within the window it is promoted to hot SKU mode in the background.
+    """
+    key = f"inventory:contention:{inventory_id}"
+    cache.add(key, 0, timeout=getattr(settings, 'HOT_SKU_PROMOTION_WINDOW_SECONDS', 60))
+    try:
+        hits = cache.incr(key)
+    except ValueError:
+        return
+    if hits >= getattr(settings, 'HOT_SKU_PROMOTION_HITS', 5):
+        cache.delete(key)
+        transaction.on_commit(lambda: async_task('products.tasks.promote_hot_inventory', inventory_id))
+
+
+# === Set-based quantity update ===
+def _update_quantities(deltas):
+    """
+    Applies {inventory_id: quantity_delta} in one UPDATE statement.
+    """
+    if not deltas:
+        return
+    table = BranchProductInventory._meta.db_table
+    if connection.vendor == 'postgresql':
+        values_sql = ', '.join(['(%s::bigint, %s::integer)'] * len(deltas))
+        params = [value for item in sorted(deltas.items()) for value in item]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE "{table}" AS inv '
+                f'SET quantity = inv.quantity + v.delta, updated_at = NOW() '
+                f'FROM (VALUES {values_sql}) AS v(id, delta) '
+                f'WHERE inv.id = v.id',
+                params,
+            )
+        return
+    # Other backends: same single statement expressed with CASE
+    BranchProductInventory.objects.filter(pk__in=deltas).update(
+        quantity=F('quantity') + Case(
+            *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+# === Stock changes ===
+def apply_stock_changes(changes, movement_type=None, reason='', moved_by=None, clamp_at_zero=False):
+    """
+    Applies {(branch_id, product_id): quantity_change} with one locking query and one UPDATE.
+    Hot SKUs are changed through their buckets instead of the locked row.
+    If movement_type is given, the InventoryMovement rows are bulk-inserted as well.
+    Raises ValidationError if a row is missing or would go negative, unless clamp_at_zero.
+    """
+    changes = {key: change for key, change in changes.items() if change}
+    if not changes:
+        return []
+
+    hot = _hot_inventories(changes)
+    inventories = lock_inventories([key for key in changes if key not in hot])
+    # صف تمت ترقيته إلى hot بين القراءة والقفل
+    unresolved = [key for key in changes if key not in hot and key not in inventories]
+    if unresolved:
+        hot.update(_hot_inventories(unresolved))
+
+    missing = [key for key in changes if key not in inventories and key not in hot]
+    if missing:
+        names = ', '.join(Product.objects.filter(pk__in=[key[1] for key in missing]).values_list('name', flat=True))
+        raise ValidationError(
+            _("Product inventory not found in the branch for: %(products)s") % {'products': names}
+        )
+
+    deltas = {}
+    movements = []
+    for key in sorted(changes):
+        branch_id, product_id = key
+        change = changes[key]
+        if key in hot:
+            inventory = hot[key]
+            old_quantity, change = _apply_hot_change(inventory, change, clamp_at_zero)
+        else:
+            inventory = inventories[key]
+            old_quantity = inventory.quantity
+            change = _checked_change(product_id, branch_id, old_quantity, change, clamp_at_zero)
+            if change:
+                deltas[inventory.pk] = change
+                inventory.quantity = old_quantity + change
+
+        if change and movement_type:
+            movements.append(InventoryMovement(
+                inventory=inventory,
+                product_id=product_id,
+                branch_id=branch_id,
+                movement_type=movement_type,
+                quantity_change=change,
+                old_quantity=old_quantity,
+                new_quantity=old_quantity + change,
+                reason=reason,
+                moved_by=moved_by,
+            ))
+
+    _update_quantities(deltas)
+    return InventoryMovement.objects.bulk_create(movements) if movements else []
+
+
+def _checked_change(product_id, branch_id, old_quantity, change, clamp_at_zero):
+    """
+    Returns the change to apply, raising (or clamping) when stock would go negative.
+    """
+    if old_quantity + change >= 0:
+        return change
+    product_name = Product.objects.filter(pk=product_id).values_list('name', flat=True).first()
+    if not clamp_at_zero:
+        raise ValidationError(
+            _("Insufficient stock for product %(product)s. Available: %(available)s")
+            % {'product': product_name, 'available': old_quantity}
+        )
+    logger.warning(f"Negative stock for {product_name} in branch {branch_id}, clamped to 0")
+    return -old_quantity
+
+
+# === Hot SKUs (split stock) ===
+# في العروض يتم تقسيم مخزون المنتج الأكثر طلباً إلى عدة buckets يتم الخصم منها بشكل مستقل،
+# بدلاً من اصطفاف كل عمليات الدفع خلف قفل صف واحد.
+def _hot_inventories(pairs):
+    condition = _pairs_condition(pairs)
+    if condition is None:
+        return {}
+    rows = BranchProductInventory.objects.filter(condition, is_hot=True).only(
+        'id', 'product_id', 'branch_id', 'quantity', 'is_hot'
+    )
+    return {(row.branch_id, row.product_id): row for row in rows}
+
+
+def _hot_on_hand(inventory):
+    return (
+        BranchProductInventory.objects.filter(pk=inventory.pk)
+        .annotate(bucket_total=Coalesce(Sum('buckets__quantity'), Value(0)))
+        .values_list(F('quantity') + F('bucket_total'), flat=True)
+        .get()
+    )
+
+
+def _take_from_bucket(bucket, wanted):
+    portion = min(bucket.quantity, wanted)
+    if portion > 0:
+        InventoryBucket.objects.filter(pk=bucket.pk).update(quantity=F('quantity') - portion)
+    return max(portion, 0)
+
+
+def _take_from_free_buckets(buckets, needed):
+    """
+    Locks one free bucket at a time (LIMIT 1 ... SKIP LOCKED) so that concurrent
+    checkouts of the same product each end up holding a different bucket.
+    """
+    taken = 0
+    used = []
+    while taken < needed:
+        bucket = (
+            buckets.select_for_update(skip_locked=True)
+            .filter(quantity__gt=0).exclude(pk__in=used)
+            .order_by('-quantity', 'slot').first()
+        )
+        if bucket is None:
+            break
+        used.append(bucket.pk)
+        taken += _take_from_bucket(bucket, needed - taken)
+    return taken
+
+
+def _apply_hot_change(inventory, change, clamp_at_zero):
+    """
+    Applies a change to a hot SKU. Deductions take from buckets that no other
+    transaction holds (SKIP LOCKED); only when those are not enough does it wait for
+    the remaining buckets (in slot order) and finally the row itself.
+    Returns (old_on_hand, applied_change).
+    """
+    old_quantity = _hot_on_hand(inventory)
+    buckets = InventoryBucket.objects.filter(inventory_id=inventory.pk)
+
+    if change > 0:
+        bucket = buckets.select_for_update(skip_locked=True).order_by('quantity', 'slot').first()
+        if bucket is None:
+            bucket = buckets.select_for_update().order_by('slot').first()
+        if bucket is None:
+            BranchProductInventory.objects.filter(pk=inventory.pk).update(quantity=F('quantity') + change, updated_at=timezone.now())
+        else:
+            InventoryBucket.objects.filter(pk=bucket.pk).update(quantity=F('quantity') + change)
+        return old_quantity, change
+
+    needed = -change
+    taken = _take_from_free_buckets(buckets, needed)
+    if taken < needed:
+        for bucket in buckets.select_for_update().order_by('slot'):
+            if taken >= needed:
+                break
+            taken += _take_from_bucket(bucket, needed - taken)
+    if taken < needed:
+        row = BranchProductInventory.objects.select_for_update().only('id', 'quantity').get(pk=inventory.pk)
+        portion = min(row.quantity, needed - taken)
+        if portion > 0:
+            BranchProductInventory.objects.filter(pk=inventory.pk).update(quantity=F('quantity') - portion, updated_at=timezone.now())
+            taken += portion
+    if taken < needed:
+        # رفع الخطأ يلغي المعاملة بما فيها ما تم خصمه من الـ buckets
+        _checked_change(inventory.product_id, inventory.branch_id, taken, -needed, clamp_at_zero)
+    return old_quantity, -taken
+
+
+def _spread(total, bucket_count):
+    share, extra = divmod(max(total, 0), bucket_count)
+    return [share + (1 if slot < extra else 0) for slot in range(bucket_count)]
+
+
+def promote_to_hot(inventory_id, bucket_count=None):
+    """
+    Splits a row's stock evenly across `bucket_count` buckets and marks it hot.
+    """
+    bucket_count = bucket_count or getattr(settings, 'HOT_SKU_BUCKET_COUNT', 8)
+    with transaction.atomic():
+        inventory = BranchProductInventory.objects.select_for_update().get(pk=inventory_id)
+        if inventory.is_hot:
+            return inventory
+        InventoryBucket.objects.filter(inventory=inventory).delete()
+        InventoryBucket.objects.bulk_create([
+            InventoryBucket(inventory=inventory, slot=slot, quantity=quantity)
+            for slot, quantity in enumerate(_spread(inventory.quantity, bucket_count))
+        ])
+        inventory.quantity = 0
+        inventory.is_hot = True
+        inventory.save(update_fields=['quantity', 'is_hot', 'updated_at'])
+    logger.info(f"Inventory {inventory_id} promoted to hot SKU mode with {bucket_count} buckets")
+    return inventory
+
+
+def demote_from_hot(inventory_id):
+    """
+    Folds the buckets back into the row and leaves hot SKU mode.
+    """
+    with transaction.atomic():
+        inventory = BranchProductInventory.objects.select_for_update().get(pk=inventory_id)
+        if not inventory.is_hot:
+            return inventory
+        buckets = list(InventoryBucket.objects.select_for_update().filter(inventory=inventory).order_by('slot'))
+        inventory.quantity += sum(bucket.quantity for bucket in buckets)
+        inventory.is_hot = False
+        inventory.save(update_fields=['quantity', 'is_hot', 'updated_at'])
+        InventoryBucket.objects.filter(inventory=inventory).delete()
+    return inventory
+
+
+def rebalance_buckets(inventory_id):
+    """
+    Evens out a hot SKU's buckets (and sweeps any quantity written to the row itself
+    into them) so that SKIP LOCKED deductions keep finding stock in free buckets.
+    """
+    with transaction.atomic():
+        inventory = BranchProductInventory.objects.select_for_update().filter(pk=inventory_id, is_hot=True).first()
+        if inventory is None:
+            return False
+        buckets = list(InventoryBucket.objects.select_for_update().filter(inventory=inventory).order_by('slot'))
+        if not buckets:
+            return False
+        total = inventory.quantity + sum(bucket.quantity for bucket in buckets)
+        for bucket, quantity in zip(buckets, _spread(total, len(buckets))):
+            bucket.quantity = quantity
+        InventoryBucket.objects.bulk_update(buckets, ['quantity'])
+        if inventory.quantity:
+            inventory.quantity = 0
+            inventory.save(update_fields=['quantity', 'updated_at'])
+    return True
+
+
+# === Reservations ===
+# عند المسح أو الإضافة للسلة يتم حجز الكمية فقط، والخصم الفعلي من المخزون يتم عند إتمام الطلب.
+TEMP_ORDER_HOLDER = 'temp_order'
+CART_HOLDER = 'cart'
+ORDER_HOLDER = 'order'
+
+
+def reservation_holder(kind, pk):
+    return f"{kind}:{pk}"
+
+
+def live_reservations_q():
+    return Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now())
+
+
+def annotate_available(queryset, exclude_holder=None):
+    """
+    Annotates BranchProductInventory rows with reserved_quantity (live holds),
+    on_hand_quantity (row plus hot SKU buckets) and available_quantity (on-hand minus live holds).
+    """
+    reserved = StockReservation.objects.filter(
+        live_reservations_q(),
+        branch_id=OuterRef('branch_id'),
+        product_id=OuterRef('product_id'),
+    )
+    if exclude_holder:
+        reserved = reserved.exclude(holder=exclude_holder)
+    reserved = reserved.order_by().values('branch_id', 'product_id').annotate(total=Sum('quantity')).values('total')
+    return annotate_on_hand(queryset).annotate(
+        reserved_quantity=Coalesce(Subquery(reserved, output_field=IntegerField()), Value(0)),
+    ).annotate(
+        available_quantity=F('on_hand_quantity') - F('reserved_quantity'),
+    )
+
+
+def _sum_subquery(queryset, group_by):
+    summed = queryset.order_by().values(group_by).annotate(total=Sum('quantity')).values('total')
+    return Coalesce(Subquery(summed, output_field=IntegerField()), Value(0))
+
+
+def annotate_on_hand(queryset):
+    """
+    Annotates BranchProductInventory rows with on_hand_quantity (row plus hot SKU buckets),
+    so BranchProductInventory.on_hand_quantity() does not query per row.
+    """
+    return queryset.annotate(
+        on_hand_quantity=F('quantity') + _sum_subquery(
+            InventoryBucket.objects.filter(inventory_id=OuterRef('pk')), 'inventory_id'
+        ),
+    )
+
+
+def total_quantity_expression():
+    """
+    Product-level expression: stock across all branches, including hot SKU buckets.
+    Correlated subqueries, so it stays correct on querysets joined through branch_inventories.
+    """
+    return (
+        _sum_subquery(BranchProductInventory.objects.filter(product_id=OuterRef('pk')), 'product_id')
+        + _sum_subquery(InventoryBucket.objects.filter(inventory__product_id=OuterRef('pk')), 'inventory__product_id')
+    )
+
+
+def available_quantity(branch_id, product_id, exclude_holder=None):
+    """
+    Stock that can still be reserved in one indexed query; 0 if the branch has no inventory row.
+    """
+    available = annotate_available(
+        BranchProductInventory.objects.filter(branch_id=branch_id, product_id=product_id),
+        exclude_holder=exclude_holder,
+    ).values_list('available_quantity', flat=True).first()
+    return max(available or 0, 0)
+
+
+def _reservation_expiry(expires):
+    if not expires:
+        return None
+    return timezone.now() + timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_TTL_MINUTES', 30))
+
+
+def reserve_stock(branch_id, product_id, holder, quantity=None, delta=None, expires=True):
+    """
+    Sets the holder's reservation of a product to `quantity`, or changes it by `delta`.
+    The inventory row is locked (same ordering as apply_stock_changes) only to serialise
+    competing holds; the on-hand quantity itself is not written. Hot SKUs skip the row
+    lock, so their availability check is optimistic and checkout remains the final check.
+    Raises ValidationError if not enough stock is available. Returns the new reserved quantity.
+    """
+    with transaction.atomic():
+        key = (branch_id, product_id)
+        if key not in _hot_inventories([key]) and key not in lock_inventories([key]):
+            raise ValidationError(_("Product is not available in this branch."))
+
+        reservation = StockReservation.objects.filter(
+            branch_id=branch_id, product_id=product_id, holder=holder
+        ).first()
+        current = 0
+        if reservation and (reservation.expires_at is None or reservation.expires_at > timezone.now()):
+            current = reservation.quantity
+        new_quantity = quantity if quantity is not None else current + (delta or 0)
+
+        if new_quantity <= 0:
+            if reservation:
+                reservation.delete()
+            return 0
+
+        if new_quantity > current:
+            available = available_quantity(branch_id, product_id, exclude_holder=holder)
+            if new_quantity > available:
+                raise ValidationError(
+                    _("Requested quantity (%(requested)s) is not available. Available: %(available)s")
+                    % {'requested': new_quantity, 'available': available}
+                )
+
+        expires_at = _reservation_expiry(expires)
+        if reservation:
+            reservation.quantity = new_quantity
+            reservation.expires_at = expires_at
+            reservation.save(update_fields=['quantity', 'expires_at', 'updated_at'])
+        else:
+            StockReservation.objects.create(
+                branch_id=branch_id, product_id=product_id, holder=holder,
+                quantity=new_quantity, expires_at=expires_at,
+            )
+        return new_quantity
+
+
+def release_reservations(holder, product_id=None):
+    queryset = StockReservation.objects.filter(holder=holder)
+    if product_id is not None:
+        queryset = queryset.filter(product_id=product_id)
+    return queryset.delete()[0]
+
+
+def transfer_reservations(old_holder, new_holder, expires=False):
+    """
+    Moves all holds of one holder to another (e.g. temp order -> order at conversion).
+    """
+    return StockReservation.objects.filter(holder=old_holder).update(
+        holder=new_holder, expires_at=_reservation_expiry(expires), updated_at=timezone.now()
+    )
+
+
+def commit_reservations(holder, changes, **movement_kwargs):
+    """
+    Checkout: applies the real stock changes and drops the holder's reservations
+    in the same transaction.
+    """
+    with transaction.atomic():
+        movements = apply_stock_changes(changes, **movement_kwargs)
+        release_reservations(holder)
+    return movements
@@ -0,0 +1,99 @@
+# products/management/commands/benchmark_hot_sku.py
+import statistics
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from products.inventory import _hot_on_hand, apply_stock_changes, promote_to_hot
+from products.models import BranchProductInventory, Product
+from stores.models import Branch, Store
+
+
+def _checkout_worker(key, checkouts, hold_seconds, barrier, latencies, errors):
+    try:
+        barrier.wait()
+        for _ in range(checkouts):
+            started = time.perf_counter()
+            with transaction.atomic():
+                apply_stock_changes({key: -1})
+                # باقي عمل الدفع (الدفعة، الفاتورة...) يتم والقفل ما زال مأخوذاً
+                time.sleep(hold_seconds)
+            latencies.append(time.perf_counter() - started)
+    except Exception as exc:
+        errors.append(exc)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs concurrent single-unit checkouts of one product, first on a plain inventory row "
+        "and then in hot SKU mode (buckets + SKIP LOCKED), and reports throughput and latency. "
+        "Creates a throwaway store, branch and product and deletes them afterwards. Needs PostgreSQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16, help="Concurrent checkout threads.")
+        parser.add_argument('--checkouts', type=int, default=50, help="Checkouts per worker.")
+        parser.add_argument('--buckets', type=int, default=None, help="Buckets in hot mode (default HOT_SKU_BUCKET_COUNT).")
+        parser.add_argument('--hold-ms', type=float, default=5.0, help="Time each checkout keeps its transaction open.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("This benchmark needs PostgreSQL (row locks and SKIP LOCKED).")
+        if options['workers'] < 1 or options['checkouts'] < 1:
+            raise CommandError("--workers and --checkouts must be positive integers.")
+
+        total = options['workers'] * options['checkouts']
+        name = f"benchmark_hot_sku {uuid.uuid4().hex[:8]}"
+        store = Store.objects.create(name=name, address="-")
+        branch = Branch.objects.create(store=store, name=name, address="-")
+        product = Product.objects.create(name=name, price=Decimal('1.00'))
+        inventory = BranchProductInventory.objects.create(product=product, branch=branch, quantity=total)
+        try:
+            # بدون ترقية تلقائية: نقيس الوضعين كما هما
+            with override_settings(HOT_SKU_LOCK_WAIT_MS=float('inf')):
+                self.stdout.write(f"{options['workers']} workers x {options['checkouts']} checkouts, hold {options['hold_ms']:g} ms")
+                self._run("single row", inventory, options)
+                BranchProductInventory.objects.filter(pk=inventory.pk).update(quantity=total)
+                promote_to_hot(inventory.pk, options['buckets'])
+                self._run("hot buckets", inventory, options)
+        finally:
+            product.delete()
+            store.delete()
+        self.stdout.write(self.style.SUCCESS("No checkout was lost in either mode."))
+
+    def _run(self, label, inventory, options):
+        key = (inventory.branch_id, inventory.product_id)
+        latencies, errors = [], []
+        barrier = threading.Barrier(options['workers'])
+        threads = [
+            threading.Thread(
+                target=_checkout_worker,
+                args=(key, options['checkouts'], options['hold_ms'] / 1000, barrier, latencies, errors),
+            )
+            for _ in range(options['workers'])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - started
+
+        if errors:
+            raise CommandError(f"{label}: {len(errors)} workers failed, first error: {errors[0]}")
+        remaining = _hot_on_hand(inventory)
+        if remaining != 0:
+            raise CommandError(f"{label}: {remaining} units left after all checkouts, updates were lost.")
+        percentiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f"{label + ':':<14} {len(latencies) / seconds:8.1f} checkouts/s   "
+            f"p50 {percentiles[49] * 1000:6.1f} ms   p95 {percentiles[94] * 1000:6.1f} ms   "
+            f"max {max(latencies) * 1000:6.1f} ms"
+        )
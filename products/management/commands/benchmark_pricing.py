@@ -0,0 +1,91 @@
+# products/management/commands/benchmark_pricing.py
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from products import pricing
+from products.utils import calculate_discounted_price, calculate_vat_amount, is_offer_active
+
+
+def _random_rows(count, seed, today):
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        price = Decimal(rng.randint(0, 9_999_999_999)).scaleb(-2)
+        discount = rng.choice([None, Decimal('0.00'), Decimal(rng.randint(1, 10000)).scaleb(-2)])
+        fixed = rng.choice([None, Decimal(rng.randint(0, 9_999_999_999)).scaleb(-2)])
+        start = end = None
+        if rng.random() < 0.5:
+            start = today + timedelta(days=rng.randint(-30, 30))
+            end = start + timedelta(days=rng.randint(-5, 30))
+        vat_rate = Decimal(rng.randint(0, 10000)).scaleb(-4)
+        rows.append((price, discount, fixed, start, end, vat_rate))
+    return rows
+
+
+def _scalar(row, today):
+    price, discount, fixed, start, end, vat_rate = row
+    if is_offer_active(start, end, today) and fixed is not None:
+        net = fixed
+    else:
+        net = calculate_discounted_price(price, discount)
+    vat = calculate_vat_amount(net, vat_rate)
+    return net, vat, net + vat
+
+
+class Command(BaseCommand):
+    help = (
+        "Checks products.pricing against the scalar helpers in products.utils on random "
+        "rows and reports the time of both paths."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help="Number of random rows.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for reproducible runs.")
+
+    def handle(self, *args, **options):
+        count = options['rows']
+        if count < 1:
+            raise CommandError("--rows must be a positive integer.")
+        today = timezone.localdate()
+        rows = _random_rows(count, options['seed'], today)
+        columns = list(zip(*rows))
+        self.stdout.write(f"{count} rows, numpy {'enabled' if pricing.np is not None else 'not installed'}")
+
+        started = time.perf_counter()
+        expected = [_scalar(row, today) for row in rows]
+        scalar_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        prepared = pricing.prepare_columns(*columns)
+        prepare_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        batch = pricing.compute_prices(*prepared, today=today)
+        compute_seconds = time.perf_counter() - started
+
+        net_halalas = batch.net_halalas()
+        vat_halalas = batch.vat_halalas()
+        mismatches = 0
+        for index, (net, vat, gross) in enumerate(expected):
+            exact = batch.row(index)
+            if (
+                exact['price_after_discount'] != net
+                or exact['vat_amount'] != vat
+                or exact['total_price_with_vat'] != gross
+                or int(net_halalas[index]) != int(net.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP).scaleb(2))
+                or int(vat_halalas[index]) != int(vat.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP).scaleb(2))
+            ):
+                mismatches += 1
+                if mismatches <= 10:
+                    self.stderr.write(f"Mismatch at row {index}: {rows[index]} -> {exact} != {(net, vat, gross)}")
+
+        self.stdout.write(f"scalar Decimal:  {scalar_seconds:.3f}s")
+        self.stdout.write(f"batch prepare:   {prepare_seconds:.3f}s")
+        self.stdout.write(f"batch compute:   {compute_seconds:.3f}s")
+        if mismatches:
+            raise CommandError(f"{mismatches} rows differ from the scalar helpers.")
+        self.stdout.write(self.style.SUCCESS("Batch results are identical to the scalar helpers."))
@@ -0,0 +1,77 @@
+# products/management/commands/explain_scoping.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from authentication.principal import Principal
+from products.models import Product
+from stores.models import Branch, Store
+from users.constants import UserType
+from users.models import Customer
+
+PAGE_SIZE = 50
+
+
+def _timed(label, queryset, repeat):
+    """Best of `repeat` runs of count() and of the first page, in ms."""
+    count_ms = page_ms = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        total = queryset.count()
+        count_ms = min(count_ms, (time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        list(queryset.order_by('pk').values_list('pk', flat=True)[:PAGE_SIZE])
+        page_ms = min(page_ms, (time.perf_counter() - started) * 1000)
+    return f"{label:<28} {total:>10} rows   count {count_ms:8.1f} ms   first page {page_ms:8.1f} ms"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the tenant scoping of for_principal() (EXISTS) with the previous "
+        "JOIN + DISTINCT querysets for products and customers of a store or branch: "
+        "row counts, timings and, with --plans, the EXPLAIN ANALYZE output."
+    )
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--store', help="Store id: scope of a store manager (every branch of the store).")
+        target.add_argument('--branch', help="Branch id: scope of a branch manager.")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per query; the best time is reported.")
+        parser.add_argument('--plans', action='store_true', help="Print the EXPLAIN ANALYZE plans (PostgreSQL).")
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be a positive integer.")
+        if options['store']:
+            store = Store.objects.filter(pk=options['store']).first()
+            if store is None:
+                raise CommandError(f"Store {options['store']} does not exist.")
+            branch_ids = set(Branch.objects.filter(store=store).values_list('pk', flat=True))
+            principal = Principal(None, UserType.STORE_MANAGER, store_ids={store.pk}, branch_ids=branch_ids)
+            legacy_products = Product.objects.filter(branch_inventories__branch__store=store).distinct()
+            legacy_customers = Customer.objects.filter(order__branch__store=store).distinct()
+        else:
+            branch = Branch.objects.filter(pk=options['branch']).first()
+            if branch is None:
+                raise CommandError(f"Branch {options['branch']} does not exist.")
+            principal = Principal(None, UserType.BRANCH_MANAGER, store_ids={branch.store_id}, branch_ids={branch.pk})
+            legacy_products = Product.objects.filter(branch_inventories__branch=branch).distinct()
+            legacy_customers = Customer.objects.filter(order__branch=branch).distinct()
+
+        self.stdout.write(
+            f"{connection.vendor}: {Product.objects.count()} products, {Store.objects.count()} stores, "
+            f"scope of {len(principal.branch_ids)} branch(es)"
+        )
+        pairs = [
+            ('products', legacy_products, Product.objects.for_principal(principal)),
+            ('customers', legacy_customers, Customer.objects.for_principal(principal)),
+        ]
+        for name, legacy, scoped in pairs:
+            self.stdout.write(_timed(f"{name}: JOIN + DISTINCT", legacy, options['repeat']))
+            self.stdout.write(_timed(f"{name}: EXISTS", scoped, options['repeat']))
+            if options['plans']:
+                for label, queryset in (('JOIN + DISTINCT', legacy), ('EXISTS', scoped)):
+                    self.stdout.write(f"\n-- {name}, {label}")
+                    self.stdout.write(queryset.order_by('pk')[:PAGE_SIZE].explain(analyze=True))
+                self.stdout.write("")
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.22 on 2026-10-18 09:00
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stores', '0002_initial'),
+        ('products', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('holder', models.CharField(help_text='e.g. temp_order:15, cart:7, order:42', max_length=64, verbose_name='Holder')),
+                ('quantity', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='Reserved Quantity')),
+                ('expires_at', models.DateTimeField(blank=True, help_text='Empty means the hold does not expire.', null=True, verbose_name='Expires At')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Last Updated At')),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to='stores.branch', verbose_name='Branch')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to='products.product', verbose_name='Product')),
+            ],
+            options={
+                'verbose_name': 'Stock Reservation',
+                'verbose_name_plural': 'Stock Reservations',
+                'unique_together': {('branch', 'product', 'holder')},
+                'indexes': [
+                    models.Index(fields=['branch', 'product', 'expires_at'], name='stockres_branch_prod_exp_idx'),
+                    models.Index(fields=['holder'], name='stockres_holder_idx'),
+                    models.Index(fields=['expires_at'], name='stockres_expires_idx'),
+                ],
+            },
+        ),
+    ]
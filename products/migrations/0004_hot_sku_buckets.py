@@ -0,0 +1,35 @@
+# Generated by Django 4.2.22 on 2026-10-18 10:00
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='branchproductinventory',
+            name='is_hot',
+            field=models.BooleanField(default=False, verbose_name='Hot SKU (split stock)'),
+        ),
+        migrations.CreateModel(
+            name='InventoryBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField(verbose_name='Slot')),
+                ('quantity', models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Quantity')),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='products.branchproductinventory', verbose_name='Inventory Record')),
+            ],
+            options={
+                'verbose_name': 'Inventory Bucket',
+                'verbose_name_plural': 'Inventory Buckets',
+                'ordering': ['inventory', 'slot'],
+                'unique_together': {('inventory', 'slot')},
+            },
+        ),
+    ]
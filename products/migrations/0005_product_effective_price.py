@@ -0,0 +1,33 @@
+# Generated by Django 4.2.22 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_hot_sku_buckets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='current_price',
+            field=models.DecimalField(blank=True, decimal_places=10, editable=False, max_digits=22, null=True, verbose_name='Current Effective Price'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='current_vat_amount',
+            field=models.DecimalField(blank=True, decimal_places=10, editable=False, max_digits=22, null=True, verbose_name='Current VAT Amount'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='current_total_price',
+            field=models.DecimalField(blank=True, decimal_places=10, editable=False, max_digits=22, null=True, verbose_name='Current Price incl. VAT'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='price_valid_until',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True, verbose_name='Effective Price Valid Until'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.22 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_effective_price'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='branchproductinventory',
+            index=models.Index(fields=['created_at', 'id'], name='inventory_created_id_idx'),
+        ),
+    ]
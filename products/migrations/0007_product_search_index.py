@@ -0,0 +1,102 @@
+# Generated by Django 4.2.22 on 2026-10-18 13:00
+
+from django.db import migrations
+
+# The search column/tables are maintained in SQL (triggers), outside the Django model,
+# so bulk imports and queryset.update() keep the index current too. See products/search.py.
+
+POSTGRES_VECTOR = """
+    setweight(to_tsvector('arabic', coalesce({row}name, '')), 'A')
+    || setweight(to_tsvector('simple', coalesce({row}name, '')), 'A')
+    || setweight(to_tsvector('simple', coalesce({row}barcode, '') || ' ' || coalesce({row}item_number, '')), 'B')
+"""
+
+POSTGRES_FORWARDS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "ALTER TABLE products_product ADD COLUMN search_vector tsvector",
+    """
+    CREATE FUNCTION products_product_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := %s;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """ % POSTGRES_VECTOR.format(row='NEW.'),
+    """
+    CREATE TRIGGER products_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, barcode, item_number ON products_product
+    FOR EACH ROW EXECUTE PROCEDURE products_product_search_vector_update()
+    """,
+    "UPDATE products_product SET search_vector = %s" % POSTGRES_VECTOR.format(row=''),
+    "CREATE INDEX products_product_search_idx ON products_product USING gin (search_vector)",
+    "CREATE INDEX products_product_name_trgm_idx ON products_product USING gin (name gin_trgm_ops)",
+    "CREATE INDEX products_product_barcode_trgm_idx ON products_product USING gin (barcode gin_trgm_ops)",
+]
+
+POSTGRES_BACKWARDS = [
+    "DROP INDEX IF EXISTS products_product_barcode_trgm_idx",
+    "DROP INDEX IF EXISTS products_product_name_trgm_idx",
+    "DROP INDEX IF EXISTS products_product_search_idx",
+    "DROP TRIGGER IF EXISTS products_product_search_vector_trigger ON products_product",
+    "DROP FUNCTION IF EXISTS products_product_search_vector_update()",
+    "ALTER TABLE products_product DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARDS = [
+    """
+    CREATE VIRTUAL TABLE products_product_fts USING fts5(
+        name, barcode, item_number,
+        content='products_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER products_product_fts_insert AFTER INSERT ON products_product BEGIN
+        INSERT INTO products_product_fts(rowid, name, barcode, item_number)
+        VALUES (new.id, new.name, new.barcode, new.item_number);
+    END
+    """,
+    """
+    CREATE TRIGGER products_product_fts_delete AFTER DELETE ON products_product BEGIN
+        INSERT INTO products_product_fts(products_product_fts, rowid, name, barcode, item_number)
+        VALUES ('delete', old.id, old.name, old.barcode, old.item_number);
+    END
+    """,
+    """
+    CREATE TRIGGER products_product_fts_update AFTER UPDATE OF name, barcode, item_number ON products_product BEGIN
+        INSERT INTO products_product_fts(products_product_fts, rowid, name, barcode, item_number)
+        VALUES ('delete', old.id, old.name, old.barcode, old.item_number);
+        INSERT INTO products_product_fts(rowid, name, barcode, item_number)
+        VALUES (new.id, new.name, new.barcode, new.item_number);
+    END
+    """,
+    "INSERT INTO products_product_fts(products_product_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS products_product_fts_update",
+    "DROP TRIGGER IF EXISTS products_product_fts_delete",
+    "DROP TRIGGER IF EXISTS products_product_fts_insert",
+    "DROP TABLE IF EXISTS products_product_fts",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'postgresql': POSTGRES_FORWARDS, 'sqlite': SQLITE_FORWARDS}),
+            _run({'postgresql': POSTGRES_BACKWARDS, 'sqlite': SQLITE_BACKWARDS}),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.22 on 2026-10-18 14:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stores', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('products', '0007_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='product_imports/', verbose_name='Uploaded File')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=20, verbose_name='Status')),
+                ('total_rows', models.PositiveIntegerField(blank=True, null=True, verbose_name='Total Rows')),
+                ('processed_rows', models.PositiveIntegerField(default=0, verbose_name='Processed Rows')),
+                ('next_row', models.PositiveIntegerField(default=2, verbose_name='Next Row (checkpoint)')),
+                ('created_count', models.PositiveIntegerField(default=0, verbose_name='Created Products')),
+                ('updated_count', models.PositiveIntegerField(default=0, verbose_name='Updated Products')),
+                ('inventory_records', models.PositiveIntegerField(default=0, verbose_name='Inventory Records Processed')),
+                ('error_count', models.PositiveIntegerField(default=0, verbose_name='Row Errors')),
+                ('error_file', models.FileField(blank=True, null=True, upload_to='product_imports/errors/', verbose_name='Row Errors (CSV)')),
+                ('message', models.TextField(blank=True, default='', verbose_name='Message')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Started At')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished At')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Last Updated At')),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to='stores.branch', verbose_name='Branch')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='product_import_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Created By')),
+            ],
+            options={
+                'verbose_name': 'Product Import Job',
+                'verbose_name_plural': 'Product Import Jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='importjob_status_updated_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.22 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_importjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='branchproductinventory',
+            index=models.Index(fields=['branch', 'updated_at'], name='inventory_branch_updated_idx'),
+        ),
+    ]
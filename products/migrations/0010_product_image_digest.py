@@ -0,0 +1,23 @@
+# Generated by Django 4.2.22 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_inventory_branch_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_digest',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='Image Digest'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_digest_source',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255, verbose_name='Image Digest Source'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.22 on 2026-10-18 12:00
+
+from django.db import migrations
+
+SCHEDULE_NAME = 'Expire Stale Stock Reservations'
+
+
+def create_schedule(apps, schema_editor):
+    # django_q لا يقرأ Q_SCHEDULE من الإعدادات؛ المهام الدورية صفوف في جدول Schedule
+    Schedule = apps.get_model('django_q', 'Schedule')
+    Schedule.objects.update_or_create(
+        name=SCHEDULE_NAME,
+        defaults={
+            'func': 'products.tasks.expire_stock_reservations',
+            'schedule_type': 'I',  # Schedule.MINUTES
+            'minutes': 5,
+            'repeats': -1,
+            'cluster': 'DjangORM',
+        },
+    )
+
+
+def delete_schedule(apps, schema_editor):
+    apps.get_model('django_q', 'Schedule').objects.filter(name=SCHEDULE_NAME).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_product_image_digest'),
+        ('django_q', '0014_schedule_cluster'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_schedule, delete_schedule),
+    ]
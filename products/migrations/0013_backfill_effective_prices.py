@@ -0,0 +1,70 @@
+# Generated by Django 4.2.22 on 2026-10-18 12:00
+
+from datetime import timedelta
+
+from django.db import migrations
+from django.utils import timezone
+
+from products.utils import calculate_discounted_price, calculate_vat_amount, is_offer_active
+
+SCHEDULE_NAME = 'Refresh Effective Prices at Offer Boundaries'
+EFFECTIVE_PRICE_FIELDS = ('current_price', 'current_vat_amount', 'current_total_price', 'price_valid_until')
+
+
+def backfill_effective_prices(apps, schema_editor):
+    """
+    Fills the columns added in 0005 for existing products, the way Product.refresh_effective_price()
+    does (the historical model has no methods).
+    """
+    Product = apps.get_model('products', 'Product')
+    today = timezone.localdate()
+    last_pk = 0
+    while True:
+        products = list(Product.objects.filter(current_price__isnull=True, pk__gt=last_pk).order_by('pk')[:1000])
+        if not products:
+            break
+        for product in products:
+            offer_active = is_offer_active(product.offer_start_date, product.offer_end_date, today)
+            if offer_active and product.fixed_offer_price is not None:
+                product.current_price = product.fixed_offer_price
+            else:
+                product.current_price = calculate_discounted_price(product.price, product.discount_percentage)
+            product.current_vat_amount = calculate_vat_amount(product.current_price, product.vat_rate)
+            product.current_total_price = product.current_price + product.current_vat_amount
+            product.price_valid_until = None
+            if product.fixed_offer_price is not None and product.offer_start_date and product.offer_end_date:
+                if today < product.offer_start_date:
+                    product.price_valid_until = product.offer_start_date - timedelta(days=1)
+                elif today <= product.offer_end_date:
+                    product.price_valid_until = product.offer_end_date
+        Product.objects.bulk_update(products, EFFECTIVE_PRICE_FIELDS)
+        last_pk = products[-1].pk
+
+
+def create_schedule(apps, schema_editor):
+    Schedule = apps.get_model('django_q', 'Schedule')
+    Schedule.objects.update_or_create(
+        name=SCHEDULE_NAME,
+        defaults={
+            'func': 'products.tasks.refresh_effective_prices',
+            'schedule_type': 'H',  # Schedule.HOURLY
+            'repeats': -1,
+            'cluster': 'DjangORM',
+        },
+    )
+
+
+def delete_schedule(apps, schema_editor):
+    apps.get_model('django_q', 'Schedule').objects.filter(name=SCHEDULE_NAME).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_schedule_rebalance_hot_inventories'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_effective_prices, migrations.RunPython.noop),
+        migrations.RunPython(create_schedule, delete_schedule),
+    ]
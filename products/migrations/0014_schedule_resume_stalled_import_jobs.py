@@ -0,0 +1,34 @@
+# Generated by Django 4.2.22 on 2026-10-18 12:00
+
+from django.db import migrations
+
+SCHEDULE_NAME = 'Resume Stalled Product Import Jobs'
+
+
+def create_schedule(apps, schema_editor):
+    Schedule = apps.get_model('django_q', 'Schedule')
+    Schedule.objects.update_or_create(
+        name=SCHEDULE_NAME,
+        defaults={
+            'func': 'products.tasks.resume_stalled_import_jobs',
+            'schedule_type': 'I',  # Schedule.MINUTES
+            'minutes': 5,
+            'repeats': -1,
+            'cluster': 'DjangORM',
+        },
+    )
+
+
+def delete_schedule(apps, schema_editor):
+    apps.get_model('django_q', 'Schedule').objects.filter(name=SCHEDULE_NAME).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_backfill_effective_prices'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_schedule, delete_schedule),
+    ]
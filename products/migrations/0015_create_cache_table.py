@@ -0,0 +1,20 @@
+# Generated by Django 4.2.22 on 2026-10-18 12:00
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    # جدول DatabaseCache (settings.CACHES)؛ لا يفعل شيئاً مع Redis أو إن كان الجدول موجوداً
+    call_command('createcachetable', database=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_schedule_resume_stalled_import_jobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
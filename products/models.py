@@ -1,12 +1,15 @@
+from datetime import timedelta
 from decimal import Decimal
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from mysite.scoping import PrincipalQuerySet
 from stores.models import Branch
+from users.constants import UserType
 from .utils import (
     is_offer_active,
     calculate_discounted_price,
@@ -14,6 +17,25 @@ from .utils import (
 )
 
 
+class DepartmentQuerySet(PrincipalQuerySet):
+    # العملاء يرون جميع الأقسام (للقراءة فقط)
+    unscoped_roles = frozenset({UserType.APP_STAFF, UserType.PLATFORM_CUSTOMER})
+    branch_field = 'branch_id'
+
+
+class ProductQuerySet(PrincipalQuerySet):
+    # العملاء يرون جميع المنتجات المتاحة في النظام
+    unscoped_roles = frozenset({UserType.APP_STAFF, UserType.PLATFORM_CUSTOMER})
+
+    def scope_filter(self, principal):
+        # EXISTS على مخزون الفروع بدل JOIN + DISTINCT، ويغطيه الفهرس الفريد (product, branch)
+        return Exists(BranchProductInventory.objects.filter(product_id=OuterRef('pk'), branch_id__in=principal.branch_ids))
+
+
+class BranchProductInventoryQuerySet(PrincipalQuerySet):
+    branch_field = 'branch_id'
+
+
 class Department(models.Model):
     branch = models.ForeignKey(
         Branch,
@@ -26,6 +48,8 @@ class Department(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Created At"))
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Last Updated At"))
 
+    objects = DepartmentQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Department")
         verbose_name_plural = _("Departments")
@@ -80,9 +104,23 @@ class Product(models.Model):
     vat_rate = models.DecimalField(max_digits=5, decimal_places=4, default=Decimal('0.1500'), validators=[MinValueValidator(Decimal('0.0000')), MaxValueValidator(Decimal('1.0000'))], verbose_name=_("VAT Rate (as decimal)"))
     last_updated_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='updated_products', verbose_name=_("Last Updated By"))
     image = models.ImageField(upload_to='product_images/', null=True, blank=True, verbose_name=_("Product Image"))
+    # SHA-256 of the image file: names its resized renditions (products.renditions), set once they exist
+    image_digest = models.CharField(max_length=64, blank=True, default='', editable=False, verbose_name=_("Image Digest"))
+    image_digest_source = models.CharField(max_length=255, blank=True, default='', editable=False, verbose_name=_("Image Digest Source"))
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Created At"))
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Last Updated At"))
 
+    # السعر الفعلي محسوب مسبقاً (يُحدّث عند الحفظ وعند بداية/نهاية العرض) بدلاً من حسابه في كل استدعاء
+    current_price = models.DecimalField(max_digits=22, decimal_places=10, null=True, blank=True, editable=False, verbose_name=_("Current Effective Price"))
+    current_vat_amount = models.DecimalField(max_digits=22, decimal_places=10, null=True, blank=True, editable=False, verbose_name=_("Current VAT Amount"))
+    current_total_price = models.DecimalField(max_digits=22, decimal_places=10, null=True, blank=True, editable=False, verbose_name=_("Current Price incl. VAT"))
+    price_valid_until = models.DateField(null=True, blank=True, editable=False, db_index=True, verbose_name=_("Effective Price Valid Until"))
+
+    PRICE_SOURCE_FIELDS = ('price', 'discount_percentage', 'fixed_offer_price', 'offer_start_date', 'offer_end_date', 'vat_rate')
+    EFFECTIVE_PRICE_FIELDS = ('current_price', 'current_vat_amount', 'current_total_price', 'price_valid_until')
+
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Product")
         verbose_name_plural = _("Products")
@@ -106,23 +144,75 @@ class Product(models.Model):
                 violation_error_message=_("This accounting system ID already exists for another product.")
             )
         ]
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),
+        ]
 
     def __str__(self):
         identifier = self.barcode or self.item_number or _('No ID')
         return f"{self.name} ({identifier})"
 
-    def price_after_discount(self):
-        if is_offer_active(self.offer_start_date, self.offer_end_date) and self.fixed_offer_price is not None:
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(update_fields) & set(self.PRICE_SOURCE_FIELDS):
+            self.refresh_effective_price(save=False)
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | set(self.EFFECTIVE_PRICE_FIELDS)
+        super().save(*args, **kwargs)
+
+    # --- Effective price ---
+    def _compute_price_after_discount(self, today=None):
+        if is_offer_active(self.offer_start_date, self.offer_end_date, today) and self.fixed_offer_price is not None:
             return self.fixed_offer_price
         return calculate_discounted_price(self.price, self.discount_percentage)
 
+    def _price_valid_until(self, today):
+        """
+        Last day on which the price computed `today` still applies: the day before the
+        fixed offer starts, the offer's last day, or None when no boundary is ahead.
+        """
+        if self.fixed_offer_price is None or not (self.offer_start_date and self.offer_end_date):
+            return None
+        if today < self.offer_start_date:
+            return self.offer_start_date - timedelta(days=1)
+        if today <= self.offer_end_date:
+            return self.offer_end_date
+        return None
+
+    def effective_price_is_current(self, today=None):
+        if self.current_price is None or self.current_vat_amount is None:
+            return False
+        if self.price_valid_until is None:
+            return True
+        return (today or timezone.localdate()) <= self.price_valid_until
+
+    def refresh_effective_price(self, today=None, save=True):
+        today = today or timezone.localdate()
+        self.current_price = self._compute_price_after_discount(today)
+        self.current_vat_amount = calculate_vat_amount(self.current_price, self.vat_rate)
+        self.current_total_price = self.current_price + self.current_vat_amount
+        self.price_valid_until = self._price_valid_until(today)
+        if save and self.pk:
+            type(self).objects.filter(pk=self.pk).update(
+                **{field: getattr(self, field) for field in self.EFFECTIVE_PRICE_FIELDS}
+            )
+
+    def price_after_discount(self):
+        if self.effective_price_is_current():
+            return self.current_price
+        return self._compute_price_after_discount()
+
     def discounted_amount(self):
         return self.price - self.price_after_discount()
 
     def vat_amount(self):
+        if self.effective_price_is_current():
+            return self.current_vat_amount
         return calculate_vat_amount(self.price_after_discount(), self.vat_rate)
 
     def total_price_with_vat(self):
+        if self.effective_price_is_current():
+            return self.current_total_price
         return self.price_after_discount() + self.vat_amount()
 
 
@@ -130,18 +220,82 @@ class BranchProductInventory(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='branch_inventories', verbose_name=_("Product"))
     branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='product_inventories', verbose_name=_("Branch"))
     quantity = models.IntegerField(default=0, validators=[MinValueValidator(0)], verbose_name=_("Quantity in Stock"))
+    # Hot SKU mode: stock is split across InventoryBucket rows that are decremented independently
+    is_hot = models.BooleanField(default=False, verbose_name=_("Hot SKU (split stock)"))
     last_updated_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='updated_branch_inventories', verbose_name=_("Last Updated By"))
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Last Updated At"))
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Created At"))
 
+    objects = BranchProductInventoryQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Branch Product Inventory")
         verbose_name_plural = _("Branch Product Inventories")
         unique_together = ('product', 'branch')
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='inventory_created_id_idx'),
+            # products.catalogue: rows changed since a terminal's last sync
+            models.Index(fields=['branch', 'updated_at'], name='inventory_branch_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} @ {self.branch.name}: {self.quantity}"
 
+    def on_hand_quantity(self):
+        """
+        Total stock: the row quantity plus the buckets of a hot SKU.
+        """
+        if not self.is_hot:
+            return self.quantity
+        return self.quantity + (self.buckets.aggregate(total=models.Sum('quantity'))['total'] or 0)
+
+
+class InventoryBucket(models.Model):
+    """
+    One slice of a hot SKU's branch stock. Checkouts take from whichever bucket is
+    not locked, so concurrent sales of the same product do not queue on one row.
+    """
+    inventory = models.ForeignKey(BranchProductInventory, on_delete=models.CASCADE, related_name='buckets', verbose_name=_("Inventory Record"))
+    slot = models.PositiveSmallIntegerField(verbose_name=_("Slot"))
+    quantity = models.IntegerField(default=0, validators=[MinValueValidator(0)], verbose_name=_("Quantity"))
+
+    class Meta:
+        verbose_name = _("Inventory Bucket")
+        verbose_name_plural = _("Inventory Buckets")
+        unique_together = ('inventory', 'slot')
+        ordering = ['inventory', 'slot']
+
+    def __str__(self):
+        return f"{self.inventory_id}#{self.slot}: {self.quantity}"
+
+
+class StockReservation(models.Model):
+    """
+    A temporary hold on branch stock by a basket (temp order, cart or order).
+    On-hand stock is only decremented when the holder is checked out;
+    available stock = on-hand quantity - live reservations.
+    """
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='stock_reservations', verbose_name=_("Branch"))
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_reservations', verbose_name=_("Product"))
+    holder = models.CharField(max_length=64, verbose_name=_("Holder"), help_text=_("e.g. temp_order:15, cart:7, order:42"))
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)], verbose_name=_("Reserved Quantity"))
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Expires At"), help_text=_("Empty means the hold does not expire."))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Created At"))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Last Updated At"))
+
+    class Meta:
+        verbose_name = _("Stock Reservation")
+        verbose_name_plural = _("Stock Reservations")
+        unique_together = ('branch', 'product', 'holder')
+        indexes = [
+            models.Index(fields=['branch', 'product', 'expires_at'], name='stockres_branch_prod_exp_idx'),
+            models.Index(fields=['holder'], name='stockres_holder_idx'),
+            models.Index(fields=['expires_at'], name='stockres_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.holder}: {self.quantity} x {self.product_id} @ {self.branch_id}"
+
 
 class InventoryMovement(models.Model):
     MOVEMENT_TYPES = (
@@ -171,3 +325,55 @@ class InventoryMovement(models.Model):
     def __str__(self):
         moved_by_name = self.moved_by.username if self.moved_by else 'N/A'
         return f"{self.movement_type} {self.quantity_change} of {self.product.name} in {self.branch.name} by {moved_by_name}"
+
+
+class ImportJob(models.Model):
+    """
+    A product Excel upload processed in the background (products.tasks.run_import_job).
+    next_row is the first sheet row not yet committed, so an interrupted job resumes there.
+    """
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    COMPLETED = 'COMPLETED'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = (
+        (PENDING, _('Pending')),
+        (RUNNING, _('Running')),
+        (COMPLETED, _('Completed')),
+        (FAILED, _('Failed')),
+    )
+
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='import_jobs', verbose_name=_("Branch"))
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='product_import_jobs', verbose_name=_("Created By"))
+    file = models.FileField(upload_to='product_imports/', verbose_name=_("Uploaded File"))
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING, verbose_name=_("Status"))
+    total_rows = models.PositiveIntegerField(null=True, blank=True, verbose_name=_("Total Rows"))
+    processed_rows = models.PositiveIntegerField(default=0, verbose_name=_("Processed Rows"))
+    next_row = models.PositiveIntegerField(default=2, verbose_name=_("Next Row (checkpoint)"))
+    created_count = models.PositiveIntegerField(default=0, verbose_name=_("Created Products"))
+    updated_count = models.PositiveIntegerField(default=0, verbose_name=_("Updated Products"))
+    inventory_records = models.PositiveIntegerField(default=0, verbose_name=_("Inventory Records Processed"))
+    error_count = models.PositiveIntegerField(default=0, verbose_name=_("Row Errors"))
+    error_file = models.FileField(upload_to='product_imports/errors/', null=True, blank=True, verbose_name=_("Row Errors (CSV)"))
+    message = models.TextField(blank=True, default='', verbose_name=_("Message"))
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Started At"))
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Finished At"))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Created At"))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Last Updated At"))
+
+    class Meta:
+        verbose_name = _("Product Import Job")
+        verbose_name_plural = _("Product Import Jobs")
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='importjob_status_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"Import #{self.pk} ({self.status}) @ {self.branch_id}"
+
+    @property
+    def progress(self):
+        if not self.total_rows:
+            return None
+        return round(min(self.processed_rows / self.total_rows, 1) * 100, 1)
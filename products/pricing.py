@@ -0,0 +1,206 @@
+# products/pricing.py
+"""
+Batch pricing for catalogue-scale work (listing, export, reports).
+
+Every amount is carried as an exact integer in fixed-point units, so the results equal
+`calculate_discounted_price` / `calculate_vat_amount` / `is_offer_active` in value:
+
+    price, fixed offer price   -> halalas               (x 10^2)
+    discount percentage        -> hundredths of a %     (x 10^2)
+    VAT rate                   -> 1/10000               (x 10^4)
+    price after discount       -> NET_SCALE             (x 10^6)
+    VAT amount, gross price    -> VAT_SCALE             (x 10^10)
+
+With the Product field limits (price < 10^8, VAT rate <= 1) the largest value is
+below 2 * 10^18, so the numpy path stays inside int64.
+numpy is optional; without it the same integer math runs in pure Python.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db.models import BigIntegerField, F, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, Round
+from django.utils import timezone
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+NET_PLACES = 6
+VAT_PLACES = 10
+NET_SCALE = 10 ** NET_PLACES
+VAT_SCALE = 10 ** VAT_PLACES
+HALALA_SCALE = 10 ** 2
+
+_NO_OFFER_PRICE = -1
+_UNIT_FACTORS = {2: Decimal(10 ** 2), 4: Decimal(10 ** 4)}
+
+
+def _to_units(value, places):
+    """Decimal (or None) -> exact integer count of 10^-places units."""
+    if value is None:
+        return None
+    scaled = (value if isinstance(value, Decimal) else Decimal(value)) * _UNIT_FACTORS[places]
+    units = int(scaled)
+    if units != scaled:
+        raise ValueError(f"{value} has more than {places} decimal places.")
+    return units
+
+
+def _round_half_up(units, scale):
+    """Rounds integer fixed-point units to halalas the way Decimal ROUND_HALF_UP does."""
+    step = scale // HALALA_SCALE
+    half = step // 2
+    if np is not None and isinstance(units, np.ndarray):
+        return np.sign(units) * ((np.abs(units) + half) // step)
+    return [(u + half) // step if u >= 0 else -((-u + half) // step) for u in units]
+
+
+def to_decimal(units, places):
+    """Converts one fixed-point integer (10^-places units) back to a Decimal with the same value."""
+    return Decimal(int(units)).scaleb(-places)
+
+
+def prepare_columns(prices, discount_percentages, fixed_offer_prices, offer_start_dates, offer_end_dates, vat_rates):
+    """
+    Converts Decimal/date sequences (one entry per product) to the integer columns
+    used by `compute_prices`. Missing discounts, offer prices and dates become sentinels.
+    """
+    price_units = [_to_units(p, 2) for p in prices]
+    discount_units = []
+    for d in discount_percentages:
+        units = _to_units(d, 2)
+        discount_units.append(units if units is not None and units > 0 else 0)
+    offer_units = [_NO_OFFER_PRICE if f is None else _to_units(f, 2) for f in fixed_offer_prices]
+    starts = [d.toordinal() if d else 0 for d in offer_start_dates]
+    ends = [d.toordinal() if d else 0 for d in offer_end_dates]
+    vat_units = [_to_units(v, 4) for v in vat_rates]
+
+    columns = (price_units, discount_units, offer_units, starts, ends, vat_units)
+    if len({len(c) for c in columns}) != 1:
+        raise ValueError("All pricing columns must have the same length.")
+    if np is not None:
+        columns = tuple(np.asarray(c, dtype=np.int64) for c in columns)
+    return columns
+
+
+def compute_prices(price_units, discount_units, offer_units, starts, ends, vat_units, today=None):
+    """
+    One pass over prepared columns. Returns a PriceBatch with the exact amounts
+    (net at NET_SCALE, VAT and gross at VAT_SCALE) and their halala roundings.
+    """
+    today = (today or timezone.localdate()).toordinal()
+
+    if np is not None and isinstance(price_units, np.ndarray):
+        offer_active = (
+            (offer_units >= 0) & (starts > 0) & (ends > 0)
+            & (starts <= today) & (today <= ends)
+        )
+        net = np.where(
+            offer_active,
+            offer_units * (NET_SCALE // HALALA_SCALE),
+            price_units * (10000 - discount_units),
+        )
+        vat = net * vat_units
+        gross = net * (VAT_SCALE // NET_SCALE) + vat
+    else:
+        net = [
+            o * (NET_SCALE // HALALA_SCALE)
+            if o >= 0 and s and e and s <= today <= e
+            else p * (10000 - d)
+            for p, d, o, s, e in zip(price_units, discount_units, offer_units, starts, ends)
+        ]
+        vat = [n * v for n, v in zip(net, vat_units)]
+        gross = [n * (VAT_SCALE // NET_SCALE) + t for n, t in zip(net, vat)]
+
+    return PriceBatch(net, vat, gross)
+
+
+def batch_prices(prices, discount_percentages, fixed_offer_prices, offer_start_dates, offer_end_dates, vat_rates, today=None):
+    """Convenience wrapper: `prepare_columns` followed by `compute_prices`."""
+    columns = prepare_columns(prices, discount_percentages, fixed_offer_prices, offer_start_dates, offer_end_dates, vat_rates)
+    return compute_prices(*columns, today=today)
+
+
+def _units_expression(field, places, default):
+    return Coalesce(Cast(Round(F(field) * 10 ** places), BigIntegerField()), Value(default))
+
+
+# values_list() names of the integer pricing columns, in compute_prices() order
+PRICE_UNIT_COLUMNS = ('_price_units', '_discount_units', '_offer_units', 'offer_start_date', 'offer_end_date', '_vat_units')
+
+
+def annotate_price_units(queryset):
+    """
+    Annotates a Product queryset with the integer pricing columns (PRICE_UNIT_COLUMNS),
+    computed by the database, so no Decimal is built per row.
+    """
+    return queryset.annotate(
+        _price_units=_units_expression('price', 2, 0),
+        _discount_units=Greatest(_units_expression('discount_percentage', 2, 0), Value(0)),
+        _offer_units=_units_expression('fixed_offer_price', 2, _NO_OFFER_PRICE),
+        _vat_units=_units_expression('vat_rate', 4, 0),
+    )
+
+
+def compute_prices_for_rows(rows, today=None):
+    """
+    Prices rows of PRICE_UNIT_COLUMNS values (dates still as dates) in one pass.
+    """
+    if not rows:
+        return PriceBatch([], [], [])
+    price_units, discount_units, offer_units, starts, ends, vat_units = zip(*rows)
+    columns = (
+        price_units, discount_units, offer_units,
+        [d.toordinal() if d else 0 for d in starts],
+        [d.toordinal() if d else 0 for d in ends],
+        vat_units,
+    )
+    if np is not None:
+        columns = tuple(np.asarray(c, dtype=np.int64) for c in columns)
+    return compute_prices(*columns, today=today)
+
+
+def batch_prices_for_queryset(queryset, today=None):
+    """
+    Prices every product of a queryset in one query and one pass.
+    Returns (product ids, PriceBatch) in the same order.
+    """
+    rows = list(annotate_price_units(queryset).values_list('pk', *PRICE_UNIT_COLUMNS))
+    return [row[0] for row in rows], compute_prices_for_rows([row[1:] for row in rows], today=today)
+
+
+class PriceBatch:
+    """Result of a batch pricing pass; arrays are aligned with the input rows."""
+
+    def __init__(self, net, vat, gross):
+        self.net = net
+        self.vat = vat
+        self.gross = gross
+
+    def __len__(self):
+        return len(self.net)
+
+    def net_halalas(self):
+        return _round_half_up(self.net, NET_SCALE)
+
+    def vat_halalas(self):
+        return _round_half_up(self.vat, VAT_SCALE)
+
+    def gross_halalas(self):
+        return _round_half_up(self.gross, VAT_SCALE)
+
+    def row(self, index):
+        """Exact Decimal amounts of one row, equal to the scalar Product methods."""
+        return {
+            'price_after_discount': to_decimal(self.net[index], NET_PLACES),
+            'vat_amount': to_decimal(self.vat[index], VAT_PLACES),
+            'total_price_with_vat': to_decimal(self.gross[index], VAT_PLACES),
+        }
+
+    def rounded_row(self, index):
+        """Row amounts rounded to 0.01 with ROUND_HALF_UP."""
+        return {
+            key: value.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            for key, value in self.row(index).items()
+        }
@@ -0,0 +1,140 @@
+# products/renditions.py
+"""
+Resized WebP/JPEG renditions of Product.image for catalogue screens.
+
+Renditions are named after the SHA-256 of the original file
+(product_renditions/ab/<digest>/<size>.webp), so products sharing a photo share
+its renditions and a file, once written, never changes. The digest of the current
+image is kept on the product (image_digest, image_digest_source); until the
+background task has filled it, rendition URLs point to the lazy endpoint, which
+renders the missing file on first request.
+"""
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+RENDITION_ROOT = 'product_renditions'
+# اسم المقاس -> أقصى طول للضلع بالبكسل
+RENDITION_SIZES = getattr(settings, 'PRODUCT_IMAGE_RENDITION_SIZES', {
+    'thumb': 160,
+    'small': 320,
+    'medium': 640,
+    'large': 1280,
+})
+# صيغة -> (صيغة Pillow، امتداد الملف)
+RENDITION_FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+RENDITION_QUALITY = getattr(settings, 'PRODUCT_IMAGE_RENDITION_QUALITY', 80)
+
+
+def file_digest(field_file):
+    sha256 = hashlib.sha256()
+    field_file.open('rb')
+    try:
+        for chunk in field_file.chunks():
+            sha256.update(chunk)
+    finally:
+        field_file.close()
+    return sha256.hexdigest()
+
+
+def rendition_name(digest, size, image_format):
+    return f"{RENDITION_ROOT}/{digest[:2]}/{digest}/{size}.{RENDITION_FORMATS[image_format][1]}"
+
+
+def has_current_digest(product):
+    return bool(product.image and product.image_digest and product.image_digest_source == product.image.name)
+
+
+def render(image, max_side, image_format):
+    """Returns the encoded bytes of `image` fitted inside max_side x max_side (never upscaled)."""
+    pillow_format, _extension = RENDITION_FORMATS[image_format]
+    resized = image.copy()
+    resized.thumbnail((max_side, max_side), Image.LANCZOS)
+    if pillow_format == 'JPEG' and resized.mode != 'RGB':
+        # JPEG لا يدعم الشفافية: تُدمج على خلفية بيضاء
+        background = Image.new('RGB', resized.size, (255, 255, 255))
+        rgba = resized.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        resized = background
+    elif pillow_format == 'WEBP' and resized.mode not in ('RGB', 'RGBA'):
+        resized = resized.convert('RGBA')
+    output = io.BytesIO()
+    resized.save(output, format=pillow_format, quality=RENDITION_QUALITY, optimize=pillow_format == 'JPEG')
+    return output.getvalue()
+
+
+def ensure_renditions(product, sizes=None, formats=None):
+    """
+    Writes the missing renditions of the product's image (all of them, or only the
+    given sizes/formats). The digest is recorded on the product only once the full
+    set exists, since from then on the serializer links the files directly.
+    Returns the digest, or None if the product has no image.
+    """
+    if not product.image:
+        return None
+    storage = product.image.storage
+    digest = product.image_digest if has_current_digest(product) else file_digest(product.image)
+    complete = sizes is None and formats is None
+    sizes = list(sizes or RENDITION_SIZES)
+    formats = list(formats or RENDITION_FORMATS)
+
+    missing = [
+        (size, image_format) for size in sizes for image_format in formats
+        if not storage.exists(rendition_name(digest, size, image_format))
+    ]
+    if missing:
+        product.image.open('rb')
+        try:
+            source = ImageOps.exif_transpose(Image.open(product.image))
+            source.load()
+        finally:
+            product.image.close()
+        for size, image_format in missing:
+            name = rendition_name(digest, size, image_format)
+            if storage.exists(name):  # written meanwhile by another worker for the same photo
+                continue
+            storage.save(name, ContentFile(render(source, RENDITION_SIZES[size], image_format)))
+        logger.info(f"Rendered {len(missing)} image renditions for product {product.pk} ({digest[:12]})")
+
+    if complete and not has_current_digest(product):
+        product.image_digest = digest
+        product.image_digest_source = product.image.name
+        type(product).objects.filter(pk=product.pk, image=product.image.name).update(
+            image_digest=digest, image_digest_source=product.image.name,
+        )
+    return digest
+
+
+def rendition_urls(product, request=None):
+    """
+    {size: {format: url}} for the serializer, or None without an image.
+    Direct storage URLs once the digest is known, lazy endpoint URLs before that.
+    """
+    if not product.image:
+        return None
+    if has_current_digest(product):
+        storage = product.image.storage
+
+        def url(size, fmt):
+            return storage.url(rendition_name(product.image_digest, size, fmt))
+    else:
+        def url(size, fmt):
+            return reverse('product-image-rendition', kwargs={'pk': product.pk, 'size': size, 'image_format': fmt})
+
+    return {
+        size: {
+            fmt: request.build_absolute_uri(url(size, fmt)) if request is not None else url(size, fmt)
+            for fmt in RENDITION_FORMATS
+        }
+        for size in RENDITION_SIZES
+    }
@@ -0,0 +1,155 @@
+# products/scan_cache.py
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Product
+
+VERSION_KEY = 'products:scan_cache:version'
+SHARED_TIMEOUT = 60 * 60
+_MISSING = {}
+
+
+def _fresh_version():
+    # If the shared key was evicted, restart from a value no process can still hold
+    return int(time.time() * 1000)
+
+
+def product_scan_record(product):
+    """
+    Compact product record returned to the cashier scan endpoints.
+    Prices depend on the offer window, so the record is only valid on `valid_on`.
+    """
+    price_after_discount = product.price_after_discount()
+    vat_amount = product.vat_amount()
+    return {
+        'id': product.pk,
+        'name': product.name,
+        'barcode': product.barcode,
+        'price': product.price,
+        'price_after_discount': price_after_discount,
+        'vat_rate': product.vat_rate,
+        'vat_amount': vat_amount,
+        'total_price_with_vat': price_after_discount + vat_amount,
+        'valid_on': timezone.localdate().isoformat(),
+    }
+
+
+class ScanRecordCache:
+    """
+    Process-local LRU (barcode -> product record) in front of the shared Django cache.
+    Entries are tagged with a global version that Product signals bump on every change.
+    The shared version is re-read at most every `version_check_seconds`, so a warm
+    lookup touches neither the shared cache nor the database.
+    """
+
+    def __init__(self, max_size, version_check_seconds=5):
+        self.max_size = max_size
+        self.version_check_seconds = version_check_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked_at = 0.0
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _current_version(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._version is not None and now - self._version_checked_at < self.version_check_seconds:
+                return self._version
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, _fresh_version(), timeout=None)
+            version = cache.get(VERSION_KEY)
+        with self._lock:
+            self._version_checked_at = now
+        return version
+
+    def lookup(self, code):
+        if not code:
+            return None
+        version = self._current_version()
+        today = timezone.localdate().isoformat()
+
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            record = self._entries.get(code)
+            if record is not None and (record is _MISSING or record['valid_on'] == today):
+                self._entries.move_to_end(code)
+                self.local_hits += 1
+                return record or None
+
+        shared_key = f"products:scan:{version}:{code}"
+        record = cache.get(shared_key)
+        if record is not None and (not record or record['valid_on'] == today):
+            with self._lock:
+                self.shared_hits += 1
+        else:
+            with self._lock:
+                self.misses += 1
+            product = Product.objects.filter(barcode=code).first()
+            record = product_scan_record(product) if product else _MISSING
+            cache.set(shared_key, record, timeout=SHARED_TIMEOUT)
+
+        with self._lock:
+            self._entries[code] = record or _MISSING
+            self._entries.move_to_end(code)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return record or None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.local_hits + self.shared_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'version': self._version,
+                'local_hits': self.local_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_ratio': round((self.local_hits + self.shared_hits) / lookups, 4) if lookups else None,
+            }
+
+
+scan_cache = ScanRecordCache(
+    getattr(settings, 'SCAN_CACHE_MAX_ENTRIES', 5000),
+    getattr(settings, 'SCAN_CACHE_VERSION_CHECK_SECONDS', 5),
+)
+
+
+def lookup_scan_record(code):
+    """
+    Returns the compact record of the product with this barcode/QR payload, or None.
+    A warm lookup costs no database query.
+    """
+    return scan_cache.lookup(code)
+
+
+def invalidate_scan_cache():
+    """
+    Bumps the shared version once the current transaction commits, so every process
+    drops its local entries on its next lookup.
+    """
+    def bump():
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, _fresh_version(), timeout=None)
+        scan_cache.clear()
+
+    transaction.on_commit(bump)
@@ -0,0 +1,103 @@
+# products/search.py
+"""
+Product search by name, barcode and item number, with prefix and misspelling tolerance.
+
+PostgreSQL: products_product.search_vector (tsvector, Arabic + simple configurations)
+kept current by a trigger, plus pg_trgm GIN indexes on name and barcode
+(migration 0007). SQLite (local development): the products_product_fts FTS5 table.
+Any other backend falls back to icontains.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, Exists, FloatField, OuterRef, Q
+from django.db.models.expressions import RawSQL
+
+from .models import BranchProductInventory
+
+MAX_SEARCH_TOKENS = 8
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_sqlite_fts_tables = {}
+
+
+def search_tokens(term):
+    return _TOKEN_RE.findall(term or '')[:MAX_SEARCH_TOKENS]
+
+
+def scope_to_branch(queryset, branch_id):
+    """Products stocked in the branch (an inventory row exists), without a join/distinct."""
+    return queryset.filter(
+        Exists(BranchProductInventory.objects.filter(product_id=OuterRef('pk'), branch_id=branch_id))
+    )
+
+
+def search_products(queryset, term, branch_id=None, limit=20):
+    """
+    Best matches first, at most `limit` products of `queryset`.
+    """
+    tokens = search_tokens(term)
+    if not tokens:
+        return queryset.none()
+    if branch_id:
+        queryset = scope_to_branch(queryset, branch_id)
+
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        queryset = _postgres_search(queryset, term.strip(), tokens)
+    elif vendor == 'sqlite' and _sqlite_fts_available(queryset.db):
+        queryset = _sqlite_search(queryset, tokens)
+    else:
+        queryset = _basic_search(queryset, term.strip())
+    return queryset[:limit]
+
+
+def _postgres_search(queryset, term, tokens):
+    # كل كلمة كبادئة (prefix) لدعم البحث الجزئي: "حلي:* & نادك:*"
+    tsquery = ' & '.join(f"{token}:*" for token in tokens)
+    match = RawSQL(
+        "(products_product.search_vector @@ to_tsquery('simple', %s)"
+        " OR products_product.search_vector @@ to_tsquery('arabic', %s)"
+        " OR products_product.name %% %s"
+        " OR products_product.barcode LIKE %s)",
+        [tsquery, tsquery, term, _like_prefix(term)],
+        output_field=BooleanField(),
+    )
+    rank = RawSQL(
+        "ts_rank(products_product.search_vector, to_tsquery('simple', %s) || to_tsquery('arabic', %s))"
+        " + similarity(products_product.name, %s)",
+        [tsquery, tsquery, term],
+        output_field=FloatField(),
+    )
+    return queryset.filter(match).annotate(search_rank=rank).order_by('-search_rank', 'pk')
+
+
+def _like_prefix(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _sqlite_fts_available(alias):
+    if alias not in _sqlite_fts_tables:
+        _sqlite_fts_tables[alias] = 'products_product_fts' in connections[alias].introspection.table_names()
+    return _sqlite_fts_tables[alias]
+
+
+def _sqlite_search(queryset, tokens):
+    fts_query = ' '.join('"%s"*' % token for token in tokens)
+    return queryset.filter(
+        pk__in=RawSQL(
+            "SELECT rowid FROM products_product_fts WHERE products_product_fts MATCH %s", [fts_query]
+        )
+    ).annotate(
+        search_rank=RawSQL(
+            "(SELECT -rank FROM products_product_fts"
+            " WHERE products_product_fts MATCH %s AND rowid = products_product.id)",
+            [fts_query],
+            output_field=FloatField(),
+        )
+    ).order_by('-search_rank', 'pk')
+
+
+def _basic_search(queryset, term):
+    return queryset.filter(
+        Q(name__icontains=term) | Q(barcode__startswith=term) | Q(item_number__startswith=term)
+    ).order_by('name', 'pk')
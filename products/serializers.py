@@ -5,20 +5,22 @@ from django.contrib.auth import get_user_model
 from django.db.models import Sum
 
 # استيراد النماذج الصحيحة لتطبيق products
-from .models import Product, Department, ProductCategory, BranchProductInventory
+from .models import Product, Department, ProductCategory, BranchProductInventory, InventoryBucket, ImportJob
 # لا نحتاج لاستيراد Branch هنا مباشرة، لأننا سنتعامل معها عبر ProductInventory
+from .renditions import rendition_urls
+from mysite.fieldsets import SparseFieldsetSerializerMixin
 
 User = get_user_model() # إذا كنت تستخدم User في سيرياليزرات المنتجات أو الأقسام
 
 # --- Serializer for ProductCategory ---
-class ProductCategorySerializer(serializers.ModelSerializer):
+class ProductCategorySerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = ProductCategory
         fields = ['id', 'name', 'description', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
 
 # --- Serializer for Department ---
-class DepartmentSerializer(serializers.ModelSerializer):
+class DepartmentSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     # branch_name لم يعد مطلوباً هنا إذا لم تكن بحاجته مباشرة في تمثيل القسم
     # ولكن إذا أردت تضمين اسم الفرع، يجب أن يكون الفرع نفسه متاحاً
     # للحفاظ على التوافق مع الكود القديم:
@@ -33,22 +35,38 @@ class DepartmentSerializer(serializers.ModelSerializer):
         }
 
 # --- Serializer for BranchProductInventory ---
-class BranchProductInventorySerializer(serializers.ModelSerializer):
+class BranchProductInventorySerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     branch_name = serializers.CharField(source='branch.name', read_only=True)
     # يمكن إضافة المزيد من تفاصيل الفرع إذا لزم الأمر، مثل Store Name
     store_name = serializers.CharField(source='branch.store.name', read_only=True)
+    # للمنتجات الساخنة: الكمية الفعلية = الصف + مجموع الـ buckets
+    on_hand_quantity = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = BranchProductInventory
-        fields = ['id', 'branch', 'branch_name', 'store_name', 'quantity', 'last_updated_by', 'updated_at', 'created_at']
-        read_only_fields = ['last_updated_by', 'updated_at', 'created_at', 'branch_name', 'store_name']
+        fields = ['id', 'branch', 'branch_name', 'store_name', 'quantity', 'on_hand_quantity', 'is_hot', 'last_updated_by', 'updated_at', 'created_at']
+        read_only_fields = ['last_updated_by', 'updated_at', 'created_at', 'branch_name', 'store_name', 'is_hot']
+        # أعمدة النموذج التي تعتمد عليها الحقول المحسوبة (لـ ?fields= / ?omit=)
+        sparse_field_sources = {'on_hand_quantity': ('quantity', 'is_hot')}
         extra_kwargs = {
             'branch': {'write_only': True} # الفرع يجب أن يكون موجوداً عند الإنشاء/التعديل
         }
 
 
+# --- Serializer for product search results ---
+class ProductSearchResultSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    # نتيجة مختصرة لنقطة البحث (بدون المخزون المتداخل)
+    price_after_discount = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    total_price_with_vat = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'barcode', 'item_number', 'price', 'price_after_discount', 'total_price_with_vat']
+        read_only_fields = fields
+
+
 # --- Serializer for Product ---
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     # إزالة branch_name و store_name لأن Product لم يعد مرتبطاً مباشرة بـ Branch
 
     department_name = serializers.CharField(source='department.name', read_only=True)
@@ -56,6 +74,8 @@ class ProductSerializer(serializers.ModelSerializer):
     last_updated_by_username = serializers.CharField(source='last_updated_by.username', read_only=True)
 
     image = serializers.ImageField(required=False, allow_null=True)
+    # روابط المقاسات المصغرة للصورة {size: {webp, jpeg}} بدلاً من تحميل الصورة الأصلية في شاشات الكتالوج
+    image_renditions = serializers.SerializerMethodField()
 
     # حقول للقراءة فقط تعتمد على الدوال المحسوبة في نموذج Product
     price_after_discount = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
@@ -91,7 +111,7 @@ class ProductSerializer(serializers.ModelSerializer):
             'branch_inventories', # Nested serializer للمخزون لكل فرع
             'total_quantity_in_all_branches', # حقل محسوب لإجمالي الكمية
 
-            'image',
+            'image', 'image_renditions',
             'last_updated_by', 'last_updated_by_username',
             'created_at', 'updated_at',
             
@@ -102,8 +122,17 @@ class ProductSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at', 'department_name', 'category_name', 'last_updated_by_username',
             'price_after_discount', 'discounted_amount', 'vat_amount', 'total_price_with_vat',
             'branch_inventories', # بما أنه nested read_only
-            'total_quantity_in_all_branches',
+            'total_quantity_in_all_branches', 'image_renditions',
         ]
+        # أعمدة النموذج التي تعتمد عليها الحقول المحسوبة (لـ ?fields= / ?omit=)
+        sparse_field_sources = {
+            'price_after_discount': Product.PRICE_SOURCE_FIELDS + Product.EFFECTIVE_PRICE_FIELDS,
+            'discounted_amount': Product.PRICE_SOURCE_FIELDS + Product.EFFECTIVE_PRICE_FIELDS,
+            'vat_amount': Product.PRICE_SOURCE_FIELDS + Product.EFFECTIVE_PRICE_FIELDS,
+            'total_price_with_vat': Product.PRICE_SOURCE_FIELDS + Product.EFFECTIVE_PRICE_FIELDS,
+            'total_quantity_in_all_branches': (), # annotation في ProductViewSet
+            'image_renditions': ('image', 'image_digest', 'image_digest_source'),
+        }
         extra_kwargs = {
             'department': {'write_only': True, 'required': False, 'allow_null': True},
             'category': {'write_only': True, 'required': False, 'allow_null': True}, # category يمكن أن تكون write_only
@@ -111,13 +140,22 @@ class ProductSerializer(serializers.ModelSerializer):
         }
         # تم إزالة depth = 1
 
+    def get_image_renditions(self, obj):
+        return rendition_urls(obj, self.context.get('request'))
+
     def get_total_quantity_in_all_branches(self, obj):
         """
         يحسب إجمالي الكمية المتوفرة لهذا المنتج عبر جميع الفروع من سجلات المخزون.
         """
+        # ProductViewSet يحسبها مسبقاً في SQL (annotate) لتجنب استعلامين لكل منتج
+        annotated = getattr(obj, 'total_quantity_in_all_branches', None)
+        if annotated is not None:
+            return annotated
         # استخدام .aggregate() للحصول على مجموع الكميات من جميع BranchProductInventory المرتبطة بالمنتج
-        total_quantity = obj.branch_inventories.aggregate(total=Sum('quantity'))['total']
-        return total_quantity if total_quantity is not None else 0
+        total_quantity = obj.branch_inventories.aggregate(total=Sum('quantity'))['total'] or 0
+        # المنتجات الساخنة (hot SKU) تحتفظ بجزء من الكمية في buckets
+        total_quantity += InventoryBucket.objects.filter(inventory__product=obj).aggregate(total=Sum('quantity'))['total'] or 0
+        return total_quantity
 
     def create(self, validated_data):
         # DRF لا يتعامل مع Inlines تلقائياً عند الإنشاء/التعديل بشكل مباشر عبر Serializer الرئيسي
@@ -142,3 +180,22 @@ class ProductSerializer(serializers.ModelSerializer):
         
         return super().update(instance, validated_data)
 
+
+# --- Serializer for background product import jobs ---
+class ImportJobSerializer(serializers.ModelSerializer):
+    branch_name = serializers.CharField(source='branch.name', read_only=True)
+    progress = serializers.FloatField(read_only=True)
+    has_error_file = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'branch', 'branch_name', 'status', 'progress',
+            'total_rows', 'processed_rows', 'next_row',
+            'created_count', 'updated_count', 'inventory_records', 'error_count', 'has_error_file',
+            'message', 'started_at', 'finished_at', 'created_at', 'updated_at',
+        ]
+        read_only_fields = fields
+
+    def get_has_error_file(self, obj):
+        return bool(obj.error_file)
@@ -0,0 +1,32 @@
+# products/signals.py
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django_q.tasks import async_task
+
+from .models import Product
+from .renditions import has_current_digest
+from .scan_cache import invalidate_scan_cache
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_scan_cache_on_product_change(sender, instance, **kwargs):
+    """
+    Any change to a product (price, barcode, VAT...) invalidates the cashier scan cache.
+    """
+    if kwargs.get('raw'):
+        return
+    invalidate_scan_cache()
+
+
+@receiver(post_save, sender=Product)
+def queue_image_renditions(sender, instance, **kwargs):
+    """
+    A new or replaced image gets its resized renditions rendered in the background.
+    """
+    if kwargs.get('raw') or not instance.image or has_current_digest(instance):
+        return
+    product_id = instance.pk
+    transaction.on_commit(lambda: async_task('products.tasks.generate_image_renditions', product_id))
@@ -0,0 +1,199 @@
+# products/tasks.py
+
+import csv
+import logging
+import os
+from datetime import timedelta
+
+import openpyxl
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils import timezone
+from django_q.tasks import async_task
+
+from .importer import ImportResult, ProductImporter, column_positions
+from .inventory import promote_to_hot, rebalance_buckets
+from .models import BranchProductInventory, ImportJob, Product, StockReservation
+from .renditions import ensure_renditions
+from .scan_cache import invalidate_scan_cache
+
+logger = logging.getLogger(__name__)
+
+
+def expire_stock_reservations(batch_size=1000):
+    """
+    مهمة دورية (django_q) لحذف الحجوزات المنتهية على دفعات،
+    حتى لا تحجب السلال المهجورة المخزون الحقيقي.
+    """
+    now = timezone.now()
+    expired = StockReservation.objects.filter(expires_at__lte=now).order_by('pk')
+    total = 0
+    while True:
+        ids = list(expired.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        total += StockReservation.objects.filter(pk__in=ids, expires_at__lte=now).delete()[0]
+    if total:
+        logger.info(f"Expired {total} stock reservations")
+    return total
+
+
+def promote_hot_inventory(inventory_id):
+    """
+    تُستدعى تلقائياً عندما يتكرر انتظار القفل على صف مخزون واحد (hot SKU).
+    """
+    try:
+        promote_to_hot(inventory_id)
+    except BranchProductInventory.DoesNotExist:
+        logger.warning(f"Cannot promote missing inventory {inventory_id} to hot SKU mode")
+
+
+def rebalance_hot_inventories():
+    """
+    مهمة دورية لإعادة توزيع الكميات بين buckets المنتجات الساخنة.
+    """
+    count = 0
+    for inventory_id in BranchProductInventory.objects.filter(is_hot=True).values_list('pk', flat=True):
+        if rebalance_buckets(inventory_id):
+            count += 1
+    return count
+
+
+def refresh_effective_prices(batch_size=1000):
+    """
+    مهمة دورية لتحديث السعر الفعلي المحسوب مسبقاً للمنتجات التي بدأ أو انتهى عرضها
+    (price_valid_until < اليوم) أو التي لم يُحسب سعرها بعد.
+    """
+    today = timezone.localdate()
+    stale = Product.objects.filter(
+        Q(current_price__isnull=True) | Q(price_valid_until__lt=today)
+    ).order_by('pk')
+    total = 0
+    last_pk = 0
+    while True:
+        products = list(stale.filter(pk__gt=last_pk)[:batch_size])
+        if not products:
+            break
+        for product in products:
+            product.refresh_effective_price(today=today, save=False)
+        Product.objects.bulk_update(products, Product.EFFECTIVE_PRICE_FIELDS)
+        total += len(products)
+        last_pk = products[-1].pk
+    if total:
+        invalidate_scan_cache()
+        logger.info(f"Refreshed effective prices of {total} products")
+    return total
+
+
+def _append_import_errors(job, errors):
+    """
+    Appends (row, message) pairs to the job's error CSV, creating it on first use.
+    """
+    if not job.error_file:
+        job.error_file.name = f"product_imports/errors/import_{job.pk}_errors.csv"
+    path = default_storage.path(job.error_file.name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    is_new = not os.path.exists(path)
+    with open(path, 'a', newline='', encoding='utf-8-sig') as handle:
+        writer = csv.writer(handle)
+        if is_new:
+            writer.writerow(['row', 'error'])
+        writer.writerows(errors)
+
+
+def run_import_job(job_id):
+    """
+    مهمة django_q لاستيراد ملف Excel على دفعات. تحفظ نقطة الاستئناف (next_row) بعد كل دفعة
+    مُثبتة، فإذا انقطعت المهمة (timeout/إعادة تشغيل العامل) تُستأنف من آخر دفعة بدلاً من البداية.
+    """
+    job = ImportJob.objects.select_related('branch', 'created_by').filter(pk=job_id).first()
+    if job is None or job.status in (ImportJob.COMPLETED, ImportJob.FAILED):
+        return None
+
+    ImportJob.objects.filter(pk=job.pk).update(
+        status=ImportJob.RUNNING, started_at=job.started_at or timezone.now(), updated_at=timezone.now()
+    )
+    result = ImportResult()
+    result.created, result.updated = job.created_count, job.updated_count
+    result.inventory_records, result.rows = job.inventory_records, job.processed_rows
+    base_errors = job.error_count
+    written_errors = 0
+
+    def checkpoint(result, next_row):
+        nonlocal written_errors
+        if len(result.errors) > written_errors:
+            _append_import_errors(job, result.errors[written_errors:])
+            written_errors = len(result.errors)
+        job.next_row = next_row
+        job.processed_rows = result.rows
+        job.created_count = result.created
+        job.updated_count = result.updated
+        job.inventory_records = result.inventory_records
+        job.error_count = base_errors + written_errors
+        job.save(update_fields=[
+            'next_row', 'processed_rows', 'created_count', 'updated_count',
+            'inventory_records', 'error_count', 'error_file', 'updated_at',
+        ])
+
+    try:
+        with job.file.open('rb') as handle:
+            workbook = openpyxl.load_workbook(handle, read_only=True, data_only=True)
+            try:
+                sheet = workbook.active
+                if job.total_rows is None and sheet.max_row:
+                    job.total_rows = max(sheet.max_row - 1, 0)
+                    job.save(update_fields=['total_rows', 'updated_at'])
+                header = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), None)
+                ProductImporter(job.branch, job.created_by).run(
+                    sheet.iter_rows(min_row=job.next_row, values_only=True),
+                    column_positions(header),
+                    start_row=job.next_row,
+                    result=result,
+                    on_chunk=checkpoint,
+                )
+            finally:
+                workbook.close()
+    except Exception as e:
+        logger.exception(f"Product import job {job.pk} failed at row {job.next_row}")
+        ImportJob.objects.filter(pk=job.pk).update(
+            status=ImportJob.FAILED, message=str(e), finished_at=timezone.now(), updated_at=timezone.now()
+        )
+        return None
+
+    ImportJob.objects.filter(pk=job.pk).update(
+        status=ImportJob.COMPLETED, total_rows=job.processed_rows,
+        finished_at=timezone.now(), updated_at=timezone.now(),
+    )
+    logger.info(f"Product import job {job.pk} completed: {result.created} created, {result.updated} updated")
+    return job.pk
+
+
+def resume_stalled_import_jobs():
+    """
+    مهمة دورية: تعيد جدولة مهام الاستيراد العالقة (RUNNING بدون تقدم) من نقطة الاستئناف.
+    """
+    stalled_before = timezone.now() - timedelta(minutes=getattr(settings, 'IMPORT_JOB_STALL_MINUTES', 10))
+    count = 0
+    for job_id in ImportJob.objects.filter(status=ImportJob.RUNNING, updated_at__lt=stalled_before).values_list('pk', flat=True):
+        ImportJob.objects.filter(pk=job_id).update(updated_at=timezone.now())
+        async_task('products.tasks.run_import_job', job_id)
+        count += 1
+    if count:
+        logger.warning(f"Resumed {count} stalled product import jobs")
+    return count
+
+
+def generate_image_renditions(product_id):
+    """
+    تُستدعى بعد رفع/تغيير صورة المنتج لإنشاء المقاسات المصغرة (WebP و JPEG).
+    """
+    product = Product.objects.filter(pk=product_id).first()
+    if product is None or not product.image:
+        return None
+    try:
+        return ensure_renditions(product)
+    except (OSError, ValueError) as e:
+        # صورة تالفة أو صيغة غير مدعومة: تبقى الصورة الأصلية فقط
+        logger.warning(f"Cannot render image renditions for product {product_id}: {e}")
+        return None
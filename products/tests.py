@@ -1,3 +1,237 @@
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
 from django.test import TestCase
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from stores.models import Branch, Store
+from users.constants import UserType
+from users.models import Role, UserAccount
+
+from .inventory import (
+    available_quantity,
+    release_reservations,
+    reserve_stock,
+    transfer_reservations,
+)
+from .models import BranchProductInventory, Department, Product, ProductCategory, StockReservation
+from .scan_cache import VERSION_KEY, lookup_scan_record, scan_cache
+from .tasks import expire_stock_reservations
+
+PRODUCT_LIST_URL = '/api/products/products/'
+
+
+class ProductListTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        store = Store.objects.create(name="Store", address="Riyadh")
+        cls.branches = [Branch.objects.create(store=store, name=f"Branch {i}", address="Riyadh") for i in range(2)]
+        cls.category = ProductCategory.objects.create(name="Category")
+        cls.department = Department.objects.create(name="Department", branch=cls.branches[0])
+        role = Role.objects.create(role_name=UserType.APP_OWNER.value)
+        cls.user = UserAccount.objects.create(email="owner@example.com", role=role, is_superuser=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_products(self, count):
+        for _ in range(count):
+            number = Product.objects.count()
+            product = Product.objects.create(
+                name=f"Product {number}", barcode=f"P{number:05d}", price=Decimal('10.00'),
+                category=self.category, department=self.department, last_updated_by=self.user,
+            )
+            for branch in self.branches:
+                BranchProductInventory.objects.create(product=product, branch=branch, quantity=5)
+
+    def list_products(self, query=''):
+        response = self.client.get(PRODUCT_LIST_URL + query)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+
+class ProductListQueryTests(ProductListTestCase):
+    def test_query_count_does_not_grow_with_the_page(self):
+        self.add_products(5)
+        self.list_products()  # principal و نسخ الكاش المشترك
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self.list_products()), 5)
+        expected = len(queries)  # قبل الطلب التالي: request_started يفرّغ سجل الاستعلامات
+
+        self.add_products(5)
+        self.list_products()
+        with self.assertNumQueries(expected):
+            self.assertEqual(len(self.list_products()), 10)
+
+
+class ProductSparseFieldsetTests(ProductListTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_products(3)
+        self.list_products()  # principal و نسخ الكاش المشترك
+
+    def capture(self, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            results = self.list_products(query)
+        return results, [query['sql'] for query in queries.captured_queries]
+
+    def product_query(self, queries):
+        return next(sql for sql in queries if sql.startswith('SELECT') and 'FROM "products_product"' in sql)
+
+    def test_fields_keeps_only_the_listed_fields(self):
+        full_results, full_queries = self.capture()
+        results, queries = self.capture('?fields=id,name')
+
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(set(row) == {'id', 'name'} for row in results))
+        self.assertGreater(len(set(full_results[0])), 10)
+        # لا JOIN ولا prefetch ولا أعمدة غير مطلوبة
+        self.assertLess(len(queries), len(full_queries))
+        product_query = self.product_query(queries)
+        self.assertNotIn('JOIN', product_query)
+        self.assertNotIn('"products_product"."barcode"', product_query)
+        self.assertIn('"products_product"."barcode"', self.product_query(full_queries))
+
+    def test_omit_drops_the_nested_inventories_and_their_query(self):
+        full_results, full_queries = self.capture()
+        results, queries = self.capture('?omit=branch_inventories')
+
+        self.assertEqual(set(results[0]), set(full_results[0]) - {'branch_inventories'})
+        self.assertEqual(len(queries), len(full_queries) - 1)
+        self.assertFalse(any('FROM "products_branchproductinventory"' in sql and 'IN (' in sql for sql in queries))
+
+
+class ProductExportTests(ProductListTestCase):
+    url = '/api/products/product-excel-upload/export/'
+
+    def test_malformed_ids_are_a_bad_request(self):
+        for query in ('?branch_id=abc', '?store_id=abc', '?branch_id=1', '?store_id=1.5'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(self.url + query).status_code, 400)
+
+    def test_unknown_ids_are_not_found(self):
+        for query in (f'?branch_id={uuid.uuid4()}', '?store_id=999999'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(self.url + query).status_code, 404)
+
+    def test_branch_export(self):
+        self.add_products(2)
+        response = self.client.get(f'{self.url}?branch_id={self.branches[0].pk}&file_format=csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b''.join(response.streaming_content).decode('utf-8-sig').strip().splitlines()), 3)
+
+
+class StockReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        store = Store.objects.create(name="Store", address="Riyadh")
+        cls.branch = Branch.objects.create(store=store, name="Branch", address="Riyadh")
+        cls.product = Product.objects.create(name="Product", price=Decimal('10.00'))
+        cls.inventory = BranchProductInventory.objects.create(product=cls.product, branch=cls.branch, quantity=5)
+
+    def reserve(self, holder, **kwargs):
+        return reserve_stock(self.branch.pk, self.product.pk, holder, **kwargs)
+
+    def available(self):
+        return available_quantity(self.branch.pk, self.product.pk)
+
+    def held(self, holder):
+        return StockReservation.objects.get(holder=holder).quantity
+
+    def test_available_is_on_hand_minus_live_holds(self):
+        self.reserve('cart:1', quantity=2)
+        self.reserve('temp_order:1', quantity=1)
+        self.assertEqual(self.available(), 2)
+        # الحجز لا يلمس الكمية الفعلية
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 5)
+
+    def test_reserving_more_than_available_is_refused(self):
+        self.reserve('cart:1', quantity=4)
+        with self.assertRaises(ValidationError):
+            self.reserve('cart:2', quantity=2)
+        with self.assertRaises(ValidationError):
+            self.reserve('cart:1', delta=2)
+        self.assertEqual(self.held('cart:1'), 4)
+        self.assertFalse(StockReservation.objects.filter(holder='cart:2').exists())
+        # الحاجز نفسه يستطيع رفع حجزه حتى كامل المخزون
+        self.assertEqual(self.reserve('cart:1', quantity=5), 5)
+
+    def test_quantity_replaces_the_hold_and_delta_adds_to_it(self):
+        self.reserve('cart:1', quantity=3)
+        self.assertEqual(self.reserve('cart:1', quantity=1), 1)
+        self.assertEqual(self.reserve('cart:1', delta=2), 3)
+        self.assertEqual(self.reserve('cart:1', delta=-1), 2)
+        self.assertEqual(StockReservation.objects.filter(holder='cart:1').count(), 1)
+        self.assertEqual(self.held('cart:1'), 2)
+
+        self.assertEqual(self.reserve('cart:1', quantity=0), 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_unknown_inventory_is_refused(self):
+        other = Product.objects.create(name="Other", price=Decimal('1.00'))
+        with self.assertRaises(ValidationError):
+            reserve_stock(self.branch.pk, other.pk, 'cart:1', quantity=1)
+
+    def test_reaper_drops_expired_holds_only(self):
+        now = timezone.now()
+        for holder, expires_at in (('cart:1', now - timedelta(minutes=1)), ('cart:2', now + timedelta(minutes=10)), ('order:1', None)):
+            StockReservation.objects.create(branch=self.branch, product=self.product, holder=holder, quantity=1, expires_at=expires_at)
+        # الحجز المنتهي لا يحجب المخزون حتى قبل حذفه
+        self.assertEqual(self.available(), 3)
+
+        self.assertEqual(expire_stock_reservations(), 1)
+        self.assertEqual(sorted(StockReservation.objects.values_list('holder', flat=True)), ['cart:2', 'order:1'])
+        self.assertEqual(self.available(), 3)
+
+    def test_expired_hold_is_renewed_from_zero(self):
+        StockReservation.objects.create(
+            branch=self.branch, product=self.product, holder='cart:1', quantity=4,
+            expires_at=timezone.now() - timedelta(minutes=1),
+        )
+        self.assertEqual(self.reserve('cart:1', delta=1), 1)
+        self.assertGreater(StockReservation.objects.get(holder='cart:1').expires_at, timezone.now())
+
+    def test_transfer_and_release(self):
+        self.reserve('temp_order:1', quantity=2)
+        self.assertEqual(transfer_reservations('temp_order:1', 'order:1'), 1)
+        hold = StockReservation.objects.get()
+        self.assertEqual((hold.holder, hold.quantity, hold.expires_at), ('order:1', 2, None))
+
+        self.assertEqual(release_reservations('order:1'), 1)
+        self.assertEqual(self.available(), 5)
+
+
+class ScanCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name="Product", barcode="6281000000001", price=Decimal('10.00'))
+
+    def setUp(self):
+        scan_cache.clear()
+        self.addCleanup(scan_cache.clear)
+
+    def test_warm_lookup_runs_no_query(self):
+        self.assertEqual(lookup_scan_record(self.product.barcode)['id'], self.product.pk)
+        self.assertIsNone(lookup_scan_record("missing"))
+        with self.assertNumQueries(0):
+            self.assertEqual(lookup_scan_record(self.product.barcode)['name'], "Product")
+            self.assertIsNone(lookup_scan_record("missing"))
+
+    def test_changes_from_other_processes_are_seen_after_the_check_interval(self):
+        lookup_scan_record(self.product.barcode)
+        # عملية أخرى عدّلت المنتج ورفعت الإصدار المشترك دون أن تمسح الكاش المحلي لهذه العملية
+        Product.objects.filter(pk=self.product.pk).update(name="Renamed")
+        cache.incr(VERSION_KEY)
+        self.assertEqual(lookup_scan_record(self.product.barcode)['name'], "Product")
 
-# Create your tests here.
+        self.addCleanup(setattr, scan_cache, 'version_check_seconds', scan_cache.version_check_seconds)
+        scan_cache.version_check_seconds = 0
+        self.assertEqual(lookup_scan_record(self.product.barcode)['name'], "Renamed")
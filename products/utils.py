@@ -3,9 +3,9 @@
 from decimal import Decimal
 from django.utils import timezone
 
-def is_offer_active(start_date, end_date):
+def is_offer_active(start_date, end_date, today=None):
     if start_date and end_date:
-        today = timezone.localdate()
+        today = today or timezone.localdate()
         return start_date <= today <= end_date
     return False
 
@@ -1,6 +1,6 @@
 # C:\Users\DELL\SER SQL MY APP\products\views.py
 
-from decimal import Decimal
+import uuid
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
 from rest_framework_simplejwt.authentication import JWTAuthentication
@@ -9,27 +9,42 @@ from rest_framework import serializers
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
 from django.db import transaction
-from django.db.models import F, Q, Sum # Added Sum for aggregation
+from django.db.models import F, Prefetch, Q, Sum # Added Sum for aggregation
 from django.conf import settings
-import openpyxl
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils import timezone
+from django_q.tasks import async_task
+import logging
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.exceptions import ValidationError, NotFound # Added NotFound
 # from django.contrib import messages # Import messages for ProductUploadExcelView warnings - Not needed for API response
 
 # استيراد النماذج الصحيحة
-from .models import Department, Product, ProductCategory, BranchProductInventory, InventoryMovement
-from .serializers import DepartmentSerializer, ProductSerializer, ProductCategorySerializer, BranchProductInventorySerializer
+from .models import Department, Product, ProductCategory, BranchProductInventory, InventoryMovement, ImportJob
+from .serializers import DepartmentSerializer, ProductSerializer, ProductCategorySerializer, BranchProductInventorySerializer, ProductSearchResultSerializer, ImportJobSerializer
+from .inventory import annotate_on_hand, total_quantity_expression
+from .scan_cache import lookup_scan_record, scan_cache
+from .search import search_products
+from .exporter import build_xlsx, export_rows, stream_csv
+from .catalogue import build_snapshot, encode_snapshot, version_for
+from .renditions import RENDITION_SIZES, ensure_renditions, rendition_name
 from users.models import UserAccount, Role
-from stores.models import Branch
-from geopy.distance import geodesic # مكتبة لحساب المسافة الجغرافية
+from users.constants import UserType
+from stores.models import Branch, Store
+from stores.geo import has_located_branches, nearest_branch, scan_radius_km
 from django.utils.translation import gettext_lazy as _
 
 # استيراد CustomPermission
 from mysite.permissions import CustomPermission
+from authentication.principal import get_principal
+from mysite.pagination import TimestampCursorPagination
+from mysite.fieldsets import SparseFieldsetViewMixin
+
+logger = logging.getLogger(__name__)
 
 
 # --- API ViewSets for Product Categories ---
-class ProductCategoryViewSet(viewsets.ModelViewSet):
+class ProductCategoryViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = ProductCategory.objects.all()
     serializer_class = ProductCategorySerializer
     authentication_classes = [JWTAuthentication]
@@ -67,28 +82,14 @@ class ProductCategoryViewSet(viewsets.ModelViewSet):
 
 
 # --- API ViewSets for Departments ---
-class DepartmentViewSet(viewsets.ModelViewSet):
+class DepartmentViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated, CustomPermission]
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_superuser or user.is_app_owner() or user.is_project_manager() or user.is_app_staff_user():
-            return Department.objects.all()
-        
-        if user.is_store_manager_user() and user.store:
-            return Department.objects.filter(branch__store=user.store)
-        
-        if (user.is_branch_manager_user() or user.is_general_staff_user() or \
-            user.is_cashier_user() or user.is_shelf_organizer_user() or user.is_customer_service_user()) and user.branch:
-            return Department.objects.filter(branch=user.branch)
-            
-        if user.is_platform_customer():
-            return Department.objects.all() # العملاء يمكنهم رؤية جميع الأقسام (للقراءة فقط)
-            
-        return Department.objects.none()
+        return Department.objects.for_principal(get_principal(self.request))
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -139,33 +140,35 @@ class DepartmentViewSet(viewsets.ModelViewSet):
 
 
 # --- API ViewSets for Products ---
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated, CustomPermission]
+    pagination_class = TimestampCursorPagination
 
     def get_queryset(self):
-        user = self.request.user
-        base_qs = Product.objects.all()
-
-        if user.is_superuser or user.is_app_owner() or user.is_project_manager() or user.is_app_staff_user():
-            return base_qs
-            
-        # مدراء المتاجر يرون المنتجات الموجودة في مخزون فروع متجرهم
-        if user.is_store_manager_user() and user.store:
-            return base_qs.filter(branch_inventories__branch__store=user.store).distinct()
-            
-        # مدراء الفروع أو الموظفون العامون يرون المنتجات الموجودة في مخزون فرعهم
-        if (user.is_branch_manager_user() or user.is_general_staff_user() or \
-            user.is_cashier_user() or user.is_shelf_organizer_user() or user.is_customer_service_user()) and user.branch:
-            return base_qs.filter(branch_inventories__branch=user.branch).distinct()
-            
-        # العملاء يرون جميع المنتجات (فقط للقراءة)
-        if user.is_platform_customer():
-            return base_qs # يمكنهم رؤية جميع المنتجات المتاحة في النظام
-
-        return Product.objects.none()
+        # النطاق حسب الدور (mysite.scoping): EXISTS على مخزون فروع المستخدم بدل JOIN + DISTINCT
+        queryset = Product.objects.for_principal(get_principal(self.request))
+        if self.action in ('list', 'retrieve'):
+            queryset = self._with_serializer_data(queryset)
+        return queryset
+
+    def _with_serializer_data(self, queryset):
+        """
+        Loads everything ProductSerializer reads in a fixed number of queries:
+        the related names, the stock total (annotated in SQL) and the per-branch inventories.
+        Parts a sparse fieldset (?fields= / ?omit=) leaves out are skipped.
+        """
+        queryset = queryset.select_related('department', 'category', 'last_updated_by')
+        if self.sparse_field_selected('total_quantity_in_all_branches'):
+            queryset = queryset.annotate(total_quantity_in_all_branches=total_quantity_expression())
+        if self.sparse_field_selected('branch_inventories'):
+            inventories = annotate_on_hand(
+                BranchProductInventory.objects.select_related('branch__store')
+            ).order_by('pk')
+            queryset = queryset.prefetch_related(Prefetch('branch_inventories', queryset=inventories))
+        return queryset
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -207,34 +210,92 @@ class ProductViewSet(viewsets.ModelViewSet):
         else:
             raise ValidationError({'error': _('You do not have permission to delete this product.')})
 
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        بحث جزئي/تقريبي بالاسم (عربي/إنجليزي) أو الباركود أو رقم الصنف.
+        ?q=<text>&branch=<branch id>&limit=<n>
+        """
+        term = request.query_params.get('q', '').strip()
+        if len(term) < 2:
+            return Response({'q': _('Search term must be at least 2 characters.')}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', settings.PRODUCT_SEARCH_DEFAULT_RESULTS))
+            branch_id = uuid.UUID(request.query_params['branch']) if request.query_params.get('branch') else None
+        except ValueError:
+            return Response({'detail': _('limit must be an integer and branch a branch ID.')}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.PRODUCT_SEARCH_MAX_RESULTS))
+
+        queryset = self.get_queryset().only('id', 'name', 'barcode', 'item_number', *Product.PRICE_SOURCE_FIELDS, *Product.EFFECTIVE_PRICE_FIELDS)
+        products = search_products(queryset, term, branch_id=branch_id, limit=limit)
+        return Response(ProductSearchResultSerializer(products, many=True).data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def catalogue(self, request):
+        """
+        لقطة كتالوج الفرع لأجهزة نقاط البيع (العمل دون اتصال).
+        ?branch=<branch id> (الافتراضي فرع المستخدم)، ?since=<version> لإرجاع التغييرات فقط.
+        """
+        principal = get_principal(request)
+        try:
+            branch_id = uuid.UUID(request.query_params['branch']) if request.query_params.get('branch') else principal.branch_id
+            since = int(request.query_params['since']) if request.query_params.get('since') else None
+        except ValueError:
+            return Response({'detail': _('branch must be a branch ID and since a catalogue version.')}, status=status.HTTP_400_BAD_REQUEST)
+        if branch_id is None:
+            return Response({'branch': _('This field is required.')}, status=status.HTTP_400_BAD_REQUEST)
+        if since is not None and not (0 <= since <= version_for(timezone.now())):
+            return Response({'since': _('Unknown catalogue version.')}, status=status.HTTP_400_BAD_REQUEST)
+
+        branch = get_object_or_404(Branch.objects.only('pk', 'store_id'), pk=branch_id)
+        if not principal.can_access_branch(branch.pk):
+            return Response({'detail': _('You do not have permission to view this branch\'s catalogue.')}, status=status.HTTP_403_FORBIDDEN)
+
+        compress = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        response = HttpResponse(encode_snapshot(build_snapshot(branch.pk, since=since), compress=compress), content_type='application/json')
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        response['Vary'] = 'Accept-Encoding'
+        return response
+
+    @action(detail=True, methods=['get'], url_path=r'image/(?P<size>[a-z]+)/(?P<image_format>webp|jpeg)', url_name='image-rendition')
+    def image_rendition(self, request, pk=None, size=None, image_format=None):
+        """
+        Redirects to one rendition of the product image, rendering it first if it does not exist yet.
+        """
+        if size not in RENDITION_SIZES:
+            raise NotFound(_('Unknown image size.'))
+        product = self.get_object()
+        if not product.image:
+            raise NotFound(_('This product has no image.'))
+        try:
+            digest = ensure_renditions(product, sizes=[size], formats=[image_format])
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cannot render {size}/{image_format} for product {product.pk}: {e}")
+            raise NotFound(_('The product image could not be processed.'))
+        return HttpResponseRedirect(product.image.storage.url(rendition_name(digest, size, image_format)))
+
+    @action(detail=False, methods=['get'], url_path='scan-cache-stats')
+    def scan_cache_stats(self, request):
+        """
+        Hit/miss counters of this process's barcode/QR scan cache, used to size SCAN_CACHE_MAX_ENTRIES.
+        """
+        user = request.user
+        if not (user.is_superuser or user.is_app_owner() or user.is_project_manager() or user.is_app_staff_user()
+                or user.is_store_manager_user() or user.is_branch_manager_user()):
+            return Response({'detail': _('You do not have permission to view scan cache statistics.')}, status=status.HTTP_403_FORBIDDEN)
+        return Response(scan_cache.stats(), status=status.HTTP_200_OK)
+
 # --- API ViewSets for Branch Product Inventory ---
-class BranchProductInventoryViewSet(viewsets.ModelViewSet):
+class BranchProductInventoryViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = BranchProductInventory.objects.all()
     serializer_class = BranchProductInventorySerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated, CustomPermission]
+    pagination_class = TimestampCursorPagination
 
     def get_queryset(self):
-        user = self.request.user
-        qs = BranchProductInventory.objects.all()
-
-        if user.is_superuser or user.is_app_owner() or user.is_project_manager() or user.is_app_staff_user():
-            return qs
-            
-        # مدير المتجر يرى مخزون المنتجات في فروع متجره
-        if user.is_store_manager_user() and user.store:
-            return qs.filter(branch__store=user.store)
-            
-        # مدير الفرع أو الموظفون العامون أو الكاشير أو منظمو الرفوف أو موظفو خدمة العملاء يرون مخزون المنتجات في فرعهم
-        if (user.is_branch_manager_user() or user.is_general_staff_user() or \
-            user.is_cashier_user() or user.is_shelf_organizer_user() or user.is_customer_service_user()) and user.branch:
-            return qs.filter(branch=user.branch)
-            
-        # العملاء لا يرون سجلات المخزون (أو يرون فقط المنتجات المتاحة من خلال ProductViewSet)
-        if user.is_platform_customer():
-            return BranchProductInventory.objects.none()
-            
-        return BranchProductInventory.objects.none()
+        return BranchProductInventory.objects.for_principal(get_principal(self.request))
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -317,160 +378,83 @@ class ProductUploadExcelView(viewsets.ViewSet):
         except Exception as e:
             return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            workbook = openpyxl.load_workbook(file)
-            sheet = workbook.active
-            
-            header = [cell.value for cell in sheet[1]]
-            
-            # Column names for Product model
-            barcode_col_name = _("Barcode")
-            item_number_col_name = _("Item Number")
-            name_col_name = _("Product Name")
-            price_col_name = _("Base Price")
-            department_col_name = _("Department Name")
-            category_col_name = _("Category Name") # New column for Category
-            vat_rate_col_name = _("VAT Rate (as decimal)")
-
-            # Column name for BranchProductInventory
-            quantity_col_name = _("Quantity in Stock") # Quantity is now in BranchProductInventory
-
-            products_to_create_count = 0
-            products_to_update_count = 0
-            inventory_records_processed_count = 0
-            
-            # Using a list to collect error messages from rows
-            row_errors = []
-
-            with transaction.atomic():
-                for row_idx in range(2, sheet.max_row + 1):
-                    row_data = {header[col_idx]: sheet.cell(row=row_idx, column=col_idx + 1).value
-                                for col_idx in range(len(header))}
-                    
-                    barcode = str(row_data.get(barcode_col_name)).strip() if row_data.get(barcode_col_name) else None
-                    item_number = str(row_data.get(item_number_col_name)).strip() if row_data.get(item_number_col_name) else None
-                    name = str(row_data.get(name_col_name)).strip() if row_data.get(name_col_name) else None
-                    price = row_data.get(price_col_name)
-                    quantity = row_data.get(quantity_col_name) # This is for BranchProductInventory
-                    department_name = str(row_data.get(department_col_name)).strip() if row_data.get(department_col_name) else None
-                    category_name = str(row_data.get(category_col_name)).strip() if row_data.get(category_col_name) else None
-                    vat_rate = row_data.get(vat_rate_col_name)
-
-                    if not name or price is None: # Price can be 0, so check for None
-                        row_errors.append(_(f"Row {row_idx}: Product Name or Price missing. Skipping."))
-                        continue
-                    
-                    if not (barcode or item_number):
-                        row_errors.append(_(f"Row {row_idx}: Barcode or Item Number is required for product identification. Skipping."))
-                        continue
-
-                    try:
-                        price = Decimal(str(price))
-                    except (TypeError, ValueError):
-                        row_errors.append(_(f"Row {row_idx}: Invalid price format. Skipping."))
-                        continue
-
-                    try:
-                        vat_rate = Decimal(str(vat_rate)) if vat_rate is not None else Decimal('0.1500')
-                        if not (Decimal('0.0000') <= vat_rate <= Decimal('1.0000')):
-                             raise ValueError("VAT rate out of range.")
-                    except (TypeError, ValueError):
-                        row_errors.append(_(f"Row {row_idx}: Invalid VAT rate format. Using default 0.15."))
-                        vat_rate = Decimal('0.1500')
-
-                    # Find or create Department
-                    department_obj = None
-                    if department_name:
-                        # Ensure department belongs to the branch
-                        department_obj, created = Department.objects.get_or_create(
-                            branch=branch,
-                            name=department_name
-                        )
-                    
-                    # Find or create ProductCategory
-                    category_obj = None
-                    if category_name:
-                        category_obj, created = ProductCategory.objects.get_or_create(
-                            name=category_name
-                        )
-
-                    # Find existing product (globally, not tied to a specific branch in Product model)
-                    existing_product = None
-                    if barcode:
-                        existing_product = Product.objects.filter(barcode=barcode).first()
-                    if not existing_product and item_number:
-                        existing_product = Product.objects.filter(item_number=item_number).first()
-
-                    product_data = {
-                        'name': name,
-                        'price': price,
-                        'department': department_obj,
-                        'category': category_obj, # Assign category
-                        'last_updated_by': user,
-                        'vat_rate': vat_rate
-                    }
-                    if barcode: product_data['barcode'] = barcode
-                    if item_number: product_data['item_number'] = item_number
-
-                    current_product = None
-                    if existing_product:
-                        # Update existing product (Product model attributes)
-                        for key, value in product_data.items():
-                            setattr(existing_product, key, value)
-                        existing_product.save(update_fields=list(product_data.keys())) # Update specific fields
-                        current_product = existing_product
-                        products_to_update_count += 1
-                    else:
-                        # Create new product
-                        current_product = Product.objects.create(**product_data)
-                        products_to_create_count += 1
-                    
-                    # Handle BranchProductInventory for the current product and branch
-                    if current_product and quantity is not None:
-                        try:
-                            inventory_quantity = int(quantity)
-                            if inventory_quantity < 0:
-                                raise ValueError("Quantity cannot be negative.")
-                        except (TypeError, ValueError):
-                            row_errors.append(_(f"Row {row_idx}: Invalid quantity format for product '{name}'. Using 0."))
-                            inventory_quantity = 0
-                            
-                        branch_product_inventory, created_inventory = BranchProductInventory.objects.get_or_create(
-                            product=current_product,
-                            branch=branch,
-                            defaults={
-                                'quantity': inventory_quantity,
-                                'last_updated_by': user
-                            }
-                        )
-                        if not created_inventory:
-                            # Update existing inventory
-                            branch_product_inventory.quantity = inventory_quantity
-                            branch_product_inventory.last_updated_by = user
-                            branch_product_inventory.save(update_fields=['quantity', 'last_updated_by'])
-                        
-                        inventory_records_processed_count += 1
-
-                # If any row errors occurred, return them with a partial success or warning status
-                if row_errors:
-                    return Response({
-                        'detail': _('Products and inventory processed with some warnings/errors.'),
-                        'created_products_count': products_to_create_count,
-                        'updated_products_count': products_to_update_count,
-                        'inventory_records_processed': inventory_records_processed_count,
-                        'row_errors': row_errors
-                    }, status=status.HTTP_200_OK) # Or HTTP_206_PARTIAL_CONTENT
-                
-                return Response({
-                    'detail': _('Products and inventory uploaded successfully.'),
-                    'created_products_count': products_to_create_count,
-                    'updated_products_count': products_to_update_count,
-                    'inventory_records_processed': inventory_records_processed_count
-                }, status=status.HTTP_200_OK)
+        # الملف يُحفظ ويُعالج في الخلفية (django_q)، والعميل يتابع التقدم عبر jobs/<id>/
+        job = ImportJob.objects.create(branch=branch, created_by=user, file=file)
+        transaction.on_commit(lambda: async_task('products.tasks.run_import_job', job.pk))
+        logger.info(f"Product import job {job.pk} queued for branch {branch.pk} by {user.pk}")
+        return Response({
+            'detail': _('File uploaded. The import is running in the background.'),
+            'job': ImportJobSerializer(job).data,
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        تصدير المنتجات ومخزون فرع (?branch_id=) أو كل فروع متجر (?store_id=)، بصيغة
+        ?file_format=xlsx (الافتراضي، بنفس أعمدة ملف الرفع) أو csv.
+        """
+        principal = get_principal(request)
+        if not (principal.is_unrestricted or principal.has_role(UserType.STORE_MANAGER, UserType.BRANCH_MANAGER)):
+            return Response({'error': _('You do not have permission to export products.')}, status=status.HTTP_403_FORBIDDEN)
+
+        file_format = request.query_params.get('file_format', 'xlsx').lower()
+        if file_format not in ('xlsx', 'csv'):
+            return Response({'file_format': _('Supported formats are xlsx and csv.')}, status=status.HTTP_400_BAD_REQUEST)
 
-        except Exception as e:
-            # Catch any unexpected errors during file processing
-            return Response({'detail': _(f'Error processing file: {e}')}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            branch_id = uuid.UUID(request.query_params['branch_id']) if request.query_params.get('branch_id') else None
+            store_id = int(request.query_params['store_id']) if request.query_params.get('store_id') else None
+        except ValueError:
+            return Response({'detail': _('branch_id must be a branch ID and store_id a store ID.')}, status=status.HTTP_400_BAD_REQUEST)
+
+        branch = store = None
+        if branch_id:
+            branch = get_object_or_404(Branch.objects.select_related('store'), pk=branch_id)
+            if not principal.can_access_branch(branch.pk):
+                return Response({'detail': _('You do not have permission to export this branch.')}, status=status.HTTP_403_FORBIDDEN)
+            filename = f"products_branch_{branch.pk}"
+        elif store_id is not None:
+            store = get_object_or_404(Store, pk=store_id)
+            # مدير الفرع يصدّر فرعه فقط
+            if principal.has_role(UserType.BRANCH_MANAGER) or not principal.can_access_store(store.pk):
+                return Response({'detail': _('You do not have permission to export this store.')}, status=status.HTTP_403_FORBIDDEN)
+            filename = f"products_store_{store.pk}"
+        else:
+            return Response({'detail': _('branch_id or store_id is required.')}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = export_rows(branch=branch, store=store)
+        if file_format == 'csv':
+            response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv; charset=utf-8')
+            response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+            return response
+        return FileResponse(
+            build_xlsx(rows), as_attachment=True, filename=f"{filename}.xlsx",
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+
+    def _get_job(self, request, job_id):
+        user = request.user
+        job = get_object_or_404(ImportJob.objects.select_related('branch'), pk=job_id)
+        if not (job.created_by_id == user.pk or user.is_superuser or user.is_app_owner() or user.is_project_manager()):
+            raise NotFound(_('Import job not found.'))
+        return job
+
+    @action(detail=False, methods=['get'], url_path=r'jobs/(?P<job_id>\d+)')
+    def job_status(self, request, job_id=None):
+        """
+        Progress of a background import (status, processed/total rows, counts).
+        """
+        return Response(ImportJobSerializer(self._get_job(request, job_id)).data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path=r'jobs/(?P<job_id>\d+)/errors')
+    def job_errors(self, request, job_id=None):
+        """
+        Downloads the job's row errors as CSV (row, error).
+        """
+        job = self._get_job(request, job_id)
+        if not job.error_file:
+            return Response({'detail': _('This import has no row errors.')}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(job.error_file.open('rb'), as_attachment=True, filename=f"import_{job.pk}_errors.csv", content_type='text/csv')
 
 
 # --- API View for Barcode Scanning (Strict Location Check) ---
@@ -494,24 +478,13 @@ class ScanBarcodeAPIView(APIView):
         except (TypeError, ValueError):
             return Response({"detail": _("Invalid latitude or longitude format for customer location.")}, status=status.HTTP_400_BAD_REQUEST)
 
-        MAX_DISTANCE_FOR_SCAN = getattr(settings, 'MAX_BARCODE_SCAN_DISTANCE_KM', 0.01) # Default: 10 meters
+        MAX_DISTANCE_FOR_SCAN = scan_radius_km() # Default: 10 meters
 
-        branches_with_coords = Branch.objects.filter(latitude__isnull=False, longitude__isnull=False)
-        
-        if not branches_with_coords.exists():
+        if not has_located_branches():
             return Response({"detail": _("No branches with valid GPS coordinates are configured. Cannot proceed with barcode scanning.")}, status=status.HTTP_404_NOT_FOUND)
 
-        detected_branch = None
-        for branch in branches_with_coords:
-            branch_coords = (branch.latitude, branch.longitude)
-            try:
-                distance = geodesic(customer_coords, branch_coords).km
-                if distance <= MAX_DISTANCE_FOR_SCAN:
-                    detected_branch = branch
-                    break # Found a nearby branch, no need to check others
-            except ValueError:
-                # Handle cases where geodesic might fail due to invalid coordinates (though already checked for floats)
-                continue
+        # Nearest branch within the scan radius, from the in-memory grid (stores.geo)
+        detected_branch = nearest_branch(*customer_coords, radius_km=MAX_DISTANCE_FOR_SCAN)
 
         if not detected_branch:
             return Response(
@@ -519,32 +492,23 @@ class ScanBarcodeAPIView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # 3. If branch is detected, find the Product and its inventory in that branch
+        # 3. If branch is detected, find the Product (scan cache, no catalogue query when warm)
+        # and its inventory in that branch
         try:
-            product = Product.objects.get(barcode=barcode_value) # Find product globally by barcode
-            
-            # Now, get the specific BranchProductInventory for this product in the detected branch
-            product_inventory = BranchProductInventory.objects.get(product=product, branch=detected_branch)
-
-            # Return Product data along with its quantity in the detected branch
-            serializer = ProductSerializer(product)
-            
-            response_data = serializer.data
-            
-            # Find the specific inventory data for the detected branch
-            current_branch_inventory_data = next((inv for inv in response_data.get('branch_inventories', []) if inv['branch'] == detected_branch.id), None)
-            
-            if current_branch_inventory_data:
-                response_data['quantity_in_scanned_branch'] = current_branch_inventory_data['quantity']
-                response_data['scanned_branch_name'] = detected_branch.name # Add scanned branch name
-            else:
-                response_data['quantity_in_scanned_branch'] = 0 # Product exists, but no inventory in this specific branch
-                response_data['scanned_branch_name'] = detected_branch.name
-
-            # Optionally remove the full list of branch_inventories if you only need the scanned branch's quantity
-            if 'branch_inventories' in response_data:
-                del response_data['branch_inventories']
-
+            product = lookup_scan_record(barcode_value)
+            if product is None:
+                raise Product.DoesNotExist
+
+            # on_hand_quantity: صف المخزون + buckets المنتج الساخن (quantity وحده صفر للمنتجات الساخنة)
+            quantity = annotate_on_hand(BranchProductInventory.objects.filter(
+                product_id=product['id'], branch_id=detected_branch.branch_id
+            )).values_list('on_hand_quantity', flat=True).first()
+            if quantity is None:
+                raise BranchProductInventory.DoesNotExist
+
+            response_data = dict(product)
+            response_data['quantity_in_scanned_branch'] = quantity
+            response_data['scanned_branch_name'] = detected_branch.name
             return Response(response_data, status=status.HTTP_200_OK)
         except Product.DoesNotExist:
             return Response(
@@ -553,10 +517,9 @@ class ScanBarcodeAPIView(APIView):
             )
         except BranchProductInventory.DoesNotExist:
             # If product exists but no inventory in the detected branch
-            product = Product.objects.get(barcode=barcode_value) # Re-fetch product to get its details
             return Response(
-                {"detail": _(f"Product '{product.name}' found, but no inventory record exists for it in branch '{detected_branch.name}'."),
-                 "product_details": ProductSerializer(product).data, # Optionally return product details without inventory
+                {"detail": _(f"Product '{product['name']}' found, but no inventory record exists for it in branch '{detected_branch.name}'."),
+                 "product_details": product,
                  "quantity_in_scanned_branch": 0,
                  "scanned_branch_name": detected_branch.name
                 },
@@ -0,0 +1,73 @@
+# sales/management/commands/benchmark_temp_order_conversion.py
+import statistics
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from products.models import BranchProductInventory, Product
+from sales.constants import PaymentMethod
+from sales.models import TempOrder, TempOrderItem
+from sales.views import convert_temp_order
+from stores.models import Branch, Store
+from users.models import UserAccount
+
+
+class Command(BaseCommand):
+    help = (
+        "Times convert_temp_order() (temp order -> paid Order) for baskets of several sizes and "
+        "reports latency and query count per size. Runs inside one transaction that is rolled "
+        "back at the end, so the conversions commit savepoints rather than transactions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[10, 50, 200], help="Basket sizes to time.")
+        parser.add_argument('--repeats', type=int, default=20, help="Conversions per basket size.")
+
+    def handle(self, *args, **options):
+        sizes = options['lines']
+        repeats = options['repeats']
+        if repeats < 1 or min(sizes) < 1:
+            raise CommandError("--lines and --repeats must be positive integers.")
+
+        with transaction.atomic():
+            name = f"benchmark_temp_order_conversion {uuid.uuid4().hex[:8]}"
+            store = Store.objects.create(name=name, address="-")
+            branch = Branch.objects.create(store=store, name=name, address="-")
+            cashier = UserAccount.objects.create(email=f"{uuid.uuid4().hex[:12]}@benchmark.invalid")
+            products = Product.objects.bulk_create([
+                Product(name=f"{name} {index}", price=Decimal('10.00')) for index in range(max(sizes))
+            ])
+            BranchProductInventory.objects.bulk_create([
+                BranchProductInventory(product=product, branch=branch, quantity=10 ** 6) for product in products
+            ])
+
+            self.stdout.write(f"{repeats} conversions per size on {connection.vendor}")
+            for lines in sizes:
+                self._time_size(lines, repeats, products, branch, cashier)
+            transaction.set_rollback(True)
+
+    def _time_size(self, lines, repeats, products, branch, cashier):
+        latencies = []
+        query_counts = set()
+        for _ in range(repeats):
+            temp_order = TempOrder.objects.create(created_by=cashier)
+            TempOrderItem.objects.bulk_create([
+                TempOrderItem(temp_order=temp_order, product=product, quantity=2) for product in products[:lines]
+            ])
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                convert_temp_order(temp_order, branch.pk, cashier, PaymentMethod.CASH)
+                latencies.append(time.perf_counter() - started)
+            query_counts.add(len(queries))
+
+        p95 = statistics.quantiles(latencies, n=20)[18] if len(latencies) > 1 else latencies[0]
+        self.stdout.write(
+            f"{lines:>5} lines:   p50 {statistics.median(latencies) * 1000:7.2f} ms   "
+            f"p95 {p95 * 1000:7.2f} ms   "
+            f"{statistics.median(latencies) * 1e6 / lines:7.1f} µs per line   "
+            f"queries {', '.join(str(count) for count in sorted(query_counts))}"
+        )
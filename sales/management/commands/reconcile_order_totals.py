@@ -0,0 +1,70 @@
+# sales/management/commands/reconcile_order_totals.py
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from sales.models import Order
+from sales.utils import ORDER_TOTAL_FIELDS, order_totals_aggregates
+
+
+class Command(BaseCommand):
+    help = "Recomputes order totals from their items and repairs orders whose stored totals drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Orders checked per query.")
+        parser.add_argument('--since', help="Only check orders created on or after this date (YYYY-MM-DD).")
+        parser.add_argument('--dry-run', action='store_true', help="Report drifted orders without updating them.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be a positive integer.")
+
+        queryset = Order.objects.all()
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError("--since must be a date in YYYY-MM-DD format.")
+            queryset = queryset.filter(created_at__date__gte=since)
+
+        queryset = (
+            queryset.only('pk', 'fee_amount', *ORDER_TOTAL_FIELDS)
+            .annotate(**order_totals_aggregates('items__'))
+            .order_by('pk')
+        )
+
+        checked = repaired = 0
+        last_pk = None
+        while True:
+            batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            checked += len(batch)
+
+            drifted = []
+            for order in batch:
+                expected_total = order.total_before_vat + order.total_vat + (order.fee_amount or Decimal('0.00'))
+                if (
+                    order.total_amount_before_vat != order.total_before_vat
+                    or order.total_vat_amount != order.total_vat
+                    or order.total_amount != expected_total
+                ):
+                    self.stdout.write(
+                        f"Order {order.pk}: stored {order.total_amount} / expected {expected_total}"
+                    )
+                    order.total_amount_before_vat = order.total_before_vat
+                    order.total_vat_amount = order.total_vat
+                    order.total_amount = expected_total
+                    drifted.append(order)
+
+            repaired += len(drifted)
+            if drifted and not options['dry_run']:
+                with transaction.atomic():
+                    Order.objects.bulk_update(drifted, ORDER_TOTAL_FIELDS)
+
+        action = "would be repaired" if options['dry_run'] else "repaired"
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} orders, {repaired} {action}."))
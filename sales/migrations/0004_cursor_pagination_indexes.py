@@ -0,0 +1,33 @@
+# Generated by Django 4.2.22 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0003_initial'),
+    ]
+
+    operations = [
+        # الفهرس أدناه يعتمد على created_at، ولم تُنشئه الترحيلات السابقة
+        migrations.AddField(
+            model_name='order',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at', 'id'], name='order_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['payment_date', 'id'], name='payment_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='return',
+            index=models.Index(fields=['return_date', 'id'], name='return_date_id_idx'),
+        ),
+    ]
@@ -3,14 +3,66 @@ from decimal import Decimal
 
 from django.conf import settings
 from django.db import models
+from django.db.models import Q
 from django.core.validators import MinValueValidator
 from django.utils.translation import gettext_lazy as _
 
+from mysite.scoping import SALES_ROLES, PrincipalQuerySet
 from products.models import Product
+from users.constants import UserType
 from users.models import UserAccount , Customer
 from stores.models import Branch
 from .constants import OrderStatus , PaymentMethod ,RefundMethod , ZatcaSubmissionStatus
-from .utils import calculate_order_totals, calculate_return_total
+from .utils import calculate_order_totals, calculate_return_total, calculate_temp_order_total, line_totals
+
+
+class TempOrderQuerySet(PrincipalQuerySet):
+    unscoped_roles = frozenset()
+    scoped_roles = SALES_ROLES
+    # المسار من الصف إلى الطلب المؤقت
+    temp_order_path = ''
+
+    def scope_filter(self, principal):
+        path = self.temp_order_path
+        # الموظف العام والكاشير يرون طلباتهم المؤقتة فقط
+        if principal.role in (UserType.GENERAL_STAFF, UserType.CASHIER):
+            return Q(**{f'{path}created_by_id': principal.user_id})
+        # الطلب المؤقت لا يحمل فرعاً: يُنسب إلى فرع من أنشأه
+        return Q(**{f'{path}created_by__employee_profile__branch_id__in': principal.branch_ids})
+
+
+class TempOrderItemQuerySet(TempOrderQuerySet):
+    temp_order_path = 'temp_order__'
+
+
+class OrderQuerySet(PrincipalQuerySet):
+    scoped_roles = SALES_ROLES
+    branch_field = 'branch_id'
+    customer_field = 'customer_id'
+
+
+class OrderItemQuerySet(PrincipalQuerySet):
+    unscoped_roles = frozenset()
+    scoped_roles = SALES_ROLES
+    branch_field = 'order__branch_id'
+    customer_field = 'order__customer_id'
+
+
+class PaymentQuerySet(PrincipalQuerySet):
+    scoped_roles = SALES_ROLES
+    branch_field = 'order__branch_id'
+
+
+class ReturnQuerySet(PrincipalQuerySet):
+    scoped_roles = SALES_ROLES
+    branch_field = 'order__branch_id'
+    customer_field = 'order__customer_id'
+
+
+class ReturnItemQuerySet(PrincipalQuerySet):
+    scoped_roles = SALES_ROLES
+    branch_field = 'return_obj__order__branch_id'
+    customer_field = 'return_obj__order__customer_id'
 
 
 # === TEMP ORDER ===
@@ -25,6 +77,8 @@ class TempOrder(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal("0.00"))
 
+    objects = TempOrderQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Temp Order")
         verbose_name_plural = _("Temp Orders")
@@ -34,9 +88,7 @@ class TempOrder(models.Model):
         return f"TempOrder #{self.pk} - Total: {self.total_amount}"
 
     def calculate_totals(self):
-        self.total_amount = sum(
-            item.product.price_after_discount() * item.quantity for item in self.items.all()
-        )
+        self.total_amount = calculate_temp_order_total(self)
 
 
 class TempOrderItem(models.Model):
@@ -46,6 +98,8 @@ class TempOrderItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
 
+    objects = TempOrderItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Temp Order Item")
         verbose_name_plural = _("Temp Order Items")
@@ -67,16 +121,36 @@ class Order(models.Model):
     total_vat_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal("0.00"))
     fee_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal("0.00"))
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Order")
         verbose_name_plural = _("Orders")
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='order_created_id_idx'),
+            # OrderQuerySet.for_principal: طلبات الفروع مرتبة بالأحدث
+            models.Index(fields=['branch', 'created_at', 'id'], name='order_branch_created_idx'),
+            # CustomerQuerySet.scope_filter: EXISTS على طلبات العميل في الفروع
+            models.Index(fields=['customer', 'branch'], name='order_customer_branch_idx'),
+        ]
 
     def __str__(self):
         return f"{_('Order')} {self.order_id}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # الحالة كما هي في قاعدة البيانات، لاكتشاف تغيّر الحالة في الإشارات بدون استعلام
+        instance._original_status = instance.__dict__.get('status')
+        return instance
+
     def calculate_totals(self):
-        calculate_order_totals(self)
+        totals = calculate_order_totals(self)
+        self.total_amount_before_vat = totals['total_before_vat']
+        self.total_vat_amount = totals['total_vat']
+        self.total_amount = totals['total_amount']
+        return totals
 
 
 class OrderItem(models.Model):
@@ -86,6 +160,8 @@ class OrderItem(models.Model):
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     vat_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal("0.00"))
 
+    objects = OrderItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Order Item")
         verbose_name_plural = _("Order Items")
@@ -94,6 +170,23 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Snapshot of the line as stored, used by the totals signals to apply deltas.
+        instance._loaded_line = instance.current_line()
+        return instance
+
+    def current_line(self):
+        """
+        Returns (order_id, amount_before_vat, vat_amount) for this line,
+        or None if a value is deferred or an unresolved F() expression.
+        """
+        values = [self.__dict__.get(name) for name in ('order_id', 'quantity', 'unit_price', 'vat_percentage')]
+        if any(value is None or hasattr(value, 'resolve_expression') for value in values):
+            return None
+        return (values[0],) + line_totals(*values[1:])
+
 
 # === PAYMENT ===
 class Payment(models.Model):
@@ -113,10 +206,15 @@ class Payment(models.Model):
     )
     notes = models.TextField(blank=True, null=True)
 
+    objects = PaymentQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Payment")
         verbose_name_plural = _("Payments")
         ordering = ['-payment_date']
+        indexes = [
+            models.Index(fields=['payment_date', 'id'], name='payment_date_id_idx'),
+        ]
 
     def __str__(self):
         return f"{_('Payment')} {self.amount} {_('for Order')} {self.order.order_id}"
@@ -137,10 +235,15 @@ class Return(models.Model):
     default=RefundMethod.CASH, verbose_name=_("Refund Method")
     )
 
+    objects = ReturnQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Return")
         verbose_name_plural = _("Returns")
         ordering = ['-return_date']
+        indexes = [
+            models.Index(fields=['return_date', 'id'], name='return_date_id_idx'),
+        ]
 
     def __str__(self):
         return f"{_('Return')} {self.return_id} {_('for Order')} {self.order.order_id}"
@@ -155,6 +258,8 @@ class ReturnItem(models.Model):
     quantity_returned = models.PositiveIntegerField(validators=[MinValueValidator(1)])
     price_at_return = models.DecimalField(max_digits=10, decimal_places=2)
 
+    objects = ReturnItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Returned Item")
         verbose_name_plural = _("Returned Items")
@@ -11,48 +11,38 @@ from .models import Order, OrderItem, TempOrder, TempOrderItem, Payment, Return,
 
 # استيراد النماذج من تطبيقات أخرى (النماذج المتعلقة بالمنتجات)
 from products.models import Product, BranchProductInventory # للتأكد من وجودها للعرض في Serializers
+from mysite.fieldsets import SparseFieldsetSerializerMixin
 
 User = get_user_model()
 
 
 # --- Serializer for TempOrderItem ---
-class TempOrderItemSerializer(serializers.ModelSerializer):
+class TempOrderItemSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True) # تم تغيير product_name إلى name
     product_barcode = serializers.CharField(source='product.barcode', read_only=True)
 
     class Meta:
         model = TempOrderItem
         fields = [
-            'id', 'temp_order', 'product', 'product_name', 'product_barcode',
-            'quantity', 'scanned_quantity', 'price_at_scan'
+            'id', 'temp_order', 'product', 'product_name', 'product_barcode', 'quantity'
         ]
-        read_only_fields = ('price_at_scan',) # price_at_scan يتم حسابه في save()
         extra_kwargs = {
             'product': {'write_only': True},
             'temp_order': {'write_only': True}
         }
 
 # --- Serializer for TempOrder ---
-class TempOrderSerializer(serializers.ModelSerializer):
-    branch_name = serializers.CharField(source='branch.name', read_only=True)
-    cashier_username = serializers.CharField(source='cashier.username', read_only=True)
+class TempOrderSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     items = TempOrderItemSerializer(many=True, read_only=True) # Nested serializer لعناصر الطلب المؤقت
 
     class Meta:
         model = TempOrder
-        fields = [
-            'id', 'branch', 'branch_name', 'cashier', 'cashier_username',
-            'created_at', 'updated_at', 'total_amount', 'items'
-        ]
-        read_only_fields = ('created_at', 'updated_at', 'total_amount', 'branch_name', 'cashier_username', 'items')
-        extra_kwargs = {
-            'branch': {'write_only': True},
-            'cashier': {'write_only': True, 'required': False, 'allow_null': True}
-        }
+        fields = ['id', 'customer', 'created_by', 'created_at', 'total_amount', 'items']
+        read_only_fields = ('created_by', 'created_at', 'total_amount', 'items')
 
 
 # --- Serializer for OrderItem ---
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True) # تم تغيير product_name إلى name
     product_barcode = serializers.CharField(source='product.barcode', read_only=True)
     
@@ -77,7 +67,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
 
 # --- Serializer for Payment ---
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     order_id = serializers.CharField(source='order.order_id', read_only=True)
     received_by_username = serializers.CharField(source='received_by.username', read_only=True)
 
@@ -94,7 +84,7 @@ class PaymentSerializer(serializers.ModelSerializer):
         }
 
 # --- Serializer for ReturnItem ---
-class ReturnItemSerializer(serializers.ModelSerializer):
+class ReturnItemSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     product_barcode = serializers.CharField(source='product.barcode', read_only=True)
 
@@ -111,7 +101,7 @@ class ReturnItemSerializer(serializers.ModelSerializer):
         }
 
 # --- Serializer for Return ---
-class ReturnSerializer(serializers.ModelSerializer):
+class ReturnSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     order_id = serializers.CharField(source='order.order_id', read_only=True)
     processed_by_username = serializers.CharField(source='processed_by.username', read_only=True)
     returned_items = ReturnItemSerializer(many=True, read_only=True) # Nested serializer لعناصر الإرجاع
@@ -132,7 +122,7 @@ class ReturnSerializer(serializers.ModelSerializer):
 
 
 # --- Serializer for Order ---
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     # لا يوجد 'invoice' كـ ForeignKey منفصل بعد الآن، المعلومات مدمجة في Order
     branch_name = serializers.CharField(source='branch.name', read_only=True)
     performed_by_username = serializers.CharField(source='performed_by.username', read_only=True)
@@ -188,6 +178,11 @@ class OrderSerializer(serializers.ModelSerializer):
             'performed_by': {'write_only': True, 'required': False, 'allow_null': True},
             'original_order_for_return': {'write_only': True, 'required': False, 'allow_null': True},
         }
+        # أعمدة النموذج التي تعتمد عليها الحقول المحسوبة (لـ ?fields= / ?omit=)
+        sparse_field_sources = {
+            'initial_qr_code_url': ('initial_qr_code',),
+            'exit_qr_code_url': ('exit_qr_code',),
+        }
 
     def get_initial_qr_code_url(self, obj):
         if obj.initial_qr_code:
@@ -240,3 +235,11 @@ class OrderSerializer(serializers.ModelSerializer):
 # Serializer جديد لبيانات QR Code الواردة (للمسح والتحقق)
 class QRCodeScanSerializer(serializers.Serializer):
     qr_data = serializers.CharField(help_text=_("QR Code data string (JSON format)"))
+    temp_order_id = serializers.IntegerField(
+        required=False,
+        help_text=_("Temporary order to add the scanned product to; a new one is created when omitted")
+    )
+    delta = serializers.BooleanField(
+        required=False, default=False,
+        help_text=_("Return only the changed line and the new totals instead of the whole temporary order")
+    )
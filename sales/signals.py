@@ -1,51 +1,111 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.db import transaction
-from django.core.exceptions import ValidationError
-from django.db.models import Sum, F
-from django.utils.translation import gettext_lazy as _
+from django.db.models import Sum
+from contextlib import contextmanager
 import logging
-
-from .models import Order, OrderItem, TempOrderItem, Return, ReturnItem
-from products.models import BranchProductInventory
-from integrations.models import InventoryMovement
+import threading
+
+from .constants import OrderStatus
+from .models import Order, OrderItem, TempOrder, TempOrderItem, Return, ReturnItem
+from .utils import apply_order_totals_delta, recalculate_order_totals
+from products.inventory import (
+    ORDER_HOLDER,
+    TEMP_ORDER_HOLDER,
+    apply_stock_changes,
+    commit_reservations,
+    release_reservations,
+    reservation_holder,
+)
 from customers.models import Rating
 
 logger = logging.getLogger(__name__)
 
+_item_signals_state = threading.local()
+
+
+@contextmanager
+def muted_item_signals():
+    """
+    Suppresses the per-row totals signals of OrderItem/TempOrderItem inside the block.
+    Used by bulk paths that write many lines and recompute the totals once themselves.
+    """
+    previous = getattr(_item_signals_state, 'muted', False)
+    _item_signals_state.muted = True
+    try:
+        yield
+    finally:
+        _item_signals_state.muted = previous
+
+
+def item_signals_muted():
+    return getattr(_item_signals_state, 'muted', False)
+
 
 # === OrderItem signals ===
+# Totals are maintained incrementally: each save/delete applies only the line's delta
+# with F() expressions instead of re-reading every line of the order.
+def _cached_order(instance, order_id):
+    """
+    The Order instance already loaded on the line (item.order or OrderItem(order=...)), if it
+    is `order_id`. The delta is applied to it too, otherwise its next full save() would write
+    the totals it was loaded with over the F() update.
+    """
+    order = instance._state.fields_cache.get('order')
+    return order if order is not None and order.pk == order_id else None
+
+
+def _apply_line_delta(instance, old_line, new_line):
+    if old_line and new_line and old_line[0] == new_line[0]:
+        apply_order_totals_delta(
+            new_line[0], new_line[1] - old_line[1], new_line[2] - old_line[2],
+            order=_cached_order(instance, new_line[0]),
+        )
+        return
+    if old_line:
+        apply_order_totals_delta(old_line[0], -old_line[1], -old_line[2], order=_cached_order(instance, old_line[0]))
+    if new_line:
+        apply_order_totals_delta(*new_line, order=_cached_order(instance, new_line[0]))
+
+
 @receiver(post_save, sender=OrderItem)
-def update_order_totals_on_item_save(sender, instance, **kwargs):
-    if kwargs.get('raw'):
+def update_order_totals_on_item_save(sender, instance, created, **kwargs):
+    if kwargs.get('raw') or item_signals_muted():
         return
-    order = instance.order
-    order.calculate_totals()
-    order.save(update_fields=[
-        'total_amount',
-        'total_amount_before_vat',
-        'total_vat_amount',
-        'fee_amount'
-    ])
+    old_line = None if created else getattr(instance, '_loaded_line', None)
+    new_line = instance.current_line()
+
+    if new_line is None or (old_line is None and not created):
+        # Previous or new value unknown (F() update, deferred field, unsaved snapshot)
+        recalculate_order_totals(
+            _cached_order(instance, instance.order_id) or Order.objects.only('pk', 'fee_amount').get(pk=instance.order_id)
+        )
+        if old_line and old_line[0] != instance.order_id:
+            recalculate_order_totals(Order.objects.only('pk', 'fee_amount').get(pk=old_line[0]))
+    else:
+        _apply_line_delta(instance, old_line, new_line)
+    instance._loaded_line = new_line
 
 
 @receiver(post_delete, sender=OrderItem)
 def update_order_totals_on_item_delete(sender, instance, **kwargs):
-    order = instance.order
-    order.refresh_from_db()
-    order.calculate_totals()
-    order.save(update_fields=[
-        'total_amount',
-        'total_amount_before_vat',
-        'total_vat_amount',
-        'fee_amount'
-    ])
+    if item_signals_muted():
+        return
+    line = getattr(instance, '_loaded_line', None) or instance.current_line()
+    if line is None:
+        order = _cached_order(instance, instance.order_id) or Order.objects.only('pk', 'fee_amount').filter(pk=instance.order_id).first()
+        if order:
+            recalculate_order_totals(order)
+        return
+    # لو الطلب نفسه محذوف (cascade) فالتحديث لن يلمس أي صف
+    _apply_line_delta(instance, line, None)
+    instance._loaded_line = None
 
 
 # === TempOrderItem signals ===
 @receiver(post_save, sender=TempOrderItem)
 def update_temp_order_totals_on_item_save(sender, instance, **kwargs):
-    if kwargs.get('raw'):
+    if kwargs.get('raw') or item_signals_muted():
         return
     temp_order = instance.temp_order
     temp_order.calculate_totals()
@@ -54,6 +114,8 @@ def update_temp_order_totals_on_item_save(sender, instance, **kwargs):
 
 @receiver(post_delete, sender=TempOrderItem)
 def update_temp_order_totals_on_item_delete(sender, instance, **kwargs):
+    if item_signals_muted():
+        return
     temp_order = instance.temp_order
     temp_order.refresh_from_db()
     temp_order.calculate_totals()
@@ -84,42 +146,43 @@ def manage_inventory_and_movements_on_order_status_change(sender, instance, crea
     if kwargs.get('raw'):
         return
 
-    try:
-        old_instance = sender.objects.get(pk=instance.pk)
-        status_changed = (old_instance.status != instance.status)
-    except sender.DoesNotExist:
-        status_changed = True if created else False
-
-    if created or (status_changed and instance.status == instance.OrderStatus.COMPLETED):
-        if instance.status == instance.OrderStatus.COMPLETED:
-            with transaction.atomic():
-                for item in instance.items.all():
-                    inventory = BranchProductInventory.objects.select_for_update().get(
-                        product=item.product,
-                        branch=instance.branch
-                    )
-                    old_quantity = inventory.quantity
-                    new_quantity = old_quantity - item.quantity
-
-                    if new_quantity < 0:
-                        raise ValidationError(_(
-                            f"Insufficient stock for product {item.product.name} in branch {instance.branch.name}"
-                        ))
-
-                    inventory.quantity = new_quantity
-                    inventory.save(update_fields=['quantity'])
-
-                    InventoryMovement.objects.create(
-                        inventory=inventory,
-                        product=item.product,
-                        branch=instance.branch,
-                        movement_type='OUT',
-                        quantity_change=-item.quantity,
-                        old_quantity=old_quantity,
-                        new_quantity=new_quantity,
-                        reason=f"Sale (Order {instance.order_id})",
-                        moved_by=instance.performed_by
-                    )
+    # الحالة الأصلية محفوظة عند التحميل (Order.from_db) فلا حاجة لإعادة قراءة الطلب
+    previous_status = None if created else getattr(instance, '_original_status', None)
+    instance._original_status = instance.status
+
+    if previous_status == instance.status:
+        return
+
+    holder = reservation_holder(ORDER_HOLDER, instance.pk)
+    if instance.status == OrderStatus.CANCELLED:
+        release_reservations(holder)
+        return
+    if instance.status != OrderStatus.COMPLETED:
+        return
+
+    # الخصم الفعلي من المخزون يتم هنا فقط، مع حذف حجوزات الطلب في نفس المعاملة
+    changes = {
+        (instance.branch_id, row['product_id']): -row['total_quantity']
+        for row in instance.items.values('product_id').annotate(total_quantity=Sum('quantity'))
+    }
+    commit_reservations(
+        holder,
+        changes,
+        movement_type='OUT',
+        reason=f"Sale (Order {instance.pk})",
+        moved_by=instance.performed_by,
+    )
+
+
+# === Release stock reservations of deleted baskets ===
+@receiver(post_delete, sender=TempOrder)
+def release_temp_order_reservations(sender, instance, **kwargs):
+    release_reservations(reservation_holder(TEMP_ORDER_HOLDER, instance.pk))
+
+
+@receiver(post_delete, sender=Order)
+def release_order_reservations(sender, instance, **kwargs):
+    release_reservations(reservation_holder(ORDER_HOLDER, instance.pk))
 
 
 # === Inventory movement on ReturnItem created ===
@@ -129,31 +192,12 @@ def manage_inventory_and_movements_on_return_item_save(sender, instance, created
         return
 
     return_obj = instance.return_obj
-    product = instance.product
-    quantity = instance.quantity_returned
-    branch = return_obj.order.branch
-
     with transaction.atomic():
-        inventory = BranchProductInventory.objects.select_for_update().get(
-            product=product,
-            branch=branch
-        )
-        old_quantity = inventory.quantity
-        new_quantity = old_quantity + quantity
-
-        inventory.quantity = new_quantity
-        inventory.save(update_fields=['quantity'])
-
-        InventoryMovement.objects.create(
-            inventory=inventory,
-            product=product,
-            branch=branch,
+        apply_stock_changes(
+            {(return_obj.order.branch_id, instance.product_id): instance.quantity_returned},
             movement_type='IN',
-            quantity_change=quantity,
-            old_quantity=old_quantity,
-            new_quantity=new_quantity,
-            reason=f"Return (Return ID: {return_obj.return_id})",
-            moved_by=return_obj.processed_by
+            reason=f"Return (Return ID: {return_obj.pk})",
+            moved_by=return_obj.processed_by,
         )
 
 
@@ -164,50 +208,29 @@ def manage_inventory_and_movements_on_return_item_delete(sender, instance, **kwa
         return
 
     return_obj = instance.return_obj
-    product = instance.product
-    quantity = instance.quantity_returned
-    branch = return_obj.order.branch
-
     with transaction.atomic():
-        inventory = BranchProductInventory.objects.select_for_update().get(
-            product=product,
-            branch=branch
-        )
-        old_quantity = inventory.quantity
-        new_quantity = old_quantity - quantity
-
-        if new_quantity < 0:
-            logger.warning(f"Negative stock after deleting ReturnItem for {product.name} in {branch.name}")
-            new_quantity = 0
-
-        inventory.quantity = new_quantity
-        inventory.save(update_fields=['quantity'])
-
-        InventoryMovement.objects.create(
-            inventory=inventory,
-            product=product,
-            branch=branch,
+        apply_stock_changes(
+            {(return_obj.order.branch_id, instance.product_id): -instance.quantity_returned},
             movement_type='ADJUSTMENT',
-            quantity_change=-quantity,
-            old_quantity=old_quantity,
-            new_quantity=new_quantity,
-            reason=f"ReturnItem deleted (Return ID: {return_obj.return_id})",
-            moved_by=return_obj.processed_by
+            reason=f"ReturnItem deleted (Return ID: {return_obj.pk})",
+            moved_by=return_obj.processed_by,
+            clamp_at_zero=True,
         )
 
 
 # === Create Rating automatically on Order creation ===
 @receiver(post_save, sender=Order)
 def create_or_update_rating_for_order(sender, instance, created, **kwargs):
-    if created:
+    # طلبات العملاء غير المسجلين (نقطة البيع) بلا تقييم: Rating.customer إلزامي
+    if created and instance.customer_id:
         try:
             if not Rating.objects.filter(order=instance).exists():
                 Rating.objects.create(
                     order=instance,
                     customer=instance.customer
                 )
-                logger.info(f"Rating created for Order: {instance.order_id or instance.id}")
+                logger.info(f"Rating created for Order: {instance.pk}")
             else:
-                logger.info(f"Rating already exists for Order: {instance.order_id or instance.id}")
+                logger.info(f"Rating already exists for Order: {instance.pk}")
         except Exception as e:
-            logger.error(f"Error creating Rating for Order {instance.order_id or instance.id}: {e}")
+            logger.error(f"Error creating Rating for Order {instance.pk}: {e}")
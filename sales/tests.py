@@ -1,3 +1,409 @@
-from django.test import TestCase
+import math
+import multiprocessing
+import os
+import random
+from datetime import timedelta
+from decimal import Decimal
+from unittest import skipUnless
 
-# Create your tests here.
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connection, connections, transaction
+from django.db.models.sql.constants import GET_ITERATOR_CHUNK_SIZE
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from products.inventory import ORDER_HOLDER, TEMP_ORDER_HOLDER, available_quantity, reservation_holder, reserve_stock
+from products.models import BranchProductInventory, InventoryMovement, Product, StockReservation
+from stores.models import Branch, Store
+from users.constants import UserType
+from users.models import Customer, Employee, Role, UserAccount
+
+from .constants import OrderStatus, PaymentMethod
+from .models import Order, OrderItem, TempOrder, TempOrderItem
+from .utils import calculate_order_totals
+from .views import convert_temp_order
+
+
+class OrderTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        store = Store.objects.create(name="Store", address="Riyadh")
+        cls.branch = Branch.objects.create(store=store, name="Branch", address="Riyadh")
+        role = Role.objects.create(role_name=UserType.PLATFORM_CUSTOMER.value)
+        cls.customer = Customer.objects.create(user_account=UserAccount.objects.create(email="customer@example.com", role=role))
+        cls.products = [Product.objects.create(name=f"Product {i}", price=Decimal('10.00')) for i in range(3)]
+
+    def test_line_delta_reaches_the_loaded_order(self):
+        order = Order.objects.create(branch=self.branch, customer=self.customer)
+        OrderItem.objects.create(order=order, product=self.products[0], quantity=2, unit_price=Decimal('10.00'), vat_percentage=Decimal('15.00'))
+        self.assertEqual(order.total_amount, Decimal('23.00'))
+
+        # حفظ كامل للطلب المحمّل لا يعيد كتابة الإجماليات القديمة
+        order.save()
+        order.refresh_from_db()
+        self.assertEqual((order.total_amount_before_vat, order.total_vat_amount, order.total_amount),
+                         (Decimal('20.00'), Decimal('3.00'), Decimal('23.00')))
+
+    def test_aggregate_vat_matches_per_line_rounding(self):
+        order = Order.objects.create(branch=self.branch, customer=self.customer)
+        for product, quantity, price in zip(self.products, (1, 3, 7), ('1.00', '0.35', '2.99')):
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, unit_price=Decimal(price), vat_percentage=Decimal('15.00'))
+        order.refresh_from_db()
+
+        totals = calculate_order_totals(order)
+        self.assertEqual(totals['total_before_vat'], order.total_amount_before_vat)
+        self.assertEqual(totals['total_vat'], order.total_vat_amount)
+
+
+class ConvertTempOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        store = Store.objects.create(name="Store", address="Riyadh")
+        cls.branch = Branch.objects.create(store=store, name="Branch", address="Riyadh")
+        cls.cashier = UserAccount.objects.create(email="cashier@example.com", role=Role.objects.create(role_name=UserType.CASHIER.value))
+        role = Role.objects.create(role_name=UserType.PLATFORM_CUSTOMER.value)
+        cls.customer = Customer.objects.create(user_account=UserAccount.objects.create(email="customer@example.com", role=role))
+        cls.products = Product.objects.bulk_create([Product(name=f"Product {i}", price=Decimal('10.00')) for i in range(200)])
+        BranchProductInventory.objects.bulk_create([
+            BranchProductInventory(product=product, branch=cls.branch, quantity=10) for product in cls.products
+        ])
+
+    def temp_order(self, lines):
+        temp_order = TempOrder.objects.create(customer=self.customer, created_by=self.cashier)
+        TempOrderItem.objects.bulk_create([
+            TempOrderItem(temp_order=temp_order, product=product, quantity=2) for product in self.products[:lines]
+        ])
+        return temp_order
+
+    def convert(self, temp_order):
+        return convert_temp_order(temp_order, self.branch.pk, self.cashier, PaymentMethod.CASH, customer=self.customer)
+
+    def batches(self, lines):
+        """
+        Statements that are split by size rather than issued per line: SQLite caps the
+        parameters of bulk_create whatever batch_size is, and the delete collector removes
+        the lines GET_ITERATOR_CHUNK_SIZE ids at a time (their signals are connected, only muted).
+        """
+        fields = [field for field in OrderItem._meta.concrete_fields if not field.primary_key]
+        inserts = math.ceil(lines / min(500, connection.ops.bulk_batch_size(fields, range(lines))))
+        return inserts + math.ceil(lines / GET_ITERATOR_CHUNK_SIZE)
+
+    def test_query_count_does_not_grow_with_the_lines(self):
+        temp_order = self.temp_order(10)
+        with CaptureQueriesContext(connection) as queries:
+            self.convert(temp_order)
+        expected = len(queries) - self.batches(10)
+
+        for lines in (50, 200):
+            with self.subTest(lines=lines):
+                temp_order = self.temp_order(lines)
+                with self.assertNumQueries(expected + self.batches(lines)):
+                    order = self.convert(temp_order)
+                self.assertEqual(order.items.count(), lines)
+                self.assertEqual(order.status, OrderStatus.PAID)
+                self.assertEqual(order.total_amount, Decimal('23.00') * lines)
+                self.assertFalse(TempOrderItem.objects.filter(temp_order_id=temp_order.pk).exists())
+
+
+class TempOrderItemReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        store = Store.objects.create(name="Store", address="Riyadh")
+        cls.branch = Branch.objects.create(store=store, name="Branch", address="Riyadh")
+        cls.cashier = UserAccount.objects.create(email="cashier@example.com", role=Role.objects.create(role_name=UserType.CASHIER.value))
+        Employee.objects.create(user_account=cls.cashier, store=store, branch=cls.branch)
+        cls.product = Product.objects.create(name="Product", price=Decimal('10.00'))
+        BranchProductInventory.objects.create(product=cls.product, branch=cls.branch, quantity=5)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.cashier)
+        self.temp_order = TempOrder.objects.create(created_by=self.cashier)
+        self.holder = reservation_holder(TEMP_ORDER_HOLDER, self.temp_order.pk)
+
+    def add(self, quantity):
+        return self.client.post('/api/temp-order-items/', {
+            'temp_order': self.temp_order.pk, 'product': self.product.pk, 'quantity': quantity,
+        })
+
+    def reserved(self):
+        return StockReservation.objects.get(holder=self.holder, branch=self.branch, product=self.product).quantity
+
+    def test_adding_lines_reserves_in_the_cashiers_branch(self):
+        self.assertEqual(self.add(3).status_code, 201)
+        self.assertEqual(self.add(1).status_code, 201)
+        self.assertEqual(self.temp_order.items.get().quantity, 4)
+        self.assertEqual(self.reserved(), 4)
+        self.assertEqual(available_quantity(self.branch.pk, self.product.pk), 1)
+        # المخزون الفعلي لا يُخصم قبل إتمام الطلب
+        self.assertEqual(BranchProductInventory.objects.get(product=self.product).quantity, 5)
+
+        response = self.add(2)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quantity', response.data)
+        self.assertEqual(self.reserved(), 4)
+
+    def test_changing_and_deleting_a_line_updates_the_hold(self):
+        self.add(3)
+        item = self.temp_order.items.get()
+        response = self.client.patch(f'/api/temp-order-items/{item.pk}/', {'quantity': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.reserved(), 1)
+
+        self.assertEqual(self.client.delete(f'/api/temp-order-items/{item.pk}/').status_code, 204)
+        self.assertFalse(StockReservation.objects.filter(holder=self.holder).exists())
+
+    def test_only_the_creator_can_change_the_temp_order(self):
+        other = UserAccount.objects.create(email="other@example.com", role=self.cashier.role)
+        Employee.objects.create(user_account=other, branch=self.branch)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.add(1).status_code, 400)
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class ReservationCheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        store = Store.objects.create(name="Store", address="Riyadh")
+        cls.branch = Branch.objects.create(store=store, name="Branch", address="Riyadh")
+        cls.cashier = UserAccount.objects.create(email="cashier@example.com", role=Role.objects.create(role_name=UserType.CASHIER.value))
+        role = Role.objects.create(role_name=UserType.PLATFORM_CUSTOMER.value)
+        cls.customer = Customer.objects.create(user_account=UserAccount.objects.create(email="customer@example.com", role=role))
+        cls.products = [Product.objects.create(name=f"Product {i}", price=Decimal('10.00')) for i in range(2)]
+        for product in cls.products:
+            BranchProductInventory.objects.create(product=product, branch=cls.branch, quantity=5)
+
+    def on_hand(self):
+        return [
+            BranchProductInventory.objects.get(product=product).quantity for product in self.products
+        ]
+
+    def available(self):
+        return [available_quantity(self.branch.pk, product.pk) for product in self.products]
+
+    def test_conversion_moves_the_holds_and_completion_commits_them_once(self):
+        temp_order = TempOrder.objects.create(customer=self.customer, created_by=self.cashier)
+        holder = reservation_holder(TEMP_ORDER_HOLDER, temp_order.pk)
+        for product, quantity in zip(self.products, (2, 1)):
+            reserve_stock(self.branch.pk, product.pk, holder, quantity=quantity)
+        TempOrderItem.objects.bulk_create([
+            TempOrderItem(temp_order=temp_order, product=product, quantity=quantity)
+            for product, quantity in zip(self.products, (2, 1))
+        ])
+
+        order = convert_temp_order(temp_order, self.branch.pk, self.cashier, PaymentMethod.CASH, customer=self.customer)
+        order_holder = reservation_holder(ORDER_HOLDER, order.pk)
+        self.assertEqual(set(StockReservation.objects.values_list('holder', flat=True)), {order_holder})
+        self.assertFalse(StockReservation.objects.filter(expires_at__isnull=False).exists())
+        self.assertEqual(self.on_hand(), [5, 5])
+        self.assertEqual(self.available(), [3, 4])
+
+        order.status = OrderStatus.COMPLETED
+        order.save()
+        self.assertEqual(self.on_hand(), [3, 4])
+        self.assertEqual(self.available(), [3, 4])
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(InventoryMovement.objects.count(), 2)
+
+        # حفظ الطلب المكتمل مرة أخرى (المحمّل أو المعاد تحميله) لا يخصم مجدداً
+        order.save()
+        Order.objects.get(pk=order.pk).save()
+        self.assertEqual(self.on_hand(), [3, 4])
+        self.assertEqual(InventoryMovement.objects.count(), 2)
+
+    def test_cancelling_releases_the_order_holds(self):
+        order = Order.objects.create(branch=self.branch, customer=self.customer)
+        reserve_stock(self.branch.pk, self.products[0].pk, reservation_holder(ORDER_HOLDER, order.pk), quantity=2, expires=False)
+        order.status = OrderStatus.CANCELLED
+        order.save()
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(self.on_hand(), [5, 5])
+
+
+class TempOrderTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = Product.objects.bulk_create([
+            Product(name=f"Product {i}", price=Decimal('10.00'), discount_percentage=Decimal('10.00')) for i in range(51)
+        ])
+        for product in cls.products:
+            product.refresh_effective_price()
+
+    def basket(self, lines):
+        temp_order = TempOrder.objects.create()
+        TempOrderItem.objects.bulk_create([
+            TempOrderItem(temp_order=temp_order, product=product, quantity=2) for product in self.products[:lines]
+        ])
+        return temp_order
+
+    def scan(self, temp_order):
+        with CaptureQueriesContext(connection) as queries:
+            TempOrderItem.objects.create(temp_order=temp_order, product=self.products[-1], quantity=1)
+        return len(queries)
+
+    def test_scan_cost_does_not_grow_with_the_basket(self):
+        small, large = self.basket(5), self.basket(50)
+        self.assertEqual(self.scan(small), self.scan(large))
+        self.assertEqual(small.total_amount, Decimal('9.00') * 11)
+        large.refresh_from_db()
+        self.assertEqual(large.total_amount, Decimal('9.00') * 101)
+
+    def test_stale_precomputed_price_is_recomputed(self):
+        temp_order = self.basket(2)
+        # عرض انتهى ولم يمر عليه refresh_effective_prices بعد
+        Product.objects.filter(pk=self.products[0].pk).update(
+            current_price=Decimal('5.00'), price_valid_until=timezone.localdate() - timedelta(days=1),
+        )
+        temp_order.calculate_totals()
+        self.assertEqual(temp_order.total_amount, Decimal('9.00') * 4)
+
+
+class OrderCompletionStockTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        store = Store.objects.create(name="Store", address="Riyadh")
+        cls.branch = Branch.objects.create(store=store, name="Branch", address="Riyadh")
+        cls.cashier = UserAccount.objects.create(email="cashier@example.com", role=Role.objects.create(role_name=UserType.CASHIER.value))
+        cls.products = [Product.objects.create(name=f"Product {i}", price=Decimal('10.00')) for i in range(3)]
+        for product in cls.products:
+            BranchProductInventory.objects.create(product=product, branch=cls.branch, quantity=20)
+
+    def order(self, quantities):
+        order = Order.objects.create(branch=self.branch, performed_by=self.cashier, status=OrderStatus.PAID)
+        for product, quantity in zip(self.products, quantities):
+            item = OrderItem.objects.create(order=order, product=product, quantity=1, unit_price=Decimal('10.00'), vat_percentage=Decimal('15.00'))
+            # مسح المنتج نفسه عدة مرات يزيد كمية سطره (order, product) فريد
+            for _ in range(quantity - 1):
+                item.quantity += 1
+                item.save()
+        return Order.objects.get(pk=order.pk)
+
+    def on_hand(self):
+        return dict(BranchProductInventory.objects.values_list('product_id', 'quantity'))
+
+    def complete(self, order):
+        order.status = OrderStatus.COMPLETED
+        with CaptureQueriesContext(connection) as queries:
+            order.save()
+        return [query['sql'] for query in queries.captured_queries]
+
+    def test_completion_decrements_each_inventory_once_by_the_line_total(self):
+        order = self.order((3, 1, 5))
+        queries = self.complete(order)
+
+        self.assertEqual(self.on_hand(), {self.products[0].pk: 17, self.products[1].pk: 19, self.products[2].pk: 15})
+        # قفل واحد وتحديث واحد وإدراج واحد للحركات، مهما كان عدد الأسطر
+        inventory_table = '"products_branchproductinventory"'
+        self.assertEqual(len([sql for sql in queries if sql.startswith('UPDATE') and inventory_table in sql.split(' SET ')[0]]), 1)
+        self.assertEqual(len([sql for sql in queries if sql.startswith('INSERT INTO "products_inventorymovement"')]), 1)
+
+        movements = InventoryMovement.objects.filter(branch=self.branch).order_by('product_id')
+        self.assertEqual(
+            [(movement.product_id, movement.movement_type, movement.quantity_change, movement.old_quantity, movement.new_quantity) for movement in movements],
+            [(self.products[0].pk, 'OUT', -3, 20, 17), (self.products[1].pk, 'OUT', -1, 20, 19), (self.products[2].pk, 'OUT', -5, 20, 15)],
+        )
+        self.assertTrue(all(movement.moved_by_id == self.cashier.pk for movement in movements))
+
+    def test_resaving_a_completed_order_does_not_decrement_again(self):
+        order = self.order((2, 2))
+        self.complete(order)
+        expected = self.on_hand()
+
+        order.save()
+        reloaded = Order.objects.get(pk=order.pk)
+        reloaded.save()
+        reloaded.status = OrderStatus.COMPLETED
+        reloaded.save(update_fields=['status'])
+
+        self.assertEqual(self.on_hand(), expected)
+        self.assertEqual(InventoryMovement.objects.count(), 2)
+
+    def test_insufficient_stock_rolls_the_completion_back(self):
+        order = self.order((3,))
+        BranchProductInventory.objects.filter(product=self.products[0]).update(quantity=2)
+        order.status = OrderStatus.COMPLETED
+        with self.assertRaises(DjangoValidationError), transaction.atomic():
+            order.save()
+        self.assertEqual(Order.objects.get(pk=order.pk).status, OrderStatus.PAID)
+        self.assertEqual(self.on_hand()[self.products[0].pk], 2)
+        self.assertFalse(InventoryMovement.objects.exists())
+
+
+def _checkout_worker(temp_order_ids, branch_id, cashier_id, barrier, results):
+    """One cashier process: converts its temp orders and completes them, as the POS does."""
+    error = None
+    try:
+        cashier = UserAccount.objects.get(pk=cashier_id)
+        barrier.wait()
+        for temp_order_id in temp_order_ids:
+            order = convert_temp_order(TempOrder.objects.get(pk=temp_order_id), branch_id, cashier, PaymentMethod.CASH)
+            order.status = OrderStatus.COMPLETED
+            order.save()
+    except Exception as exc:
+        error = repr(exc)
+    finally:
+        connections.close_all()
+    results.put((os.getpid(), error))
+
+
+@skipUnless(connection.vendor == 'postgresql', "Row locks need PostgreSQL")
+@override_settings(HOT_SKU_LOCK_WAIT_MS=10 ** 6)  # لا ترقية إلى hot أثناء الاختبار
+class CheckoutConcurrencyTests(TransactionTestCase):
+    workers = 32
+    checkouts_per_worker = 3
+    stock = 1000
+
+    def setUp(self):
+        store = Store.objects.create(name="Store", address="Riyadh")
+        self.branch = Branch.objects.create(store=store, name="Branch", address="Riyadh")
+        self.cashier = UserAccount.objects.create(email="cashier@example.com", role=Role.objects.create(role_name=UserType.CASHIER.value))
+        self.products = [Product.objects.create(name=f"Product {i}", price=Decimal('10.00')) for i in range(6)]
+        for product in self.products:
+            BranchProductInventory.objects.create(product=product, branch=self.branch, quantity=self.stock)
+
+        # سلال متداخلة: كل سلة فيها 4 من المنتجات الستة بترتيب عشوائي
+        rng = random.Random(0)
+        self.sold = dict.fromkeys((product.pk for product in self.products), 0)
+        self.lines = 0
+        self.baskets = []
+        for _ in range(self.workers):
+            temp_order_ids = []
+            for _ in range(self.checkouts_per_worker):
+                temp_order = TempOrder.objects.create(created_by=self.cashier)
+                holder = reservation_holder(TEMP_ORDER_HOLDER, temp_order.pk)
+                for product in rng.sample(self.products, 4):
+                    quantity = rng.randint(1, 3)
+                    reserve_stock(self.branch.pk, product.pk, holder, quantity=quantity)
+                    TempOrderItem.objects.bulk_create([TempOrderItem(temp_order=temp_order, product=product, quantity=quantity)])
+                    self.sold[product.pk] += quantity
+                    self.lines += 1
+                temp_order_ids.append(temp_order.pk)
+            self.baskets.append(temp_order_ids)
+
+    def test_concurrent_checkouts_do_not_deadlock(self):
+        # العمليات الفرعية تفتح اتصالاتها الخاصة بقاعدة الاختبار
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(self.workers)
+        results = context.Queue()
+        processes = [
+            context.Process(target=_checkout_worker, args=(temp_order_ids, self.branch.pk, self.cashier.pk, barrier, results))
+            for temp_order_ids in self.baskets
+        ]
+        for process in processes:
+            process.start()
+        outcomes = [results.get(timeout=300) for _ in processes]
+        for process in processes:
+            process.join(timeout=30)
+
+        self.assertEqual([error for _, error in outcomes if error], [])
+        self.assertEqual(Order.objects.filter(status=OrderStatus.COMPLETED).count(), self.workers * self.checkouts_per_worker)
+        self.assertEqual(
+            dict(BranchProductInventory.objects.values_list('product_id', 'quantity')),
+            {product_id: self.stock - sold for product_id, sold in self.sold.items()},
+        )
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertFalse(TempOrder.objects.exists())
+        self.assertEqual(InventoryMovement.objects.count(), self.lines)
@@ -6,32 +6,78 @@ import hashlib
 import base64
 import os
 from io import BytesIO
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
 from PIL import Image
 from django.utils import timezone
 from django.core.files import File
 from django.db import models
 from django.conf import settings
-from django.db.models import Sum, F
+from django.db.models import Count, Sum, F, Q, Value, ExpressionWrapper
+from django.db.models.functions import Cast, Coalesce, Round
 import qrcode
 
+ORDER_TOTAL_FIELDS = ['total_amount', 'total_amount_before_vat', 'total_vat_amount']
+
+TWO_PLACES = Decimal('0.01')
+
+
+def line_totals(quantity, unit_price, vat_percentage):
+    """
+    Returns (amount_before_vat, vat_amount) for a single order line.
+    VAT is rounded per line so that summing deltas always matches a full recompute.
+    """
+    before_vat = (Decimal(quantity) * (unit_price or Decimal('0.00'))).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+    vat = (before_vat * (vat_percentage or Decimal('0.00')) / Decimal('100')).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+    return before_vat, vat
+
+
+def _line_before_vat_expression(prefix=''):
+    return ExpressionWrapper(
+        F(f'{prefix}quantity') * F(f'{prefix}unit_price'),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2)
+    )
+
+
+def _line_vat_expression(prefix=''):
+    # الضرب في 0.01 بدل القسمة على 100: في SQLite يكون حاصل ضرب القيم الصحيحة عدداً صحيحاً
+    # فتُجرى القسمة قسمةً صحيحة (15 / 100 = 0)
+    return Round(
+        Cast(
+            F(f'{prefix}quantity') * F(f'{prefix}unit_price') * F(f'{prefix}vat_percentage') * Value(Decimal('0.01')),
+            output_field=models.DecimalField(max_digits=18, decimal_places=6)
+        ),
+        precision=2,
+    )
+
+
+def order_totals_aggregates(prefix=''):
+    """
+    Aggregate expressions for both order sums, usable in aggregate() on OrderItem
+    (prefix='') or in annotate() on Order (prefix='items__').
+    """
+    return {
+        'total_before_vat': Coalesce(
+            Sum(_line_before_vat_expression(prefix)), Value(Decimal('0.00')),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)
+        ),
+        'total_vat': Coalesce(
+            Sum(_line_vat_expression(prefix)), Value(Decimal('0.00')),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)
+        ),
+    }
+
+
 def calculate_order_totals(order):
     """
-    Calculates and returns total amounts for the given order:
+    Calculates and returns total amounts for the given order in a single query:
     - total_before_vat
     - total_vat
     - total_amount (final)
     """
-    items = order.items.all()
-
-    total_before_vat = items.aggregate(
-        total=Sum(F('quantity') * F('unit_price'), output_field=models.DecimalField())
-    )['total'] or Decimal('0.00')
-
-    total_vat = items.aggregate(
-        vat=Sum(F('quantity') * F('vat_amount'), output_field=models.DecimalField())
-    )['vat'] or Decimal('0.00')
+    sums = order.items.aggregate(**order_totals_aggregates())
 
+    total_before_vat = sums['total_before_vat']
+    total_vat = sums['total_vat']
     fee_amount = order.fee_amount or Decimal('0.00')
     total_amount = total_before_vat + total_vat + fee_amount
 
@@ -43,6 +89,88 @@ def calculate_order_totals(order):
     }
 
 
+def apply_order_totals_delta(order_id, before_vat_delta, vat_delta, order=None):
+    """
+    Applies one line's contribution to the order totals atomically with F() expressions,
+    without reading the other lines of the order.
+    `order`, when given, is an in-memory instance of the same order that receives the
+    same delta, so a later full save() of it does not write back the old totals.
+    """
+    if not before_vat_delta and not vat_delta:
+        return 0
+    from .models import Order
+    updated = Order.objects.filter(pk=order_id).update(
+        total_amount_before_vat=F('total_amount_before_vat') + before_vat_delta,
+        total_vat_amount=F('total_vat_amount') + vat_delta,
+        total_amount=F('total_amount') + before_vat_delta + vat_delta,
+    )
+    if order is not None:
+        order.total_amount_before_vat = (order.total_amount_before_vat or Decimal('0.00')) + before_vat_delta
+        order.total_vat_amount = (order.total_vat_amount or Decimal('0.00')) + vat_delta
+        order.total_amount = (order.total_amount or Decimal('0.00')) + before_vat_delta + vat_delta
+    return updated
+
+
+def recalculate_order_totals(order):
+    """
+    Full recompute of the order totals (one aggregate query + one update).
+    """
+    totals = calculate_order_totals(order)
+    order.total_amount_before_vat = totals['total_before_vat']
+    order.total_vat_amount = totals['total_vat']
+    order.total_amount = totals['total_amount']
+    type(order).objects.filter(pk=order.pk).update(
+        total_amount_before_vat=order.total_amount_before_vat,
+        total_vat_amount=order.total_vat_amount,
+        total_amount=order.total_amount,
+    )
+    return totals
+
+
+def calculate_temp_order_total(temp_order):
+    """
+    Basket total in one aggregate query, priced with the products' precomputed current_price
+    instead of loading every line's product. Lines whose precomputed price went stale (an
+    offer started or ended since the last refresh_effective_prices run) are priced in Python.
+    """
+    today = timezone.localdate()
+    current = Q(product__current_price__isnull=False) & (
+        Q(product__price_valid_until__isnull=True) | Q(product__price_valid_until__gte=today)
+    )
+    sums = temp_order.items.aggregate(
+        total=Coalesce(
+            Sum(F('quantity') * F('product__current_price'), filter=current), Value(Decimal('0.00')),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)
+        ),
+        stale_lines=Count('pk', filter=~current),
+    )
+    total = sums['total']
+    if sums['stale_lines']:
+        total += sum(
+            item.product.price_after_discount() * item.quantity
+            for item in temp_order.items.exclude(current).select_related('product')
+        )
+    return Decimal(total).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+
+
+def basket_etag(temp_order):
+    """
+    Cheap fingerprint of a temporary order's lines (one aggregate query), used as
+    the ETag of the basket endpoint so polling screens get 304 when nothing changed.
+    """
+    fingerprint = temp_order.items.aggregate(
+        lines=models.Count('id'),
+        units=Sum('quantity'),
+        last_id=models.Max('id'),
+        weighted=Sum(F('id') * F('quantity')),
+        product_weighted=Sum(F('product_id') * F('quantity')),
+    )
+    raw = f"{temp_order.pk}:{temp_order.total_amount}:" + ":".join(
+        str(fingerprint[key] or 0) for key in ('lines', 'units', 'last_id', 'weighted', 'product_weighted')
+    )
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
 def calculate_return_total(return_obj):
     """
     Calculates the total returned amount from all ReturnItems under this return_obj.
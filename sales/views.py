@@ -5,11 +5,13 @@ from rest_framework.response import Response
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.decorators import action
 from rest_framework import serializers
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.shortcuts import get_object_or_404
 from django.db import transaction
-from django.db.models import F, Q, Sum
+from django.db.models import F, Prefetch, Q, Sum, prefetch_related_objects
+from django.utils.http import parse_etags, quote_etag
 from django.utils import timezone
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
 from django.utils.translation import gettext_lazy as _
 
 # استيراد النماذج من sales
@@ -25,36 +27,60 @@ from .serializers import ( # تم استيراد Serializers مباشرة
     ReturnItemSerializer,
     QRCodeScanSerializer # لوحدة مسح الباركود
 )
+from .constants import OrderStatus, PaymentMethod
+from .signals import muted_item_signals
+from .utils import basket_etag, recalculate_order_totals
 
 # استيراد النماذج الأخرى
-from products.models import Product, BranchProductInventory, InventoryMovement # تم تحديث الاستيرادات للمخزون
 from stores.models import Branch
-from users.models import UserAccount, Role
+from users.models import UserAccount, Role, Customer, Employee
+from users.constants import UserType
+from products.scan_cache import lookup_scan_record
+from products.inventory import (
+    ORDER_HOLDER,
+    TEMP_ORDER_HOLDER,
+    release_reservations,
+    reservation_holder,
+    reserve_stock,
+    transfer_reservations,
+)
 from mysite.permissions import CustomPermission
+from authentication.principal import get_principal
+from mysite.pagination import TimestampCursorPagination
+from mysite.fieldsets import SparseFieldsetViewMixin
+
+
+def _prefetch_basket(temp_order):
+    """
+    Loads the lines of a temporary order with their products in one query,
+    so TempOrderSerializer does not query the product of every line.
+    """
+    prefetch_related_objects(
+        [temp_order],
+        Prefetch('items', queryset=TempOrderItem.objects.select_related('product').order_by('id')),
+    )
+    return temp_order
+
+
+def _reserve_or_400(branch_id, product_id, holder, **kwargs):
+    """
+    reserve_stock() wrapper that surfaces stock errors as a DRF 400 on the quantity field.
+    """
+    try:
+        return reserve_stock(branch_id, product_id, holder, **kwargs)
+    except DjangoValidationError as exc:
+        raise serializers.ValidationError({'quantity': exc.messages})
 
 
 # --- API ViewSets for Temporary Orders (TempOrder) ---
-class TempOrderViewSet(viewsets.ModelViewSet):
+class TempOrderViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = TempOrder.objects.all()
     serializer_class = TempOrderSerializer # استخدام Serializer المستورد
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated, CustomPermission]
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_superuser or user.is_app_owner() or user.is_project_manager():
-            return TempOrder.objects.all()
-        
-        if user.is_store_manager_user() and user.store:
-            return TempOrder.objects.filter(branch__store=user.store)
-        
-        if (user.is_branch_manager_user() or user.is_general_staff_user() or user.is_cashier_user()) and user.branch:
-            if user.is_branch_manager_user():
-                return TempOrder.objects.filter(branch=user.branch)
-            elif user.is_general_staff_user() or user.is_cashier_user(): # الموظف العام/الكاشير يرى طلباته المؤقتة
-                return TempOrder.objects.filter(branch=user.branch, cashier=user)
-
-        return TempOrder.objects.none()
+        return TempOrder.objects.for_principal(get_principal(self.request))
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -80,32 +106,48 @@ class TempOrderViewSet(viewsets.ModelViewSet):
         instance.delete()
 
 
+    @action(detail=True, methods=['get'], url_path='basket')
+    def basket(self, request, pk=None):
+        """
+        Full basket with its lines (prefetched). Supports ETag / If-None-Match so customer
+        display screens can poll and get 304 Not Modified while the basket is unchanged.
+        """
+        temp_order = self.get_object()
+        etag = quote_etag(basket_etag(temp_order))
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        serializer = self.get_serializer(_prefetch_basket(temp_order))
+        return Response(serializer.data, status=status.HTTP_200_OK, headers={'ETag': etag})
+
+
 # --- API ViewSets for Temporary Order Items (TempOrderItem) ---
-class TempOrderItemViewSet(viewsets.ModelViewSet):
+class TempOrderItemViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = TempOrderItem.objects.all()
     serializer_class = TempOrderItemSerializer # استخدام Serializer المستورد
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated, CustomPermission]
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_superuser or user.is_app_owner() or user.is_project_manager():
-            return TempOrderItem.objects.all()
-        
-        if user.is_store_manager_user() and user.store:
-            return TempOrderItem.objects.filter(temp_order__branch__store=user.store)
-        
-        if (user.is_branch_manager_user() or user.is_general_staff_user() or user.is_cashier_user()) and user.branch:
-            if user.is_branch_manager_user():
-                return TempOrderItem.objects.filter(temp_order__branch=user.branch)
-            elif user.is_general_staff_user() or user.is_cashier_user():
-                return TempOrderItem.objects.filter(temp_order__branch=user.branch, temp_order__cashier=user)
-
-        return TempOrderItem.objects.none()
-
+        # الطلب المؤقت يُقرأ في فحص صلاحية الكائن
+        return TempOrderItem.objects.for_principal(get_principal(self.request)).select_related('temp_order')
+
+    def _scanning_branch_id(self, temp_order, denied_message):
+        """
+        The branch the lines of `temp_order` are reserved in: the staff member's own branch,
+        since TempOrder has no branch of its own (as in QRCodeScanView).
+        """
+        principal = get_principal(self.request)
+        if not principal.has_role(UserType.GENERAL_STAFF, UserType.CASHIER):
+            raise serializers.ValidationError({'detail': denied_message})
+        if temp_order.created_by_id != self.request.user.pk:
+            raise serializers.ValidationError({'temp_order': _('You can only change temporary orders you created.')})
+        if principal.branch_id is None:
+            raise serializers.ValidationError({'detail': _('User must be assigned to a branch.')})
+        return principal.branch_id
 
     def perform_create(self, serializer):
-        user = self.request.user
         temp_order = serializer.validated_data.get('temp_order')
         product = serializer.validated_data.get('product')
         quantity = serializer.validated_data.get('quantity')
@@ -113,113 +155,63 @@ class TempOrderItemViewSet(viewsets.ModelViewSet):
         if not temp_order or not product or quantity is None:
             raise serializers.ValidationError({'detail': _('Temporary order, product, and quantity are required.')})
 
-        if not (user.is_general_staff_user() or user.is_cashier_user()):
-            raise serializers.ValidationError({'detail': _('You do not have permission to add items to this temporary order.')})
-            
-        if user.branch != temp_order.branch:
-             raise serializers.ValidationError({'temp_order': _('Temporary order must be in your assigned branch.')})
-
-        # التأكد من أن المنتج له مخزون في الفرع الخاص بالطلب المؤقت
-        product_inventory = BranchProductInventory.objects.filter(product=product, branch=temp_order.branch).first()
-        if not product_inventory:
-            raise serializers.ValidationError({'product': _('Product is not available in the temporary order\'s branch.')})
-
-        if product_inventory.quantity < quantity:
-            raise serializers.ValidationError({'quantity': _(f'Not enough stock available for product {product.name} in branch {temp_order.branch.name}. Available: {product_inventory.quantity}')})
+        branch_id = self._scanning_branch_id(temp_order, _('You do not have permission to add items to this temporary order.'))
 
         with transaction.atomic():
+            # حجز الكمية للطلب المؤقت بدلاً من خصمها من المخزون؛ الخصم الفعلي عند إتمام الطلب
+            _reserve_or_400(
+                branch_id, product.pk,
+                reservation_holder(TEMP_ORDER_HOLDER, temp_order.pk), delta=quantity,
+            )
+
             existing_item = TempOrderItem.objects.filter(temp_order=temp_order, product=product).first()
             if existing_item:
-                old_item_quantity = existing_item.quantity
                 existing_item.quantity = F('quantity') + quantity
-                existing_item.scanned_quantity = F('scanned_quantity') + quantity # زيادة الكمية الممسوحة أيضاً
-                existing_item.save(update_fields=['quantity', 'scanned_quantity'])
+                existing_item.save(update_fields=['quantity'])
                 existing_item.refresh_from_db()
                 serializer.instance = existing_item 
             else:
                 serializer.save() # price_at_scan will be set by TempOrderItem's save method
-            
-            # إنقاص كمية المنتج من المخزون في BranchProductInventory
-            # لا نحتاج لإنشاء InventoryMovement هنا، سيتم التعامل معها عند تحويل TempOrder إلى Order
-            product_inventory.quantity = F('quantity') - quantity
-            product_inventory.save(update_fields=['quantity'])
 
 
     def perform_update(self, serializer):
-        user = self.request.user
         instance = self.get_object() 
         product = instance.product
         old_quantity = instance.quantity
         new_quantity = serializer.validated_data.get('quantity', old_quantity)
 
-        if not (user.is_general_staff_user() or user.is_cashier_user()):
-            raise serializers.ValidationError({'detail': _('You do not have permission to modify this temporary order item.')})
-            
-        if user.branch != instance.temp_order.branch:
-             raise serializers.ValidationError({'temp_order': _('Temporary order must be in your assigned branch.')})
+        branch_id = self._scanning_branch_id(instance.temp_order, _('You do not have permission to modify this temporary order item.'))
 
         if new_quantity < 0:
             raise serializers.ValidationError({'quantity': _('Quantity cannot be negative.')})
 
-        product_inventory = BranchProductInventory.objects.filter(product=product, branch=instance.temp_order.branch).first()
-        if not product_inventory:
-            raise serializers.ValidationError({'product': _('Product inventory not found for this branch.')})
-
         with transaction.atomic():
-            diff_quantity = new_quantity - old_quantity
-            if diff_quantity > 0:
-                if product_inventory.quantity < diff_quantity:
-                    raise serializers.ValidationError({'quantity': _(f'Requested quantity ({new_quantity}) is not available. Available: {product_inventory.quantity + old_quantity}')})
-            
-            product_inventory.quantity = F('quantity') - diff_quantity
-            product_inventory.save(update_fields=['quantity'])
-            
+            _reserve_or_400(
+                branch_id, product.pk,
+                reservation_holder(TEMP_ORDER_HOLDER, instance.temp_order_id), quantity=new_quantity,
+            )
             serializer.save()
 
 
     def perform_destroy(self, instance):
-        user = self.request.user
-
-        if not (user.is_general_staff_user() or user.is_cashier_user()):
-            raise serializers.ValidationError({'detail': _('You do not have permission to delete this temporary order item.')})
-
-        if user.branch != instance.temp_order.branch:
-             raise serializers.ValidationError({'temp_order': _('Temporary order must be in your assigned branch.')})
+        self._scanning_branch_id(instance.temp_order, _('You do not have permission to delete this temporary order item.'))
 
         with transaction.atomic():
-            product_inventory = BranchProductInventory.objects.filter(product=instance.product, branch=instance.temp_order.branch).first()
-            if product_inventory:
-                product_inventory.quantity = F('quantity') + instance.quantity
-                product_inventory.save(update_fields=['quantity'])
-            else:
-                print(f"Warning: Inventory record for product {instance.product.name} in branch {instance.temp_order.branch.name} not found during TempOrderItem deletion. Stock was not returned.")
-                # أو يمكن رفع خطأ: raise serializers.ValidationError(_("Could not find inventory to return stock."))
-            
+            # إلغاء الحجز يعيد الكمية للمتاح مباشرة
+            release_reservations(reservation_holder(TEMP_ORDER_HOLDER, instance.temp_order_id), product_id=instance.product_id)
             instance.delete()
 
 
 # --- API ViewSets for Orders ---
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer # استخدام Serializer المستورد
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated, CustomPermission]
+    pagination_class = TimestampCursorPagination
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_superuser or user.is_app_owner() or user.is_project_manager() or user.is_app_staff_user():
-            return Order.objects.all()
-        
-        if user.is_platform_customer():
-            return Order.objects.filter(customer=user)
-        
-        if user.is_store_manager_user() and user.store:
-            return Order.objects.filter(branch__store=user.store)
-        
-        if (user.is_branch_manager_user() or user.is_general_staff_user() or user.is_cashier_user()) and user.branch:
-            return Order.objects.filter(branch=user.branch)
-            
-        return Order.objects.none()
+        return Order.objects.for_principal(get_principal(self.request))
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -270,27 +262,15 @@ class OrderViewSet(viewsets.ModelViewSet):
 
 
 # --- API ViewSets for Order Items ---
-class OrderItemViewSet(viewsets.ModelViewSet):
+class OrderItemViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = OrderItem.objects.all()
     serializer_class = OrderItemSerializer # استخدام Serializer المستورد
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated, CustomPermission]
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_superuser or user.is_app_owner() or user.is_project_manager():
-            return OrderItem.objects.all()
-        
-        if user.is_platform_customer():
-            return OrderItem.objects.filter(order__customer=user)
-        
-        if user.is_store_manager_user() and user.store:
-            return OrderItem.objects.filter(order__branch__store=user.store)
-        
-        if (user.is_branch_manager_user() or user.is_general_staff_user() or user.is_cashier_user()) and user.branch:
-            return OrderItem.objects.filter(order__branch=user.branch)
-            
-        return OrderItem.objects.none()
+        # الطلب يُقرأ في فحص صلاحية الكائن
+        return OrderItem.objects.for_principal(get_principal(self.request)).select_related('order')
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -316,15 +296,13 @@ class OrderItemViewSet(viewsets.ModelViewSet):
         if order.status not in [Order.OrderStatus.PENDING_PAYMENT, Order.OrderStatus.PAID]:
             raise serializers.ValidationError({'order': _('Cannot add items to an order with status: ') + order.get_status_display()})
 
-        # التحقق من المخزون
-        product_inventory = BranchProductInventory.objects.filter(product=product, branch=order.branch).first()
-        if not product_inventory:
-            raise serializers.ValidationError({'product': _('Product is not available in the order\'s branch.')})
-
-        if product_inventory.quantity < quantity:
-            raise serializers.ValidationError({'quantity': _(f'Not enough stock available for product {product.name} in branch {order.branch.name}. Available: {product_inventory.quantity}')})
-
         with transaction.atomic():
+            # حجز المخزون للطلب حتى إتمامه (بدون انتهاء صلاحية)
+            _reserve_or_400(
+                order.branch_id, product.pk,
+                reservation_holder(ORDER_HOLDER, order.pk), delta=quantity, expires=False,
+            )
+
             # إذا كان العنصر موجوداً بالفعل، قم بتحديث الكمية
             existing_item = OrderItem.objects.filter(order=order, product=product).first()
             if existing_item:
@@ -336,11 +314,6 @@ class OrderItemViewSet(viewsets.ModelViewSet):
             else:
                 serializer.save() # price_at_purchase and vat_rate will be set by OrderItem's save method
 
-            # خصم الكمية من المخزون
-            # InventoryMovement يتم تسجيلها عن طريق Signal بعد اكتمال الطلب، وليس هنا.
-            product_inventory.quantity = F('quantity') - quantity
-            product_inventory.save(update_fields=['quantity'])
-
 
     def perform_update(self, serializer):
         user = self.request.user
@@ -366,19 +339,11 @@ class OrderItemViewSet(viewsets.ModelViewSet):
         if new_quantity < 0:
             raise serializers.ValidationError({'quantity': _('Quantity cannot be negative.')})
 
-        product_inventory = BranchProductInventory.objects.filter(product=product, branch=order.branch).first()
-        if not product_inventory:
-            raise serializers.ValidationError({'product': _('Product inventory not found for this branch.')})
-
         with transaction.atomic():
-            diff_quantity = new_quantity - old_quantity
-            if diff_quantity > 0:
-                if product_inventory.quantity < diff_quantity:
-                    raise serializers.ValidationError({'quantity': _(f'Requested quantity ({new_quantity}) is not available. Available: {product_inventory.quantity + old_quantity}')})
-            
-            product_inventory.quantity = F('quantity') - diff_quantity
-            product_inventory.save(update_fields=['quantity'])
-            
+            _reserve_or_400(
+                order.branch_id, product.pk,
+                reservation_holder(ORDER_HOLDER, order.pk), quantity=new_quantity, expires=False,
+            )
             serializer.save()
 
     def perform_destroy(self, instance):
@@ -399,37 +364,22 @@ class OrderItemViewSet(viewsets.ModelViewSet):
             raise serializers.ValidationError({'order': _('Cannot delete items from an order with status: ') + order.get_status_display()})
 
         with transaction.atomic():
-            # استعادة الكمية للمخزون
-            # InventoryMovement يتم تسجيلها عن طريق Signal بعد حذف OrderItem
-            product_inventory = BranchProductInventory.objects.filter(product=instance.product, branch=order.branch).first()
-            if product_inventory:
-                product_inventory.quantity = F('quantity') + instance.quantity
-                product_inventory.save(update_fields=['quantity'])
-            else:
-                print(f"Warning: Inventory record for product {instance.product.name} in branch {order.branch.name} not found during OrderItem deletion. Stock was not returned.")
-            
+            # إلغاء حجز الكمية؛ المخزون نفسه لم يُخصم بعد
+            release_reservations(reservation_holder(ORDER_HOLDER, order.pk), product_id=instance.product_id)
             instance.delete()
 
 
 # --- API ViewSets for Payments ---
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated, CustomPermission]
+    pagination_class = TimestampCursorPagination
+    cursor_ordering = ('-payment_date', '-id')
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_superuser or user.is_app_owner() or user.is_project_manager() or user.is_app_staff_user():
-            return Payment.objects.all()
-        
-        if user.is_store_manager_user() and user.store:
-            return Payment.objects.filter(order__branch__store=user.store)
-        
-        if (user.is_branch_manager_user() or user.is_general_staff_user() or user.is_cashier_user()) and user.branch:
-            return Payment.objects.filter(order__branch=user.branch)
-            
-        return Payment.objects.none()
+        return Payment.objects.for_principal(get_principal(self.request))
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -457,27 +407,16 @@ class PaymentViewSet(viewsets.ModelViewSet):
 
 
 # --- API ViewSets for Returns ---
-class ReturnViewSet(viewsets.ModelViewSet):
+class ReturnViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = Return.objects.all()
     serializer_class = ReturnSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated, CustomPermission]
+    pagination_class = TimestampCursorPagination
+    cursor_ordering = ('-return_date', '-id')
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_superuser or user.is_app_owner() or user.is_project_manager() or user.is_app_staff_user():
-            return Return.objects.all()
-        
-        if user.is_platform_customer():
-            return Return.objects.filter(order__customer=user) # العملاء يرون إرجاعات طلباتهم
-        
-        if user.is_store_manager_user() and user.store:
-            return Return.objects.filter(order__branch__store=user.store)
-        
-        if (user.is_branch_manager_user() or user.is_general_staff_user() or user.is_cashier_user()) and user.branch:
-            return Return.objects.filter(order__branch=user.branch)
-            
-        return Return.objects.none()
+        return Return.objects.for_principal(get_principal(self.request))
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -505,27 +444,14 @@ class ReturnViewSet(viewsets.ModelViewSet):
 
 
 # --- API ViewSets for Return Items ---
-class ReturnItemViewSet(viewsets.ModelViewSet):
+class ReturnItemViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = ReturnItem.objects.all()
     serializer_class = ReturnItemSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated, CustomPermission]
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_superuser or user.is_app_owner() or user.is_project_manager() or user.is_app_staff_user():
-            return ReturnItem.objects.all()
-        
-        if user.is_platform_customer():
-            return ReturnItem.objects.filter(return_obj__order__customer=user)
-        
-        if user.is_store_manager_user() and user.store:
-            return ReturnItem.objects.filter(return_obj__order__branch__store=user.store)
-        
-        if (user.is_branch_manager_user() or user.is_general_staff_user() or user.is_cashier_user()) and user.branch:
-            return ReturnItem.objects.filter(return_obj__order__branch=user.branch)
-            
-        return ReturnItem.objects.none()
+        return ReturnItem.objects.for_principal(get_principal(self.request))
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -575,6 +501,66 @@ class ReturnItemViewSet(viewsets.ModelViewSet):
 
 
 # --- API for converting TempOrder to Order ---
+def convert_temp_order(temp_order, branch_id, performed_by, payment_method, customer=None, transaction_id=None):
+    """
+    Turns a temporary order into a paid Order inside one transaction.
+    The number of queries does not depend on the number of lines.
+    """
+    with transaction.atomic():
+        # 1. إنشاء الطلب النهائي (Order)
+        # الإجماليات تُحسب مرة واحدة بعد نقل العناصر
+        order = Order.objects.create(
+            branch_id=branch_id,
+            customer=customer,
+            performed_by=performed_by, # من قام بإنشاء الطلب النهائي (الكاشير/الموظف العام)
+            status=OrderStatus.PENDING_PAYMENT, # الحالة الأولية قبل الدفع
+        )
+
+        # 2. نقل عناصر الطلب المؤقت إلى عناصر الطلب النهائي دفعة واحدة
+        # المخزون محجوز منذ المسح، ويُخصم فعلياً عند إتمام الطلب.
+        temp_items = list(temp_order.items.select_related('product'))
+        with muted_item_signals():
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    product=temp_item.product,
+                    quantity=temp_item.quantity,
+                    unit_price=temp_item.product.price_after_discount().quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
+                    vat_percentage=(temp_item.product.vat_rate * 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
+                )
+                for temp_item in temp_items
+            ], batch_size=500)
+            # حذف العناصر المؤقتة بعد نقلها بنجاح
+            temp_order.items.all().delete()
+
+        recalculate_order_totals(order)
+
+        # نقل حجوزات الطلب المؤقت إلى الطلب النهائي (تُخصم فعلياً عند الإتمام)
+        transfer_reservations(
+            reservation_holder(TEMP_ORDER_HOLDER, temp_order.pk),
+            reservation_holder(ORDER_HOLDER, order.pk),
+        )
+
+        # 3. إنشاء الدفعة
+        Payment.objects.create(
+            order=order,
+            amount=order.total_amount, # المبلغ المدفوع هو إجمالي الطلب
+            method=payment_method,
+            received_by=performed_by,
+            transaction_id=transaction_id,
+        )
+
+        # 4. تحديث حالة الطلب إلى PAID بعد الدفع
+        # ملاحظة: دالة save في نموذج Order ستتولى تعيين paid_at
+        order.status = OrderStatus.PAID
+        order.save()
+
+        # 5. حذف الطلب المؤقت بعد تحويله بنجاح
+        with muted_item_signals():
+            temp_order.delete()
+    return order
+
+
 class ConvertTempOrderToOrderAPIView(viewsets.ViewSet):
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated, CustomPermission]
@@ -582,10 +568,9 @@ class ConvertTempOrderToOrderAPIView(viewsets.ViewSet):
     @action(detail=False, methods=['post'], url_path='convert')
     def convert(self, request):
         user = request.user
+        principal = get_principal(request)
         temp_order_id = request.data.get('temp_order_id')
         customer_id = request.data.get('customer_id') # اختياري: لربط الطلب بعميل مسجل
-        non_app_customer_name = request.data.get('non_app_customer_name', None) # اختياري: لعميل غير مسجل
-        non_app_customer_phone = request.data.get('non_app_customer_phone', None) # اختياري: لعميل غير مسجل
         payment_method = request.data.get('payment_method') # CASH, ELECTRONIC, CREDIT_BALANCE
         transaction_id = request.data.get('transaction_id', None) # مطلوب للدفع الإلكتروني
 
@@ -593,83 +578,33 @@ class ConvertTempOrderToOrderAPIView(viewsets.ViewSet):
             return Response({'detail': _('Temporary order ID is required.')}, status=status.HTTP_400_BAD_REQUEST)
         if not payment_method:
             return Response({'detail': _('Payment method is required.')}, status=status.HTTP_400_BAD_REQUEST)
-        if payment_method == Order.PaymentMethod.ELECTRONIC and not transaction_id:
+        if payment_method == PaymentMethod.ELECTRONIC and not transaction_id:
             return Response({'detail': _('Transaction ID is required for electronic payment.')}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
             temp_order = get_object_or_404(TempOrder, id=temp_order_id)
 
             # التحقق من صلاحية المستخدم
-            if not (user.is_superuser or user.is_app_owner() or user.is_project_manager()):
-                if not ((user.is_general_staff_user() or user.is_cashier_user()) and temp_order.cashier == user and temp_order.branch == user.branch):
+            if not principal.is_unrestricted:
+                if not (principal.has_role(UserType.GENERAL_STAFF, UserType.CASHIER) and temp_order.created_by_id == user.pk):
                     return Response({'detail': _('You do not have permission to convert this temporary order.')}, status=status.HTTP_403_FORBIDDEN)
 
             if not temp_order.items.exists():
                 return Response({'detail': _('Temporary order has no items to convert.'), 'total_amount': temp_order.total_amount}, status=status.HTTP_400_BAD_REQUEST)
 
+            # الطلب المؤقت يُنسب إلى فرع من أنشأه، وفيه حُجز المخزون
+            branch_id = Employee.objects.filter(user_account_id=temp_order.created_by_id).values_list('branch_id', flat=True).first()
+            if branch_id is None:
+                return Response({'detail': _('The temporary order is not linked to a branch.')}, status=status.HTTP_400_BAD_REQUEST)
+
             customer_obj = None
             if customer_id:
                 try:
-                    customer_obj = User.objects.get(id=customer_id)
-                    if not customer_obj.is_platform_customer():
-                        return Response({'detail': _('Provided customer ID does not belong to a platform customer.')}, status=status.HTTP_400_BAD_REQUEST)
-                except User.DoesNotExist:
+                    customer_obj = Customer.objects.get(pk=customer_id)
+                except Customer.DoesNotExist:
                     return Response({'detail': _('Customer not found.')}, status=status.HTTP_404_NOT_FOUND)
-            
-            # البدء في المعاملة الذرية لتحويل الطلب المؤقت إلى طلب نهائي ودفع
-            with transaction.atomic():
-                # 1. إنشاء الطلب النهائي (Order)
-                order_data = {
-                    'branch': temp_order.branch,
-                    'total_amount': temp_order.total_amount,
-                    'vat_amount': temp_order.vat_amount,
-                    'total_with_vat': temp_order.total_with_vat,
-                    'discount_amount': temp_order.discount_amount,
-                    'performed_by': user, # من قام بإنشاء الطلب النهائي (الكاشير/الموظف العام)
-                    'status': Order.OrderStatus.PENDING_PAYMENT, # الحالة الأولية قبل الدفع
-                }
-                if customer_obj:
-                    order_data['customer'] = customer_obj
-                if non_app_customer_name:
-                    order_data['non_app_customer_name'] = non_app_customer_name
-                if non_app_customer_phone:
-                    order_data['non_app_customer_phone'] = non_app_customer_phone
-                
-                order = Order.objects.create(**order_data)
-
-                # 2. نقل عناصر الطلب المؤقت إلى عناصر الطلب النهائي
-                for temp_item in temp_order.items.all():
-                    # تأكد من أن المخزون تم خصمه بالفعل عند إنشاء TempOrderItem.
-                    # هنا ننشئ OrderItem فقط.
-                    OrderItem.objects.create(
-                        order=order,
-                        product=temp_item.product,
-                        quantity=temp_item.quantity,
-                        price_at_purchase=temp_item.price_at_scan,
-                        vat_rate_at_purchase=temp_item.vat_rate_at_scan,
-                    )
-                    # حذف العنصر المؤقت بعد نقله بنجاح
-                    temp_item.delete()
-
-                # 3. إنشاء الدفعة
-                payment_data = {
-                    'order': order,
-                    'amount': order.total_with_vat, # المبلغ المدفوع هو إجمالي الطلب
-                    'method': payment_method,
-                    'received_by': user,
-                }
-                if transaction_id:
-                    payment_data['transaction_id'] = transaction_id
-
-                payment = Payment.objects.create(**payment_data)
-
-                # 4. تحديث حالة الطلب إلى PAID بعد الدفع
-                # ملاحظة: دالة save في نموذج Order ستتولى تعيين paid_at
-                order.status = Order.OrderStatus.PAID
-                order.save()
-
-                # 5. حذف الطلب المؤقت بعد تحويله بنجاح
-                temp_order.delete()
+
+            order = convert_temp_order(temp_order, branch_id, user, payment_method, customer=customer_obj, transaction_id=transaction_id)
 
             # إعادة استجابة بالطلب الجديد
             order_serializer = OrderSerializer(order)
@@ -692,59 +627,74 @@ class QRCodeScanView(viewsets.ViewSet):
     def scan_qr_code(self, request):
         serializer = QRCodeScanSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        qr_code_data = serializer.validated_data['qr_code_data']
+        qr_code_data = serializer.validated_data['qr_data']
         temp_order_id = serializer.validated_data.get('temp_order_id')
         user = request.user
+        principal = get_principal(request)
 
-        if not (user.is_general_staff_user() or user.is_cashier_user()):
+        if not principal.has_role(UserType.GENERAL_STAFF, UserType.CASHIER):
             return Response({'detail': _('Only General Staff or Cashiers can scan QR codes for temporary orders.')}, status=status.HTTP_403_FORBIDDEN)
-        
-        if not user.branch:
+
+        # الطلب المؤقت لا يحمل فرعاً: المخزون يُحجز في فرع الموظف الذي يمسح
+        branch_id = principal.branch_id
+        if branch_id is None:
             return Response({'detail': _('User must be assigned to a branch to scan QR codes.')}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            product = Product.objects.get(qr_code=qr_code_data)
-        except Product.DoesNotExist:
+        # البحث عبر الكاش (LRU محلي + كاش مشترك) بدون استعلام على الكتالوج في المسح المتكرر.
+        # رمز QR للمنتج يحمل الباركود الخاص به.
+        product = lookup_scan_record(qr_code_data)
+        if product is None:
             return Response({'detail': _('Product with this QR code not found.')}, status=status.HTTP_404_NOT_FOUND)
 
         with transaction.atomic():
             temp_order = None
             if temp_order_id:
                 try:
-                    temp_order = TempOrder.objects.get(id=temp_order_id, cashier=user, branch=user.branch)
+                    temp_order = TempOrder.objects.get(id=temp_order_id, created_by=user)
                 except TempOrder.DoesNotExist:
                     return Response({'detail': _('Temporary order not found or you do not have access to it.')}, status=status.HTTP_404_NOT_FOUND)
             else:
                 # إذا لم يتم توفير temp_order_id، أنشئ طلبًا مؤقتًا جديدًا
-                temp_order = TempOrder.objects.create(cashier=user, branch=user.branch)
-            
-            # تحقق من المخزون
-            product_inventory = BranchProductInventory.objects.filter(product=product, branch=temp_order.branch).first()
-            if not product_inventory or product_inventory.quantity < 1: # التحقق من توفر 1 قطعة على الأقل
-                return Response({'detail': _(f'Not enough stock available for product {product.name} in branch {temp_order.branch.name}. Available: {product_inventory.quantity if product_inventory else 0}')}, status=status.HTTP_400_BAD_REQUEST)
+                temp_order = TempOrder.objects.create(created_by=user)
+
+            # حجز قطعة واحدة (يفشل إذا لم يتبقَ مخزون متاح)
+            try:
+                reserve_stock(branch_id, product['id'], reservation_holder(TEMP_ORDER_HOLDER, temp_order.pk), delta=1)
+            except DjangoValidationError as exc:
+                transaction.set_rollback(True)
+                return Response({'detail': exc.messages}, status=status.HTTP_400_BAD_REQUEST)
 
             # إضافة أو تحديث TempOrderItem
             temp_order_item, created = TempOrderItem.objects.get_or_create(
                 temp_order=temp_order,
-                product=product,
-                defaults={
-                    'quantity': 1,
-                    'scanned_quantity': 1,
-                    'price_at_scan': product.current_price,
-                    'vat_rate_at_scan': product.vat_rate,
-                }
+                product_id=product['id'],
+                defaults={'quantity': 1},
             )
             if not created:
                 temp_order_item.quantity = F('quantity') + 1
-                temp_order_item.scanned_quantity = F('scanned_quantity') + 1
-                temp_order_item.save(update_fields=['quantity', 'scanned_quantity'])
+                temp_order_item.save(update_fields=['quantity'])
                 temp_order_item.refresh_from_db() # لتحديث الكائن بالقيم الجديدة
 
-            # إنقاص المخزون
-            product_inventory.quantity = F('quantity') - 1
-            product_inventory.save(update_fields=['quantity'])
+            if serializer.validated_data.get('delta'):
+                # وضع الـ delta: السطر الذي تغيّر فقط مع الإجماليات الجديدة بدلاً من كامل الطلب المؤقت
+                temp_order.refresh_from_db(fields=['total_amount'])
+                return Response({
+                    'temp_order_id': temp_order.pk,
+                    'item': {
+                        'id': temp_order_item.pk,
+                        'product_id': product['id'],
+                        'product_name': product['name'],
+                        'product_barcode': product['barcode'],
+                        'quantity': temp_order_item.quantity,
+                        'unit_price': product['price_after_discount'],
+                        'vat_rate': product['vat_rate'],
+                        'created': created,
+                    },
+                    'total_amount': temp_order.total_amount,
+                    'basket_etag': quote_etag(basket_etag(temp_order)),
+                }, status=status.HTTP_200_OK)
 
             # إعادة بيانات الطلب المؤقت وعناصره
-            temp_order_serializer = TempOrderSerializer(temp_order)
+            temp_order_serializer = TempOrderSerializer(_prefetch_basket(temp_order))
             return Response(temp_order_serializer.data, status=status.HTTP_200_OK)
 
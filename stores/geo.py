@@ -0,0 +1,214 @@
+# stores/geo.py
+"""
+Nearest-branch lookup for the in-store scan geofence (ScanBarcodeAPIView).
+
+Branch coordinates are kept per process in a grid of fixed-size cells (one cell is
+about the scan radius), so a lookup only reads the few cells around the customer
+instead of every branch. Candidates are ranked by haversine distance and the match
+is confirmed with geopy's geodesic distance, the measure the view has always used.
+Branch saves/deletes bump a shared version and every process rebuilds its grid on
+its next lookup (same scheme as products.scan_cache).
+"""
+import math
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from geopy.distance import geodesic
+
+from .models import Branch
+
+VERSION_KEY = 'stores:branch_locations:version'
+EARTH_RADIUS_KM = 6371.0088
+# أقصر طول لدرجة العرض على الإهليلجي (WGS-84)، حتى لا يستبعد الصندوق المحيط أي فرع داخل النطاق
+KM_PER_DEGREE = 110.5
+# haversine (sphere) and geodesic (ellipsoid) distances differ by less than 0.5%
+DISTANCE_MARGIN = 1.01
+MIN_CELL_DEGREES = 1e-6
+
+BranchLocation = namedtuple('BranchLocation', 'branch_id name latitude longitude')
+
+
+def scan_radius_km():
+    return float(getattr(settings, 'MAX_BARCODE_SCAN_DISTANCE_KM', 0.01))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    (min lat, max lat, min lon, max lon) containing every point within radius_km.
+    """
+    d_lat = radius_km * DISTANCE_MARGIN / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(min(abs(latitude) + d_lat, 90.0)))
+    d_lon = 180.0 if cos_lat < 1e-9 else min(180.0, d_lat / cos_lat)
+    return latitude - d_lat, latitude + d_lat, longitude - d_lon, longitude + d_lon
+
+
+def branches_in_bounding_box(latitude, longitude, radius_km, queryset=None):
+    """
+    SQL prefilter: branches whose coordinates fall inside the bounding box (branch_lat_lon_idx).
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+    queryset = Branch.objects.all() if queryset is None else queryset
+    return queryset.filter(latitude__range=(min_lat, max_lat), longitude__range=(min_lon, max_lon))
+
+
+def _locations(queryset):
+    rows = queryset.filter(latitude__isnull=False, longitude__isnull=False).order_by().values_list(
+        'branch_id', 'name', 'latitude', 'longitude'
+    )
+    return [
+        BranchLocation(branch_id, name, float(latitude), float(longitude))
+        for branch_id, name, latitude, longitude in rows.iterator(chunk_size=5000)
+    ]
+
+
+def closest_within(candidates, latitude, longitude, radius_km):
+    """
+    Nearest candidate whose geodesic distance is at most radius_km, or None.
+    """
+    ranked = sorted(
+        ((haversine_km(latitude, longitude, c.latitude, c.longitude), c) for c in candidates),
+        key=lambda pair: pair[0],
+    )
+    for distance, candidate in ranked:
+        if distance > radius_km * DISTANCE_MARGIN:
+            break
+        try:
+            if geodesic((latitude, longitude), (candidate.latitude, candidate.longitude)).km <= radius_km:
+                return candidate
+        except ValueError:
+            # إحداثيات خارج النطاق (مثلاً خط عرض > 90)
+            return None
+    return None
+
+
+class BranchGrid:
+    """
+    Branch locations bucketed by (floor(lat / cell), floor(lon / cell)).
+    """
+
+    def __init__(self, locations, cell_degrees):
+        self.cell_degrees = max(cell_degrees, MIN_CELL_DEGREES)
+        self.size = len(locations)
+        self.cells = {}
+        for location in locations:
+            self.cells.setdefault(self._cell(location.latitude, location.longitude), []).append(location)
+
+    @classmethod
+    def for_radius(cls, locations, radius_km):
+        return cls(locations, radius_km * DISTANCE_MARGIN / KM_PER_DEGREE)
+
+    def _cell(self, latitude, longitude):
+        return math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees)
+
+    def candidates(self, latitude, longitude, radius_km):
+        """Locations inside the bounding box of the circle."""
+        min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+        row_from, col_from = self._cell(min_lat, min_lon)
+        row_to, col_to = self._cell(max_lat, max_lon)
+        if (row_to - row_from + 1) * (col_to - col_from + 1) > len(self.cells):
+            # الصندوق يغطي خلايا أكثر من الموجودة فعلاً (نصف قطر كبير أو قرب القطبين)
+            cells = (
+                cell for (row, col), cell in self.cells.items()
+                if row_from <= row <= row_to and col_from <= col <= col_to
+            )
+        else:
+            cells = (
+                self.cells.get((row, col), ())
+                for row in range(row_from, row_to + 1)
+                for col in range(col_from, col_to + 1)
+            )
+        for cell in cells:
+            for location in cell:
+                if min_lat <= location.latitude <= max_lat and min_lon <= location.longitude <= max_lon:
+                    yield location
+
+    def nearest(self, latitude, longitude, radius_km):
+        return closest_within(self.candidates(latitude, longitude, radius_km), latitude, longitude, radius_km)
+
+
+def _fresh_version():
+    return int(time.time() * 1000)
+
+
+class BranchLocator:
+    """
+    Process-local BranchGrid, rebuilt when the shared version changes.
+    """
+
+    def __init__(self):
+        self._grid = None
+        self._version = None
+        self._radius_km = None
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+
+    def _current_version(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, _fresh_version(), timeout=None)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    def grid(self, radius_km):
+        version = self._current_version()
+        with self._lock:
+            if self._grid is None or version != self._version or radius_km != self._radius_km:
+                self._grid = BranchGrid.for_radius(_locations(Branch.objects.all()), radius_km)
+                self._version = version
+                self._radius_km = radius_km
+                self.rebuilds += 1
+            return self._grid
+
+    def clear(self):
+        with self._lock:
+            self._grid = None
+            self._version = None
+
+
+branch_locator = BranchLocator()
+
+
+def nearest_branch(latitude, longitude, radius_km=None):
+    """
+    Nearest branch within radius_km (default MAX_BARCODE_SCAN_DISTANCE_KM) as a BranchLocation, or None.
+    With BRANCH_GEOFENCE_IN_MEMORY = False the lookup queries the bounding box instead of the grid.
+    """
+    radius_km = scan_radius_km() if radius_km is None else radius_km
+    if not (math.isfinite(latitude) and math.isfinite(longitude)):
+        return None
+    if getattr(settings, 'BRANCH_GEOFENCE_IN_MEMORY', True):
+        return branch_locator.grid(radius_km).nearest(latitude, longitude, radius_km)
+    candidates = _locations(branches_in_bounding_box(latitude, longitude, radius_km))
+    return closest_within(candidates, latitude, longitude, radius_km)
+
+
+def has_located_branches():
+    """True if at least one branch has GPS coordinates."""
+    if getattr(settings, 'BRANCH_GEOFENCE_IN_MEMORY', True):
+        return branch_locator.grid(scan_radius_km()).size > 0
+    return Branch.objects.filter(latitude__isnull=False, longitude__isnull=False).exists()
+
+
+def invalidate_branch_locations():
+    """
+    Bumps the shared version once the current transaction commits; every process
+    rebuilds its grid on its next lookup.
+    """
+    def bump():
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, _fresh_version(), timeout=None)
+        branch_locator.clear()
+
+    transaction.on_commit(bump)
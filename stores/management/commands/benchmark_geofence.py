@@ -0,0 +1,93 @@
+# stores/management/commands/benchmark_geofence.py
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from geopy.distance import geodesic
+
+from stores.geo import BranchGrid, BranchLocation, scan_radius_km
+
+
+def _random_branches(count, rng):
+    # نطاق تقريبي للمملكة
+    return [
+        BranchLocation(index, f"Branch {index}", rng.uniform(16.0, 32.0), rng.uniform(34.5, 55.5))
+        for index in range(count)
+    ]
+
+
+def _random_points(branches, count, radius_km, rng):
+    """Half the points next to a branch (inside or just outside the radius), half anywhere."""
+    points = []
+    offset = radius_km * 1.5 / 111.0
+    for _ in range(count):
+        if rng.random() < 0.5:
+            branch = rng.choice(branches)
+            points.append((
+                branch.latitude + rng.uniform(-offset, offset),
+                branch.longitude + rng.uniform(-offset, offset),
+            ))
+        else:
+            points.append((rng.uniform(16.0, 32.0), rng.uniform(34.5, 55.5)))
+    return points
+
+
+def _linear_scan(branches, point, radius_km):
+    """The previous ScanBarcodeAPIView loop: geodesic against every branch."""
+    for branch in branches:
+        if geodesic(point, (branch.latitude, branch.longitude)).km <= radius_km:
+            return branch
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the geofence grid (stores.geo) with a linear geodesic scan over random "
+        "branches and reports the time per lookup. Runs in memory, no database needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branches', type=int, default=10_000, help="Number of random branches.")
+        parser.add_argument('--lookups', type=int, default=200, help="Number of random customer positions.")
+        parser.add_argument('--radius-km', type=float, default=None, help="Scan radius (default MAX_BARCODE_SCAN_DISTANCE_KM).")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for reproducible runs.")
+
+    def handle(self, *args, **options):
+        if options['branches'] < 1 or options['lookups'] < 1:
+            raise CommandError("--branches and --lookups must be positive integers.")
+        radius_km = options['radius_km'] if options['radius_km'] is not None else scan_radius_km()
+        rng = random.Random(options['seed'])
+        branches = _random_branches(options['branches'], rng)
+        points = _random_points(branches, options['lookups'], radius_km, rng)
+
+        started = time.perf_counter()
+        grid = BranchGrid.for_radius(branches, radius_km)
+        build_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        found = [grid.nearest(lat, lon, radius_km) for lat, lon in points]
+        grid_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        expected = [_linear_scan(branches, point, radius_km) for point in points]
+        linear_seconds = time.perf_counter() - started
+
+        mismatches = 0
+        for point, branch, reference in zip(points, found, expected):
+            # الفحص الخطي يعيد أول فرع داخل النطاق، والشبكة أقربها: يكفي أن يتفقا على وجود فرع
+            if (branch is None) != (reference is None):
+                mismatches += 1
+                if mismatches <= 10:
+                    self.stderr.write(f"Mismatch at {point}: grid {branch} != linear {reference}")
+
+        lookups = len(points)
+        self.stdout.write(
+            f"{len(branches)} branches, {lookups} lookups, radius {radius_km * 1000:g} m, "
+            f"{sum(branch is not None for branch in found)} inside a scanning zone"
+        )
+        self.stdout.write(f"grid build:        {build_seconds * 1000:.1f} ms ({len(grid.cells)} cells)")
+        self.stdout.write(f"grid lookup:       {grid_seconds / lookups * 1e6:.1f} µs per lookup")
+        self.stdout.write(f"linear geodesic:   {linear_seconds / lookups * 1e6:.1f} µs per lookup")
+        if mismatches:
+            raise CommandError(f"{mismatches} lookups differ from the linear scan.")
+        self.stdout.write(self.style.SUCCESS("Grid results agree with the linear geodesic scan."))
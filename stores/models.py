@@ -2,12 +2,15 @@
 
 import uuid
 from django.db import models
+from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from decimal import Decimal
 from uuid import uuid4
 
+from mysite.scoping import PrincipalQuerySet
+from users.constants import UserType
 from users.models import UserAccount
 from .signals import *  # Connect post_save signals
 
@@ -73,6 +76,29 @@ class BranchPermissionProfile(models.Model):
     def __str__(self):
         return self.name
 
+
+class StoreQuerySet(PrincipalQuerySet):
+    unscoped_roles = frozenset()
+    scoped_roles = frozenset({UserType.STORE_MANAGER})
+
+    def scope_filter(self, principal):
+        return Q(pk__in=principal.store_ids)
+
+
+class BranchQuerySet(PrincipalQuerySet):
+    unscoped_roles = frozenset()
+    scoped_roles = frozenset({
+        UserType.STORE_MANAGER, UserType.BRANCH_MANAGER, UserType.GENERAL_STAFF,
+        UserType.CASHIER, UserType.SHELF_ORGANIZER,
+    })
+
+    def scope_filter(self, principal):
+        # مدير المتجر يرى فروع متجره، وباقي الموظفين فرعهم
+        if principal.role == UserType.STORE_MANAGER:
+            return Q(store_id__in=principal.store_ids)
+        return Q(pk__in=principal.branch_ids)
+
+
 # --- Store ---
 class Store(models.Model):
     name = models.CharField(_("Store Name"), max_length=255, unique=True)
@@ -93,6 +119,8 @@ class Store(models.Model):
     total_yearly_operations = models.DecimalField(_("Total Yearly Operations ($)"), max_digits=15, decimal_places=2, default=Decimal('0.00'), validators=[MinValueValidator(Decimal('0.00'))])
     last_yearly_update = models.DateField(_("Last Yearly Update"), null=True, blank=True)
 
+    objects = StoreQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Store")
         verbose_name_plural = _("Stores")
@@ -140,11 +168,17 @@ class Branch(models.Model):
     created_at = models.DateTimeField(_("Created At"), auto_now_add=True)
     updated_at = models.DateTimeField(_("Updated At"), auto_now=True)
 
+    objects = BranchQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Branch")
         verbose_name_plural = _("Branches")
         unique_together = ('store', 'name')
         ordering = ['store__name', 'name']
+        indexes = [
+            # stores.geo.branches_in_bounding_box
+            models.Index(fields=['latitude', 'longitude'], name='branch_lat_lon_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.branch_id_number})"
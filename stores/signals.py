@@ -1,4 +1,4 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.db import transaction
 from django.core.exceptions import ValidationError
@@ -6,6 +6,8 @@ from django.utils.translation import gettext_lazy as _
 from users.models import UserAccount, Role
 from .models import Store, Branch
 from .utils import generate_store_username, generate_secure_password
+from .geo import invalidate_branch_locations
+from authentication.principal import invalidate_all_principals
 
 @receiver(post_save, sender=Store)
 def create_store_primary_user(sender, instance, created, **kwargs):
@@ -63,3 +65,41 @@ def link_branch_manager_to_branch(sender, instance, created, **kwargs):
         if instance.manager_employee.store != instance.store:
             instance.manager_employee.store = instance.store
             instance.manager_employee.save(update_fields=['store'])
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def invalidate_branch_locations_on_change(sender, instance, **kwargs):
+    """
+    Branch added, moved or removed: the geofence grid (stores.geo) is rebuilt on the next scan.
+    """
+    if kwargs.get('raw'):
+        return
+    invalidate_branch_locations()
+
+
+@receiver(post_save, sender=Store)
+def invalidate_principals_on_store_change(sender, instance, created, update_fields=None, **kwargs):
+    """
+    The primary account of a store (Store.user) is part of its users' scope.
+    """
+    if kwargs.get('raw'):
+        return
+    if created or update_fields is None or 'user' in update_fields:
+        invalidate_all_principals()
+
+
+@receiver(post_save, sender=Branch)
+def invalidate_principals_on_branch_change(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Store-level users act on every branch of their store: a new or moved branch changes their scope.
+    """
+    if kwargs.get('raw'):
+        return
+    if created or update_fields is None or 'store' in update_fields:
+        invalidate_all_principals()
+
+
+@receiver(post_delete, sender=Store)
+@receiver(post_delete, sender=Branch)
+def invalidate_principals_on_scope_delete(sender, instance, **kwargs):
+    invalidate_all_principals()
@@ -26,6 +26,7 @@ from .serializers import (
 
 # Import CustomPermission from its new shared file
 from mysite.permissions import CustomPermission
+from authentication.principal import get_principal
 
 
 # --- API ViewSets for Store Permission Profiles ---
@@ -118,16 +119,8 @@ class StoreViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated, CustomPermission]
 
     def get_queryset(self):
-        user = self.request.user
-        # Application owner/Superuser sees all stores
-        if user.is_superuser or user.is_app_owner():
-            return Store.objects.all()
-        # Store manager sees only their store
-        # Ensure user.store exists before attempting to access id
-        if user.is_store_manager_user() and hasattr(user, 'store') and user.store:
-            return Store.objects.filter(id=user.store.id)
-        # Other roles do not see stores here by default
-        return Store.objects.none()
+        # Store managers see their store (mysite.scoping)
+        return Store.objects.for_principal(get_principal(self.request))
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -169,22 +162,8 @@ class BranchViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated, CustomPermission]
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_superuser or user.is_app_owner():
-            return Branch.objects.all()
-        # Store manager sees only branches of their store
-        if user.is_store_manager_user() and hasattr(user, 'store') and user.store:
-            return Branch.objects.filter(store=user.store)
-        # Branch manager sees only their branch
-        # NOTE: The 'user.department' attribute is assumed to exist and link to a branch
-        if user.is_branch_manager_user() and hasattr(user, 'department') and user.department and user.department.branch:
-            return Branch.objects.filter(id=user.department.branch.id)
-        # Cashiers and other staff see only their branch
-        # NOTE: The 'user.department' attribute is assumed to exist and link to a branch
-        if user.user_type in ['cashier', 'shelf_organizer', 'staff'] and hasattr(user, 'department') and user.department and user.department.branch:
-            return Branch.objects.filter(id=user.department.branch.id)
-        
-        return Branch.objects.none()
+        # Store managers see their store's branches, branch staff their own branch (mysite.scoping)
+        return Branch.objects.for_principal(get_principal(self.request))
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -1,13 +1,15 @@
 import uuid
+from django.apps import apps
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.utils.translation import gettext_lazy as _
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from decimal import Decimal
 
+from mysite.scoping import PrincipalQuerySet
 from .constants import UserType
 from .utils import generate_temporary_password
 from .firebase_services import create_firebase_user, update_firebase_user, get_existing_firebase_user_uid
@@ -177,6 +179,16 @@ class UserAccount(AbstractBaseUser, PermissionsMixin):
     def is_platform_customer(self): return self.role and self.role.role_name == UserType.PLATFORM_CUSTOMER.value
 
 
+class CustomerQuerySet(PrincipalQuerySet):
+    def scope_filter(self, principal):
+        # العملاء الذين لهم طلبات في الفروع: EXISTS بدل JOIN + DISTINCT، ويغطيه فهرس (customer, branch) على الطلبات
+        order_model = apps.get_model('sales', 'Order')
+        return Exists(order_model.objects.filter(customer_id=OuterRef('pk'), branch_id__in=principal.branch_ids))
+
+    def customer_filter(self, principal):
+        return Q(pk=principal.customer_id)
+
+
 class Customer(models.Model):
     customer_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user_account = models.OneToOneField(
@@ -203,6 +215,8 @@ class Customer(models.Model):
         verbose_name=_('Preferred Store')
     )
 
+    objects = CustomerQuerySet.as_manager()
+
     class Meta:
         verbose_name = _('Customer Profile')
         verbose_name_plural = _('Customer Profiles')
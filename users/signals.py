@@ -2,9 +2,10 @@
 
 import firebase_admin
 from firebase_admin import auth, exceptions as firebase_exceptions
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from .models import UserAccount  # تأكد من استيراد نموذج المستخدم الصحيح
+from .models import UserAccount, Employee, Role  # تأكد من استيراد نموذج المستخدم الصحيح
+from authentication.principal import invalidate_all_principals, invalidate_principal
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,4 +25,34 @@ def delete_firebase_user(sender, instance, **kwargs):
         except Exception as e:
             logger.error(f"Unexpected error while deleting Firebase user {instance.firebase_uid}: {e}", exc_info=True)
     else:
-        logger.warning(f"UserAccount {instance.username if hasattr(instance, 'username') else instance.pk} (ID: {instance.id}) has no firebase_uid. Skipping Firebase deletion.")
\ No newline at end of file
+        logger.warning(f"UserAccount {instance.username if hasattr(instance, 'username') else instance.pk} (ID: {instance.id}) has no firebase_uid. Skipping Firebase deletion.")
+
+
+@receiver(post_save, sender=UserAccount)
+@receiver(post_delete, sender=UserAccount)
+def invalidate_user_principal(sender, instance, **kwargs):
+    """
+    تغيير الحساب (الدور، التفعيل...) يلغي النسخة المخزنة من صلاحياته (authentication.principal).
+    """
+    if kwargs.get('raw'):
+        return
+    invalidate_principal(instance.pk)
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+def invalidate_employee_principal(sender, instance, **kwargs):
+    """
+    نقل الموظف إلى متجر/فرع/قسم آخر يغير نطاق صلاحياته.
+    """
+    if kwargs.get('raw'):
+        return
+    invalidate_principal(instance.user_account_id)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def invalidate_role_principals(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    invalidate_all_principals()
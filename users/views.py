@@ -151,7 +151,8 @@ class UserManagementViewSet(viewsets.ModelViewSet):
     Accessible by App Owners, Project Managers, Store Accounts, and Store Managers
     based on the specific action and user's role.
     """
-    queryset = UserAccount.objects.all().order_by('email') # Use UserAccount
+    # role و employee_profile يقرؤهما CustomPermission.has_object_permission لكل حساب
+    queryset = UserAccount.objects.select_related('role', 'employee_profile').order_by('email')
     serializer_class = UserAccountSerializer # Use UserAccountSerializer
     
     def get_permissions(self):